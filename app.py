@@ -1,11 +1,18 @@
 import streamlit as st
-import imaplib
-import email
-from email.header import decode_header
-import re
 import pandas as pd
 from datetime import datetime
 import time
+import os
+import json
+import hmac
+from mail_core import (
+    FETCH_BATCH_SIZE, INDEX_PATH, MAX_FETCH_BATCH_SIZE, MAX_POOL_SIZE, SCAN_ENGINES, SCAN_POOL_SIZE,
+    SORT_OPTIONS, STAT_COLUMNS, SessionConnection, account_summary, account_targets, clear_index, decode_folder_name,
+    delete_job_for, delete_remaining, drop_senders, fetch_savings, filter_results, get_imap_server, get_smtp_server,
+    index_available, list_scan_folders, load_index, new_scan_state, results_frame, sort_results, state_rows
+)
+from jobs import JobManager, submit_delete, submit_scan, submit_unsubscribe
+from unsubscribe import RESULT_COLUMNS, unsubscribe_summary
 
 # ==========================================
 # 页面配置
@@ -188,174 +195,168 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ==========================================
-# 核心功能函数 (保持不变)
+# 后台任务 (扫描 / 删除 / 退订不阻塞页面, 可以取消)
 # ==========================================
 
-def decode_field(header_value):
-    if not header_value:
-        return "Unknown"
-    try:
-        decoded_list = decode_header(header_value)
-        text, encoding = decoded_list[0]
-        if isinstance(text, bytes):
-            return text.decode(encoding if encoding else 'utf-8', errors='ignore')
-        return str(text)
-    except:
-        return str(header_value)
-
-def parse_unsubscribe(header_text):
-    http_link = None
-    mailto = None
-    
-    http_match = re.search(r'<(https?://[^>]+)>', header_text)
-    if not http_match:
-        http_match = re.search(r'(https?://\S+)', header_text)
-    if http_match:
-        http_link = http_match.group(1)
-    
-    mailto_match = re.search(r'<mailto:([^>]+)>', header_text)
-    if mailto_match:
-        mailto = mailto_match.group(1)
-    
-    return http_link, mailto
-
-def extract_email_address(from_header):
-    match = re.search(r'<([^>]+)>', from_header)
-    if match:
-        return match.group(1)
-    return from_header.strip()
-
-def get_imap_server(email_address):
-    if not email_address or "@" not in email_address:
-        return ""
-    
-    domain = email_address.split("@")[1].lower()
-    
-    imap_servers = {
-        "gmail.com": "imap.gmail.com",
-        "googlemail.com": "imap.gmail.com",
-        "outlook.com": "outlook.office365.com",
-        "hotmail.com": "outlook.office365.com",
-        "live.com": "outlook.office365.com",
-        "qq.com": "imap.qq.com",
-        "163.com": "imap.163.com",
-        "126.com": "imap.126.com",
-        "yahoo.com": "imap.mail.yahoo.com",
-        "icloud.com": "imap.mail.me.com",
-    }
+JOB_POLL_INTERVAL = 1.0
+
+@st.cache_resource
+def job_manager():
+    # 进程级单例: 任务不随页面重跑丢失, 刷新后按地址栏中的任务 id 找回
+    return JobManager()
+
+def scan_status(job):
+    if job["progress"] is None:
+        st.caption("Connecting to your mailbox...")
+        return
+    done, total = job["progress"]
+    st.progress(done / total if total else 1.0)
+    st.caption(f"{job.get('label', 'Scanning')}: {done} / {total}")
+    if job["folder_progress"]:
+        # 多账户时按账户显示进度, 账户地址不做文件夹名解码
+        label = (lambda name: name) if job["creds"].get('accounts') else decode_folder_name
+        st.caption(" | ".join(f"{label(name)}: {folder_done} / {folder_total}"
+                              for name, (folder_done, folder_total) in job["folder_progress"].items()))
+    if job["rows"]:
+        live = pd.DataFrame(job["rows"]).drop(columns=["Select"])
+        st.dataframe(live, hide_index=True, use_container_width=True, height=300, column_config={"Mailto": None})
+
+def delete_status(job):
+    progress = job["progress"]
+    if progress is None:
+        st.caption(f"Deleting emails from {len(job['delete_job']['targets'])} senders...")
+    elif progress["total"] is None:
+        st.progress(progress["searched"] / progress["groups"])
+        st.caption(f"Searching: {progress['searched']} / {progress['groups']} sender groups")
+    else:
+        total = progress["total"]
+        rate = (progress["done"] - job["done_before"]) / max(time.time() - job["started"], 1e-6)
+        st.progress(progress["done"] / total if total else 1.0)
+        st.caption(
+            f"Deleting: {progress['done']} / {total} emails | {rate:.0f} emails/s | "
+            f"{total - progress['done']} remaining"
+        )
+    if job["retry"]:
+        st.caption(job["retry"])
+
+def diagnostics_caption(job):
+    diagnostics = job["diagnostics"]
+    if diagnostics is None:
+        return
+    report = diagnostics.report()
+    text = (f"{report['round_trips']} round trips | {report['imap_commands']} IMAP commands | "
+            f"{report['bytes_received'] / 2 ** 20:.1f} MB received")
+    if report["headers_parsed"]:
+        text += f" | {report['headers_per_second']:,.0f} headers/s"
+    st.caption(text)
+
+def unsubscribe_status(job):
+    done, total = job["progress"] or (0, len(job["targets"]))
+    st.progress(done / total if total else 1.0)
+    st.caption(f"Unsubscribing: {done} / {total} senders")
+    if job["unsubscribed"]:
+        live = pd.DataFrame(list(job["unsubscribed"]), columns=RESULT_COLUMNS).drop(columns=["Unsubscribe"])
+        st.dataframe(live, hide_index=True, use_container_width=True, height=300)
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def job_panel(job_id):
+    # 只有这一块定时重跑; 任务结束后整页重跑, 由 finish_job 接收结果
+    job = job_manager().get(job_id)
+    if job is None or job["status"] != "running":
+        st.rerun()
     
-    for key, server in imap_servers.items():
-        if key in domain:
-            return server
+    started = time.perf_counter()
+    if job["kind"] == "scan":
+        scan_status(job)
+    elif job["kind"] == "unsubscribe":
+        unsubscribe_status(job)
+    else:
+        delete_status(job)
+    diagnostics_caption(job)
+    if job["diagnostics"] is not None:
+        # 进度刷新本身的开销, 在诊断中记为 render 阶段
+        job["diagnostics"].add_phase("render", time.perf_counter() - started)
     
-    return f"imap.{domain}"
+    col1, col2, col3 = st.columns([1, 1, 1])
+    with col2:
+        st.markdown('<div class="btn-secondary">', unsafe_allow_html=True)
+        if st.button("Cancel", disabled=job["cancel"].is_set(), use_container_width=True):
+            job_manager().cancel(job_id)
+        if job["cancel"].is_set():
+            st.caption("Stopping after the current batch...")
+        st.markdown('</div>', unsafe_allow_html=True)
 
-def scan_inbox(user, password, server, limit):
-    try:
-        mail = imaplib.IMAP4_SSL(server, timeout=30)
-        mail.login(user, password)
-        mail.select("inbox")
-        
-        status, messages = mail.search(None, 'ALL')
-        if status != 'OK':
-            return "Failed to search emails"
-        
-        email_ids = messages[0].split()
-        email_ids = email_ids[-limit:]
-        
-        data_list = []
-        seen_senders = set()
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        for i, e_id in enumerate(reversed(email_ids)):
-            progress = (i + 1) / len(email_ids)
-            progress_bar.progress(progress)
-            status_text.caption(f"Scanning: {i + 1} / {len(email_ids)}")
-            
-            try:
-                _, msg_data = mail.fetch(e_id, '(BODY.PEEK[HEADER.FIELDS (FROM LIST-UNSUBSCRIBE DATE)])')
-                
-                if not msg_data or not msg_data[0]:
-                    continue
-                
-                msg = email.message_from_bytes(msg_data[0][1])
-                unsub = msg.get("List-Unsubscribe")
-                
-                if unsub:
-                    from_header = decode_field(msg.get("From"))
-                    sender_name = from_header.split("<")[0].strip().replace('"', '')
-                    sender_email = extract_email_address(from_header)
-                    
-                    if sender_email not in seen_senders:
-                        link, mailto = parse_unsubscribe(unsub)
-                        
-                        if link or mailto:
-                            seen_senders.add(sender_email)
-                            
-                            date_header = msg.get("Date")
-                            date_str = "Unknown"
-                            if date_header:
-                                try:
-                                    date_str = decode_field(date_header)[:16]
-                                except:
-                                    pass
-                            
-                            data_list.append({
-                                "Select": False,
-                                "Sender": sender_name if sender_name else sender_email,
-                                "Email": sender_email,
-                                "Last Received": date_str,
-                                "Unsubscribe": link if link else f"mailto:{mailto}"
-                            })
-            
-            except:
-                continue
-        
-        mail.logout()
-        progress_bar.empty()
-        status_text.empty()
-        
-        return data_list
-    
-    except Exception as e:
-        return f"Error: {str(e)}"
+# ==========================================
+# 诊断信息 (各阶段耗时, IMAP 命令 / 往返次数, 收到的字节数, 解析失败原因)
+# ==========================================
+
+DIAGNOSTICS_HISTORY = 10
 
-def delete_emails(user, password, server, targets):
-    try:
-        mail = imaplib.IMAP4_SSL(server, timeout=30)
-        mail.login(user, password)
-        mail.select("inbox")
+def report_label(report):
+    started = datetime.fromisoformat(report["started"]).astimezone().strftime("%H:%M:%S")
+    return f"{report['operation'].title()} ({report['engine']}) at {started}, {report['wall_seconds']:.1f}s"
+
+def diagnostics_panel():
+    reports = st.session_state.diagnostics
+    with st.expander("Diagnostics", expanded=False):
+        index = st.selectbox(
+            "Operation",
+            range(len(reports) - 1, -1, -1),
+            format_func=lambda i: report_label(reports[i])
+        )
+        report = reports[index]
+        if report.get("error"):
+            st.error(report["error"])
         
-        deleted_count = 0
-        total_deleted = 0
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        cols = st.columns(4)
+        cols[0].metric("Total Time", f"{report['wall_seconds']:.2f}s")
+        cols[1].metric("Round Trips", report["round_trips"], help=f"{report['imap_commands']} IMAP commands")
+        compressed = report.get("compressed_connections", 0)
+        cols[2].metric(
+            "Received", f"{report['bytes_received'] / 2 ** 20:.2f} MB",
+            help=f"Bytes on the wire; COMPRESS=DEFLATE on {compressed} of {report.get('connections', 0)} connections"
+        )
+        cols[3].metric("Headers/s", f"{report['headers_per_second']:,.0f}")
         
-        for i, sender_email in enumerate(targets):
-            progress = (i + 1) / len(targets)
-            progress_bar.progress(progress)
-            status_text.caption(f"Deleting from: {sender_email}")
-            
-            status, messages = mail.search(None, f'(FROM "{sender_email}")')
-            
-            if status == 'OK' and messages[0]:
-                email_list = messages[0].split()
-                for num in email_list:
-                    mail.store(num, '+FLAGS', '\\Deleted')
-                    total_deleted += 1
-                deleted_count += 1
+        wall = report["wall_seconds"] or 1
+        phases = pd.DataFrame(
+            [(name, seconds, seconds / wall) for name, seconds in report["phases"].items()],
+            columns=["Phase", "Seconds", "Share"]
+        )
+        st.dataframe(
+            phases,
+            column_config={"Share": st.column_config.ProgressColumn("Share of Total", format="percent")},
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption("With several connections or pipelined commands, phases overlap and can add up to more "
+                   "than the total time")
         
-        mail.expunge()
-        mail.logout()
+        commands = pd.DataFrame.from_dict(report["commands"], orient="index")
+        if not commands.empty:
+            commands["Avg (ms)"] = commands["seconds"] / commands["count"] * 1000
+            commands = commands.rename(columns={"count": "Count", "seconds": "Seconds", "bytes": "Bytes"})
+            st.dataframe(
+                commands.rename_axis("Command").reset_index(),
+                column_config={"Avg (ms)": st.column_config.NumberColumn(format="%.1f")},
+                hide_index=True,
+                use_container_width=True
+            )
         
-        progress_bar.empty()
-        status_text.empty()
+        st.caption(
+            f"{report['headers_parsed']} headers parsed, {report['headers_without_unsubscribe']} without "
+            f"List-Unsubscribe"
+        )
+        if report["parse_failures"]:
+            failures = pd.DataFrame(list(report["parse_failures"].items()), columns=["Reason", "Count"])
+            st.dataframe(failures, hide_index=True, use_container_width=True)
         
-        return True, f"Deleted {total_deleted} emails from {deleted_count} senders"
-    
-    except Exception as e:
-        return False, f"Error: {str(e)}"
+        st.download_button(
+            "Download JSON",
+            json.dumps(reports, indent=2),
+            file_name="email-manager-diagnostics.json",
+            mime="application/json"
+        )
 
 # ==========================================
 # 会话状态初始化
@@ -370,10 +371,226 @@ if 'creds' not in st.session_state:
 if 'last_scan_time' not in st.session_state:
     st.session_state.last_scan_time = None
 
+if 'scan_state' not in st.session_state:
+    st.session_state.scan_state = None
+
+if 'last_delete' not in st.session_state:
+    st.session_state.last_delete = None
+
+if 'delete_job' not in st.session_state:
+    st.session_state.delete_job = None
+
+if 'sync_pending' not in st.session_state:
+    st.session_state.sync_pending = False
+
+if 'imap_session' not in st.session_state:
+    st.session_state.imap_session = None
+
+if 'active_job' not in st.session_state:
+    st.session_state.active_job = None
+
+if 'notices' not in st.session_state:
+    st.session_state.notices = []
+
+if 'last_unsubscribe' not in st.session_state:
+    st.session_state.last_unsubscribe = None
+
+# 多文件夹扫描: 登录页上 LIST 到的文件夹 {"account": (邮箱, 服务器), "choices": [...], "defaults": [...]}
+if 'folder_choices' not in st.session_state:
+    st.session_state.folder_choices = None
+
+# 多账户: 登录页上已添加的账户设置 (与 creds 相同的字典), 开始扫描时一起扫描
+if 'accounts' not in st.session_state:
+    st.session_state.accounts = []
+
+# 最近几次扫描 / 删除的诊断报告, 最新的在最后
+if 'diagnostics' not in st.session_state:
+    st.session_state.diagnostics = []
+
+# 勾选状态: 发件人地址的集合, 不随结果表整体复制
+if 'selected' not in st.session_state:
+    st.session_state.selected = set()
+
+# 勾选被整体改写 (全选 / 新结果) 时递增, 让表格丢弃旧的编辑记录
+if 'table_version' not in st.session_state:
+    st.session_state.table_version = 0
+
+def show_results(rows):
+    df = results_frame(rows)
+    st.session_state.scan_results = df
+    # 只保留仍然存在的发件人的勾选状态
+    st.session_state.selected &= set(df["Email"]) if not df.empty else set()
+    st.session_state.table_version += 1
+
+def imap_session(creds):
+    # asyncio 引擎每次 asyncio.run 都是新的事件循环, 连接无法跨运行保留
+    # 多账户时各账户在自己的线程里连接, 不共用页面上的连接
+    if creds.get('engine') == "asyncio" or creds.get('accounts'):
+        return None
+    session = st.session_state.imap_session
+    if session is None or not session.matches(creds['u'], creds['s']):
+        if session is not None:
+            session.close()
+        session = st.session_state.imap_session = SessionConnection(creds['u'], creds['p'], creds['s'])
+    return session
+
+def close_imap_session():
+    if st.session_state.imap_session is not None:
+        st.session_state.imap_session.close()
+        st.session_state.imap_session = None
+
+def track_job(job):
+    # 任务 id 同时写进地址栏, 浏览器刷新后还能找回
+    st.session_state.active_job = job["id"]
+    st.session_state.notices = []
+    st.query_params["job"] = job["id"]
+
+def untrack_job(job_id):
+    st.session_state.active_job = None
+    if "job" in st.query_params:
+        del st.query_params["job"]
+    job_manager().discard(job_id)
+
+def job_accounts(creds):
+    # 单账户时 creds 本身就是账户, 多账户时是 creds["accounts"]
+    return creds.get('accounts') or [creds]
+
+def masked_address(address):
+    # 找回任务时只显示打码的地址: "john@example.com" -> "j***@example.com"
+    name, _, domain = address.partition("@")
+    return f"{name[:1]}***@{domain}"
+
+def job_owner_matches(job, passwords):
+    # 地址栏中的任务 id 可能被转发、截图或留在历史记录里, 只凭 id 不能拿到密码、连接和结果;
+    # 新会话必须输入任务中每个账户的密码
+    accounts = job_accounts(job["creds"])
+    return len(passwords) == len(accounts) and all(
+        hmac.compare_digest(password.encode(), (account.get('p') or "").encode())
+        for password, account in zip(passwords, accounts)
+    )
+
+def restore_job(job):
+    # 刷新后是新的会话: 验证过密码后, 账户、连接和上次的结果从任务中取回
+    st.session_state.active_job = job["id"]
+    st.session_state.creds = job["creds"]
+    st.session_state.imap_session = job["session"]
+    st.session_state.scan_state = job["scan_state"]
+    if job["kind"] == "delete":
+        st.session_state.delete_job = job["delete_job"]
+    if st.session_state.scan_results is None:
+        st.session_state.scan_results = job.get("results")
+
+def active_job():
+    # 只返回本会话启动或已验证过的任务; 地址栏中的其他任务由 unclaimed_job 处理
+    job_id = st.session_state.active_job
+    if not job_id:
+        return None
+    job = job_manager().get(job_id)
+    if job is None:
+        st.session_state.active_job = None
+        if "job" in st.query_params:
+            del st.query_params["job"]
+    return job
+
+def unclaimed_job():
+    # 刷新后地址栏里还有任务 id, 但新会话还没有验证密码
+    job_id = st.query_params.get("job")
+    if not job_id or st.session_state.active_job:
+        return None
+    job = job_manager().get(job_id)
+    if job is None:
+        del st.query_params["job"]
+    return job
+
+def claim_panel(job):
+    st.info("A background job from an earlier session is still available. "
+            "Enter the app password to reconnect to it.")
+    accounts = job_accounts(job["creds"])
+    with st.form("claim_job"):
+        passwords = [
+            st.text_input(f"App Password ({masked_address(account.get('u') or '')})", type="password")
+            for account in accounts
+        ]
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            claim = st.form_submit_button("Reconnect", use_container_width=True)
+        with col2:
+            dismiss = st.form_submit_button("Start New Session", use_container_width=True)
+    if claim:
+        if job_owner_matches(job, passwords):
+            restore_job(job)
+            st.rerun()
+        st.error("The password does not match this job")
+    elif dismiss:
+        # 只是不再找回, 任务本身保留到过期, 原会话不受影响
+        del st.query_params["job"]
+        st.rerun()
+
+def finish_job(job):
+    # 任务结束后在整页重跑中接收结果; 取消的任务同样保留已完成的部分
+    untrack_job(job["id"])
+    creds = st.session_state.creds
+    if job["diagnostics"] is not None:
+        res = job["result"]
+        error = res if isinstance(res, str) else (res[1] if job["kind"] == "delete" and not res[0] else None)
+        report = dict(job["diagnostics"].report(), status=job["status"], error=error)
+        st.session_state.diagnostics = st.session_state.diagnostics[-(DIAGNOSTICS_HISTORY - 1):] + [report]
+    if job["kind"] == "scan":
+        res = job["result"]
+        if isinstance(res, str):
+            st.session_state.notices.append(("error", res))
+            return
+        show_results(res)
+        st.session_state.last_scan_time = datetime.now()
+        if job["status"] == "cancelled":
+            done, total = job["progress"] or (0, 0)
+            st.session_state.notices.append((
+                "info", f"Scan cancelled after {done} of {total} emails. Showing partial results, "
+                        f"rescan to check the rest."
+            ))
+        return
+    
+    if job["kind"] == "unsubscribe":
+        res = job["result"]
+        if isinstance(res, str):
+            st.session_state.notices.append(("error", res))
+            return
+        msg = unsubscribe_summary(res)
+        st.session_state.last_unsubscribe = {"message": msg, "results": res}
+        if job["status"] == "cancelled":
+            kind = "info"
+        elif any(r["Status"] == "Failed" for r in res):
+            kind = "warning"
+        else:
+            kind = "success"
+        st.session_state.notices.append((kind, msg))
+        return
+    
+    success, msg, counts = job["result"]
+    if success:
+        st.session_state.delete_job = None
+        st.session_state.last_delete = {"message": msg, "counts": counts}
+        st.session_state.selected -= set(job["delete_job"]["targets"])
+        
+        # 已删除的发件人直接从缓存中移除, 其余部分只增量刷新
+        state = st.session_state.scan_state
+        if state:
+            drop_senders(state, job["delete_job"]["targets"])
+        track_job(submit_scan(job_manager(), creds, state, imap_session(creds), label="Refreshing",
+                              results=st.session_state.scan_results))
+        st.session_state.notices.append(("success", msg))
+    elif job["status"] == "cancelled":
+        # 保留检查点, 重新渲染后按钮变为 "Resume Delete"
+        st.session_state.notices.append(("info", msg))
+    else:
+        job["delete_job"]["error"] = msg
+
 # ==========================================
 # 主界面
 # ==========================================
 
+PAGE_SIZES = [50, 100, 250]
+
 # 标题
 st.markdown("""
 <div class="header-container">
@@ -382,8 +599,25 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# 后台任务: 已结束的先接收结果 (删除成功后会接着启动刷新任务), 进行中的显示进度
+running_job = active_job()
+if running_job is not None and running_job["status"] != "running":
+    finish_job(running_job)
+    running_job = active_job()
+
+for kind, text in st.session_state.notices:
+    getattr(st, kind)(text)
+
+claimable_job = unclaimed_job() if running_job is None else None
+
+if running_job is not None:
+    job_panel(running_job["id"])
+
+elif claimable_job is not None:
+    claim_panel(claimable_job)
+
 # 登录阶段
-if st.session_state.scan_results is None:
+elif st.session_state.scan_results is None:
     
     # 使用说明
     with st.expander("How to use this tool"):
@@ -577,43 +811,229 @@ if st.session_state.scan_results is None:
     st.markdown("<br>", unsafe_allow_html=True)
     
     # 滑块区域 - 移除复杂的HTML容器，直接使用Streamlit原生组件以获得更好的兼容性
+    whole_mailbox = st.checkbox(
+        "Scan Entire Mailbox",
+        value=False,
+        help="Streams through every message, oldest first, in batches sized to your connection. "
+             "Only per-sender totals are kept, so memory stays flat even for very large mailboxes."
+    )
     limit = st.slider(
         "Scan Limit (Number of emails to check)",
         min_value=50,
         max_value=1000,
         value=200,
         step=50,
+        disabled=whole_mailbox,
         help="Higher numbers take longer to scan"
     )
     
+    # 多文件夹扫描: 先 LIST 出文件夹, 默认选中收件箱、垃圾邮件和常见的订阅邮件文件夹
+    several_folders = st.checkbox(
+        "Scan Several Folders",
+        value=False,
+        help="Also look in folders such as Promotions, Newsletters or Spam that server rules file mail into. "
+             "Folders are scanned at the same time and the scan limit applies to each folder."
+    )
+    folders = None
+    if several_folders:
+        listed = st.session_state.folder_choices
+        if listed is not None and listed["account"] != (user_email, server):
+            listed = st.session_state.folder_choices = None
+        if st.button("Load Folders", disabled=not (user_email and user_pass and server)):
+            with st.spinner("Listing folders..."):
+                res = list_scan_folders(user_email, user_pass, server)
+            if isinstance(res, str):
+                st.error(res)
+            else:
+                listed = st.session_state.folder_choices = {
+                    "account": (user_email, server), "choices": res[0], "defaults": res[1]
+                }
+        if listed is not None:
+            folders = st.multiselect(
+                "Folders",
+                options=listed["choices"],
+                default=listed["defaults"],
+                format_func=decode_folder_name,
+                help="On Gmail, All Mail already contains every label, so adding labels counts their emails twice"
+            )
+        else:
+            st.caption("Enter your account details and load the folder list")
+    
+    with st.expander("Advanced Settings", expanded=False):
+        adaptive = st.checkbox(
+            "Adaptive Speed",
+            value=True,
+            help="Start from settings suited to your provider, speed up while the server keeps up and slow down "
+                 "when it asks to. Turn off to use the fixed batch size and connections below."
+        )
+        batch_size = st.number_input(
+            "Fetch Batch Size",
+            min_value=1,
+            max_value=MAX_FETCH_BATCH_SIZE,
+            value=FETCH_BATCH_SIZE,
+            step=50,
+            disabled=adaptive,
+            help="Number of message headers requested per IMAP round trip"
+        )
+        pool_size = st.slider(
+            "Parallel Connections",
+            min_value=1,
+            max_value=MAX_POOL_SIZE,
+            value=SCAN_POOL_SIZE,
+            disabled=adaptive,
+            help="Scan with several IMAP connections at once. Some providers limit concurrent connections."
+        )
+        engine = st.selectbox(
+            "Scan Engine",
+            options=list(SCAN_ENGINES),
+            format_func=SCAN_ENGINES.get,
+            help="The asyncio engine keeps several FETCH commands in flight on one connection"
+        )
+        server_side = st.checkbox(
+            "Server-side Filtering",
+            value=False,
+            help="Only download messages that have a List-Unsubscribe header. "
+                 "Falls back to checking every message if the server does not support it."
+        )
+        since = st.date_input(
+            "Only Messages Since",
+            value=None,
+            disabled=not server_side
+        )
+        exclude_known = st.checkbox(
+            "Skip Known Senders on Rescan",
+            value=False,
+            disabled=not server_side,
+            help="Rescans only look for new subscriptions and leave already found senders untouched"
+        )
+        smtp_server = st.text_input(
+            "SMTP Server",
+            value=get_smtp_server(user_email) if user_email else "",
+            help="host:port used to send unsubscribe emails to senders that only offer a mailto link. "
+                 "Port 465 uses SSL, other ports use STARTTLS."
+        )
+        use_trash = st.checkbox(
+            "Move Deleted Emails to Trash",
+            value=True,
+            help="When the server supports MOVE, deleted emails go to the Trash folder instead of being expunged"
+        )
+        use_index = st.checkbox(
+            "Keep an Encrypted Local Index",
+            value=False,
+            disabled=not index_available(),
+            help="Stores scan results on this machine, encrypted with your passphrase, so the next session "
+                 "opens instantly and only syncs new mail. Requires the cryptography package."
+        )
+        index_passphrase = ""
+        if use_index:
+            index_passphrase = st.text_input("Index Passphrase", type="password")
+        if os.path.exists(INDEX_PATH) and st.button("Delete Local Index"):
+            clear_index()
+            st.success("Local index deleted")
+    
     st.markdown("<br>", unsafe_allow_html=True)
     
+    # 表单中的账户; 管理几个邮箱时用 "Add Account" 把它加入列表, 再填写下一个, 最后一起扫描
+    account = {
+        "u": user_email,
+        "p": user_pass,
+        "s": server,
+        "limit": None if whole_mailbox else limit,
+        "batch_size": batch_size,
+        "pool_size": pool_size,
+        "engine": engine,
+        "adaptive": adaptive,
+        "filters": {
+            "server_side": server_side,
+            "since": since,
+            "exclude_known": exclude_known
+        },
+        "smtp": smtp_server,
+        "use_trash": use_trash,
+        "index": {"passphrase": index_passphrase} if use_index else None,
+        "folders": folders
+    }
+    form_error = None
+    if not user_email or not user_pass or not server:
+        form_error = "Please fill in all required fields"
+    elif "@" not in user_email:
+        form_error = "Please enter a valid email address"
+    elif use_index and not index_passphrase:
+        form_error = "Please enter a passphrase for the local index"
+    elif several_folders and not folders:
+        form_error = "Please load the folder list and choose at least one folder"
+    
+    accounts = st.session_state.accounts
+    added = any(a['u'].lower() == user_email.lower() for a in accounts)
+    if accounts:
+        st.caption("Accounts to scan: " + ", ".join(f"{a['u']} ({a['s']})" for a in accounts))
+    
+    start_scan = False
     col1, col2, col3 = st.columns([1, 1, 1])
+    with col1:
+        st.markdown('<div class="btn-secondary">', unsafe_allow_html=True)
+        if st.button("Add Account", use_container_width=True,
+                     help="Keep this account and enter another one. All added accounts are scanned together."):
+            if form_error:
+                st.error(form_error)
+            elif added:
+                st.error("This account has already been added")
+            else:
+                accounts.append(account)
+                st.rerun()
+        st.markdown('</div>', unsafe_allow_html=True)
     with col2:
         st.markdown('<div class="btn-success">', unsafe_allow_html=True)
         if st.button("Start Scanning", use_container_width=True):
-            if not user_email or not user_pass or not server:
-                st.error("Please fill in all required fields")
-            elif "@" not in user_email:
-                st.error("Please enter a valid email address")
-            else:
-                st.session_state.creds = {
-                    "u": user_email,
-                    "p": user_pass,
-                    "s": server,
-                    "limit": limit
-                }
+            pending = list(accounts)
+            # 已经添加过账户时可以不填表单, 只扫描列表中的账户
+            if user_email or not pending:
+                if form_error:
+                    st.error(form_error)
+                    pending = []
+                elif not added:
+                    pending.append(account)
+            
+            if len(pending) == 1:
+                st.session_state.creds = pending[0]
+            elif pending:
+                st.session_state.creds = {"accounts": pending}
+            if pending:
+                st.session_state.scan_state = new_scan_state()
+                start_scan = True
                 
-                with st.spinner("Connecting to your mailbox..."):
-                    res = scan_inbox(user_email, user_pass, server, limit)
-                    
-                    if isinstance(res, str):
-                        st.error(res)
+                # 有索引时先直接显示上次的结果, 再在结果页同步新邮件
+                loaded = {}
+                for a in pending:
+                    if not a["index"]:
+                        continue
+                    state, error = load_index(a['u'], a['s'], a["index"]["passphrase"])
+                    if error:
+                        st.error(f"{a['u']}: {error}" if len(pending) > 1 else error)
+                        start_scan = False
+                    elif state:
+                        loaded[a['u']] = state
+                if start_scan and loaded:
+                    if len(pending) == 1:
+                        st.session_state.scan_state = loaded[pending[0]['u']]
                     else:
-                        st.session_state.scan_results = pd.DataFrame(res)
-                        st.session_state.last_scan_time = datetime.now()
-                        st.rerun()
+                        st.session_state.scan_state["accounts"] = loaded
+                    show_results(state_rows(st.session_state.scan_state))
+                    st.session_state.sync_pending = True
+                    st.rerun()
+        st.markdown('</div>', unsafe_allow_html=True)
+    with col3:
+        st.markdown('<div class="btn-secondary">', unsafe_allow_html=True)
+        if st.button("Clear Accounts", use_container_width=True, disabled=not accounts):
+            accounts.clear()
+            st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
+    
+    # 扫描在后台运行, 页面重跑后显示进度和实时结果
+    if start_scan:
+        creds = st.session_state.creds
+        track_job(submit_scan(job_manager(), creds, st.session_state.scan_state, imap_session(creds)))
+        st.rerun()
 
 # 结果管理阶段
 else:
@@ -621,7 +1041,7 @@ else:
     
     if not df.empty:
         # 统计信息
-        selected_count = len(df[df["Select"] == True])
+        selected = st.session_state.selected
         
         cols = st.columns(3)
         with cols[0]:
@@ -633,12 +1053,8 @@ else:
             """, unsafe_allow_html=True)
         
         with cols[1]:
-            st.markdown(f"""
-            <div class="stat-card">
-                <div class="stat-value">{selected_count}</div>
-                <div class="stat-label">Selected</div>
-            </div>
-            """, unsafe_allow_html=True)
+            # 先占位, 等当前页表格里的勾选合并进 selected 之后再填, 否则显示的是上一次重跑的数量
+            selected_card = st.empty()
         
         with cols[2]:
             time_str = st.session_state.last_scan_time.strftime("%H:%M") if st.session_state.last_scan_time else "N/A"
@@ -649,26 +1065,86 @@ else:
             </div>
             """, unsafe_allow_html=True)
         
+        stats = (st.session_state.scan_state or {}).get("stats")
+        multi_account = bool(st.session_state.creds.get('accounts'))
+        savings = fetch_savings(stats)
+        if savings is not None:
+            st.caption(
+                f"Server-side filtering skipped {savings:.0%} of {stats['in_scope']} messages "
+                f"({stats['fetched']} headers fetched)"
+            )
+        elif stats and stats.get("server_filter") is False:
+            st.caption("Server-side filtering is not supported by this server, every message was checked")
+        if stats and stats.get("provider") == "gmail":
+            st.caption(f"Gmail: scanned {decode_folder_name(stats.get('mailbox') or '')} so archived mail is included and each message is "
+                       f"counted once across labels. Deleted emails are moved to Trash.")
+        if stats and stats.get("throttled"):
+            # 多账户时各账户的设置不同, 只显示次数
+            settled = (f"; the scan continued with {stats['batch_size']} headers per request over "
+                       f"{stats['connections']} connections" if stats.get("batch_size") else "")
+            st.caption(f"The server asked to slow down {stats['throttled']} times{settled}")
+        if stats and stats.get("errors"):
+            st.warning(f"Some {'accounts' if multi_account else 'folders'} could not be scanned: " + "; ".join(
+                f"{name if multi_account else decode_folder_name(name)}: {error}"
+                for name, error in stats["errors"].items()))
+        if stats and stats.get("vanished"):
+            # QRESYNC 重扫时发现的, 其他客户端删除或移走的邮件
+            st.caption(f"{stats['vanished']} emails deleted or moved elsewhere since the last scan were removed "
+                       f"from the counts")
+        if multi_account and (st.session_state.scan_state or {}).get("accounts"):
+            with st.expander("Accounts", expanded=False):
+                st.dataframe(
+                    pd.DataFrame(account_summary(st.session_state.scan_state)),
+                    column_config={"Size (MB)": st.column_config.NumberColumn("Size (MB)", format="%.2f")},
+                    hide_index=True,
+                    use_container_width=True
+                )
+        
         st.markdown("<br>", unsafe_allow_html=True)
         
+        # 筛选和排序在本地完成, 浏览器只收到当前这一页
+        render_started = time.perf_counter()
+        col1, col2, col3, col4 = st.columns([3, 2, 1, 2])
+        with col1:
+            search = st.text_input("Search", placeholder="Sender name or address")
+        with col2:
+            domain = st.text_input("Domain", placeholder="example.com")
+        with col3:
+            min_emails = st.number_input("Min Emails", min_value=1, value=1, step=1)
+        with col4:
+            sort_by = st.selectbox("Sort By", list(SORT_OPTIONS))
+        matching = sort_results(filter_results(df, search, domain, min_emails), sort_by)
+        
         # 快速操作
         col1, col2, col3, col4 = st.columns([1, 1, 2, 2])
         with col1:
-            if st.button("Select All", use_container_width=True):
-                df["Select"] = True
-                st.session_state.scan_results = df
+            if st.button("Select All", use_container_width=True, help="Select every sender matching the filters"):
+                selected |= set(matching["Email"])
+                st.session_state.table_version += 1
                 st.rerun()
         with col2:
             if st.button("Deselect All", use_container_width=True):
-                df["Select"] = False
-                st.session_state.scan_results = df
+                selected.clear()
+                st.session_state.table_version += 1
                 st.rerun()
+        with col4:
+            page_size = st.selectbox("Rows Per Page", PAGE_SIZES, index=1)
+        pages = max(1, -(-len(matching) // page_size))
+        with col3:
+            page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1)
         
-        st.markdown("<br>", unsafe_allow_html=True)
+        start = (page - 1) * page_size
+        page_df = matching.iloc[start:start + page_size].reset_index(drop=True)
+        page_df = page_df.assign(Select=page_df["Email"].isin(selected))[["Select", *matching.columns]]
+        if len(matching):
+            st.caption(f"Showing {start + 1}-{start + len(page_df)} of {len(matching)} matching senders")
+        else:
+            st.caption("No senders match the filters")
         
         # 数据表格
+        view = (search, domain, min_emails, sort_by, page, page_size)
         edited_df = st.data_editor(
-            df,
+            page_df,
             column_config={
                 "Select": st.column_config.CheckboxColumn(
                     "Select",
@@ -683,47 +1159,121 @@ else:
                     "Email Address",
                     width="large"
                 ),
-                "Last Received": st.column_config.TextColumn(
+                "Emails": st.column_config.NumberColumn(
+                    "Emails",
+                    width="small"
+                ),
+                "Size (MB)": st.column_config.NumberColumn(
+                    "Size (MB)",
+                    format="%.2f",
+                    width="small"
+                ),
+                "First Received": st.column_config.DatetimeColumn(
+                    "First Email",
+                    format="YYYY-MM-DD",
+                    width="small"
+                ),
+                "Last Received": st.column_config.DatetimeColumn(
                     "Last Email",
+                    format="YYYY-MM-DD HH:mm",
                     width="medium"
                 ),
+                "Per Week": st.column_config.NumberColumn(
+                    "Per Week",
+                    format="%.1f",
+                    width="small",
+                    help="Average emails per week between the first and last email"
+                ),
                 "Unsubscribe": st.column_config.LinkColumn(
                     "Unsubscribe Link",
                     display_text="Open Link",
                     width="medium"
                 ),
+                "One-Click": st.column_config.CheckboxColumn(
+                    "One-Click",
+                    width="small",
+                    help="Supports one-click unsubscribe (RFC 8058), no browser needed"
+                ),
+                "Folders": st.column_config.TextColumn(
+                    "Folders",
+                    width="medium",
+                    help="Emails from this sender in each scanned folder"
+                ),
+                "Accounts": st.column_config.TextColumn(
+                    "Accounts",
+                    width="medium",
+                    help="Emails from this sender in each scanned account"
+                ),
+                "Mailto": None,
             },
             hide_index=True,
             use_container_width=True,
             height=700,
-            disabled=["Sender", "Email", "Last Received", "Unsubscribe"]
+            disabled=["Sender", "Email", *STAT_COLUMNS, "Folders", "Accounts", "Unsubscribe", "One-Click", "Mailto"],
+            key=f"results_{st.session_state.table_version}_{hash(view)}"
         )
+        if st.session_state.diagnostics:
+            # 最近一次操作的结果表: 筛选 + 排序 + 分页 + 表格序列化的耗时 (每次重跑覆盖)
+            st.session_state.diagnostics[-1]["phases"]["render_results"] = round(
+                time.perf_counter() - render_started, 4)
         
-        st.session_state.scan_results = edited_df
+        # 只用当前页的勾选结果更新集合
+        selected.difference_update(page_df["Email"])
+        selected.update(edited_df.loc[edited_df["Select"] == True, "Email"])
+        selected_card.markdown(f"""
+            <div class="stat-card">
+                <div class="stat-value">{len(selected)}</div>
+                <div class="stat-label">Selected</div>
+            </div>
+            """, unsafe_allow_html=True)
         
-        selected_rows = edited_df[edited_df["Select"] == True]
+        selected_rows = df[df["Email"].isin(selected)]
         selected_senders = selected_rows["Email"].tolist()
+        if len(selected_rows) > 0 and "Emails" in selected_rows:
+            st.caption(
+                f"Selected senders account for {int(selected_rows['Emails'].sum())} emails "
+                f"({selected_rows['Size (MB)'].sum():.1f} MB)"
+            )
+        
+        last_delete = st.session_state.last_delete
+        if last_delete:
+            with st.expander(f"Last Delete: {last_delete['message']}", expanded=False):
+                counts_df = pd.DataFrame(
+                    sorted(last_delete["counts"].items(), key=lambda item: item[1], reverse=True),
+                    columns=["Email", "Deleted"]
+                )
+                st.dataframe(counts_df, hide_index=True, use_container_width=True)
+        
+        last_unsubscribe = st.session_state.last_unsubscribe
+        if last_unsubscribe:
+            with st.expander(f"Last Unsubscribe: {last_unsubscribe['message']}", expanded=False):
+                st.dataframe(
+                    pd.DataFrame(last_unsubscribe["results"],
+                                 columns=(["Account"] if multi_account else []) + RESULT_COLUMNS),
+                    column_config={
+                        "Unsubscribe": st.column_config.LinkColumn("Link", display_text="Open Link"),
+                    },
+                    hide_index=True,
+                    use_container_width=True
+                )
         
         st.markdown("<br>", unsafe_allow_html=True)
         
         # 操作按钮
         if len(selected_senders) > 0:
-            st.warning(f"Warning: This will permanently delete all emails from {len(selected_senders)} selected sender(s)")
+            st.warning(f"Warning: This will delete all emails from {len(selected_senders)} selected sender(s)")
         
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         
         with col1:
             st.markdown('<div class="btn-success">', unsafe_allow_html=True)
-            if st.button("Rescan Inbox", use_container_width=True):
-                creds = st.session_state.creds
-                with st.spinner("Rescanning..."):
-                    res = scan_inbox(creds['u'], creds['p'], creds['s'], creds.get('limit', 200))
-                    if isinstance(res, str):
-                        st.error(res)
-                    else:
-                        st.session_state.scan_results = pd.DataFrame(res)
-                        st.session_state.last_scan_time = datetime.now()
-                        st.rerun()
+            if multi_account:
+                rescan_label = "Rescan Accounts"
+            elif st.session_state.creds.get('folders'):
+                rescan_label = "Rescan Folders"
+            else:
+                rescan_label = "Rescan Inbox"
+            rescan = st.button(rescan_label, use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col2:
@@ -731,33 +1281,81 @@ else:
             if st.button("Start Over", use_container_width=True):
                 st.session_state.scan_results = None
                 st.session_state.creds = {}
+                st.session_state.accounts = []
                 st.session_state.last_scan_time = None
+                st.session_state.scan_state = None
+                st.session_state.last_delete = None
+                st.session_state.last_unsubscribe = None
+                st.session_state.delete_job = None
+                st.session_state.sync_pending = False
+                st.session_state.selected = set()
+                close_imap_session()
                 st.rerun()
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col3:
+            # 退订选中的发件人: 一键退订 / mailto 自动完成, 只有普通链接的列在结果里手动打开
+            st.markdown('<div class="btn-secondary">', unsafe_allow_html=True)
+            if st.button(f"Unsubscribe Selected ({len(selected_senders)})", disabled=not selected_senders,
+                         use_container_width=True):
+                creds = st.session_state.creds
+                # 多账户时每个账户各退订一次, 用该账户收到的退订链接
+                if multi_account:
+                    targets = account_targets(st.session_state.scan_state, selected_senders)
+                else:
+                    targets = selected_rows.to_dict("records")
+                track_job(submit_unsubscribe(
+                    job_manager(), creds, targets, st.session_state.imap_session,
+                    scan_state=st.session_state.scan_state, results=df
+                ))
+                st.rerun()
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        with col4:
             st.markdown('<div class="btn-danger">', unsafe_allow_html=True)
-            if len(selected_senders) > 0:
+            job = st.session_state.delete_job
+            start_delete = False
+            if job:
+                remaining = delete_remaining(job)
+                label = f"Resume Delete ({remaining} left)" if remaining is not None else "Resume Delete"
+                start_delete = st.button(label, use_container_width=True)
+            elif len(selected_senders) > 0:
                 if st.button(f"Delete Selected ({len(selected_senders)})", use_container_width=True):
-                    with st.spinner(f"Deleting emails from {len(selected_senders)} senders..."):
-                        creds = st.session_state.creds
-                        success, msg = delete_emails(creds['u'], creds['p'], creds['s'], selected_senders)
-                        
-                        if success:
-                            st.success(msg)
-                            time.sleep(2)
-                            
-                            with st.spinner("Refreshing..."):
-                                res = scan_inbox(creds['u'], creds['p'], creds['s'], creds.get('limit', 200))
-                                if not isinstance(res, str):
-                                    st.session_state.scan_results = pd.DataFrame(res)
-                                    st.session_state.last_scan_time = datetime.now()
-                                st.rerun()
-                        else:
-                            st.error(msg)
+                    job = st.session_state.delete_job = delete_job_for(
+                        st.session_state.creds, st.session_state.scan_state, selected_senders)
+                    start_delete = True
             else:
                 st.button("Delete Selected (0)", disabled=True, use_container_width=True)
+            
+            if start_delete:
+                creds = st.session_state.creds
+                job.pop("error", None)
+                track_job(submit_delete(
+                    job_manager(), creds, job, imap_session(creds), done_before=job["done"],
+                    scan_state=st.session_state.scan_state, results=df
+                ))
+                st.rerun()
             st.markdown('</div>', unsafe_allow_html=True)
+        
+        if rescan:
+            creds = st.session_state.creds
+            track_job(submit_scan(
+                job_manager(), creds, st.session_state.scan_state, imap_session(creds), label="Rescanning",
+                results=df
+            ))
+            st.rerun()
+        
+        if st.session_state.delete_job:
+            job = st.session_state.delete_job
+            if job.get("error"):
+                st.error(job["error"])
+            st.info(
+                f"An unfinished delete for {len(job['targets'])} sender(s) is saved. "
+                f"Resume it to continue where it stopped, or discard it."
+            )
+            if st.button("Discard Unfinished Delete"):
+                st.session_state.delete_job = None
+                st.rerun()
     
     else:
         st.markdown("""
@@ -773,8 +1371,29 @@ else:
             if st.button("Go Back", use_container_width=True):
                 st.session_state.scan_results = None
                 st.session_state.creds = {}
+                st.session_state.accounts = []
                 st.session_state.last_scan_time = None
+                st.session_state.scan_state = None
+                st.session_state.last_delete = None
+                st.session_state.last_unsubscribe = None
+                st.session_state.delete_job = None
+                st.session_state.sync_pending = False
+                st.session_state.selected = set()
+                close_imap_session()
                 st.rerun()
+    
+    # 从本地索引打开时, 先显示上次的结果, 再只同步之后的新邮件
+    if st.session_state.sync_pending:
+        st.session_state.sync_pending = False
+        creds = st.session_state.creds
+        track_job(submit_scan(
+            job_manager(), creds, st.session_state.scan_state, imap_session(creds),
+            label="Syncing new mail since the last session", results=st.session_state.scan_results
+        ))
+        st.rerun()
+
+if st.session_state.diagnostics:
+    diagnostics_panel()
 
 # 页脚
 st.markdown("<hr>", unsafe_allow_html=True)
@@ -0,0 +1,360 @@
+import asyncio
+import re
+import ssl as ssl_module
+import time
+import zlib
+
+# ==========================================
+# asyncio IMAP 客户端 (支持带标签的命令流水线)
+# ==========================================
+# 返回值与 imaplib 保持一致: (status, data), data 中带字面量的响应为 (前缀, 字面量) 元组,
+# 这样同一套解析函数可以同时用于两种引擎。
+
+IMAP_SSL_PORT = 993
+# 大邮箱的 UID SEARCH 结果是单独一行 (100 万封约 8 MB), 默认 64 KB 的行长限制不够
+MAX_LINE_LENGTH = 32 * 1024 * 1024
+DEFLATE_READ_SIZE = 64 * 1024
+
+LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+RESPONSE_CODE_RE = re.compile(rb'\[([A-Z-]+)(?: ([^\]]*))?\]')
+TAGGED_RE = re.compile(rb'^(\S+) (OK|NO|BAD)(?: (.*))?$')
+FETCH_UID_RE = re.compile(rb'\bUID (\d+)', re.I)
+# 服务器要求放慢: RFC 5530 的 [UNAVAILABLE] / [LIMIT]、各家的 [THROTTLED] 和常见的说明文字
+THROTTLE_RE = re.compile(rb'\[(?:THROTTLED|UNAVAILABLE|LIMIT)\]|too many|rate limit|bandwidth|try again later|throttl',
+                         re.I)
+
+class IMAPError(Exception):
+    pass
+
+class ThrottledError(IMAPError):
+    # NO [THROTTLED] 之类的回复, 或者命令执行中途被说明限流的 BYE 断开
+    pass
+
+def uid_ranges(uid_set):
+    # "1:5,9,12:*" -> [(1, 5), (9, 9), (12, None)], None 表示 "*"
+    if isinstance(uid_set, bytes):
+        uid_set = uid_set.decode()
+    ranges = []
+    for part in str(uid_set).split(","):
+        first, _, last = part.partition(":")
+        if not first.strip().isdigit() and first.strip() != "*":
+            continue
+        low = None if first.strip() == "*" else int(first)
+        high = low if not last else (None if last.strip() == "*" else int(last))
+        if low is None:
+            low, high = high or 1, None
+        elif high is not None and high < low:
+            low, high = high, low
+        ranges.append((low, high))
+    return ranges
+
+def quote(text):
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+class DeflateStream:
+    # COMPRESS=DEFLATE 之后的读取端: 从原来的 StreamReader 读压缩数据, 提供同样的 readline / readexactly
+    def __init__(self, reader, client):
+        self.reader = reader
+        self.client = client
+        self.inflater = zlib.decompressobj(wbits=-15)
+        self.buffer = bytearray()
+
+    async def fill(self):
+        data = await self.reader.read(DEFLATE_READ_SIZE)
+        if not data:
+            return False
+        # 统计线路上的 (压缩后的) 字节数, 与 imaplib 引擎一致
+        self.client.received += len(data)
+        self.buffer += self.inflater.decompress(data)
+        return True
+
+    async def readline(self):
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', start)
+            if end >= 0:
+                line = bytes(self.buffer[:end + 1])
+                del self.buffer[:end + 1]
+                return line
+            if len(self.buffer) > MAX_LINE_LENGTH:
+                raise IMAPError("response line too long")
+            start = len(self.buffer)
+            if not await self.fill():
+                line = bytes(self.buffer)
+                self.buffer.clear()
+                return line
+
+    async def readexactly(self, n):
+        while len(self.buffer) < n:
+            if not await self.fill():
+                raise asyncio.IncompleteReadError(bytes(self.buffer), n)
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+class AsyncIMAP:
+    def __init__(self, reader, writer, timeout=30):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.tag_counter = 0
+        self.pending = {}
+        self.codes = {}
+        self.capabilities = set()
+        self.closed = False
+        self.reader_task = None
+        # 服务器主动断开前发来的 BYE 说明, 断开时交给在途的命令; 说明文字表示限流时抛 ThrottledError
+        self.bye = None
+        # 可选的诊断计数器 (mail_core.Diagnostics); 收到的字节数在命令完成时结算
+        self.diagnostics = None
+        self.received = 0
+        self.reported = 0
+        self.deflate = None
+        self.qresync = False
+        # 与 imaplib 的 welcome 相同; provider / mailbox / folders 由 mail_core 在连接后填写
+        self.welcome = b''
+        self.provider = None
+        self.mailbox = None
+        self.folders = None
+
+    @classmethod
+    async def open(cls, host, port=IMAP_SSL_PORT, ssl=True, timeout=30):
+        context = ssl_module.create_default_context() if ssl else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context, limit=MAX_LINE_LENGTH), timeout)
+        client = cls(reader, writer, timeout)
+        greeting = await asyncio.wait_for(reader.readline(), timeout)
+        if not greeting.startswith(b'* OK') and not greeting.startswith(b'* PREAUTH'):
+            writer.close()
+            raise IMAPError(f"unexpected greeting: {greeting!r}")
+        client.welcome = greeting.rstrip(b'\r\n')
+        client.reader_task = asyncio.create_task(client.read_loop())
+        await client.capability()
+        return client
+
+    # ------------------------------------------
+    # 读取与分发
+    # ------------------------------------------
+
+    async def read_response(self):
+        # 读出一条完整响应, 包括其中的字面量
+        line = await self.reader.readline()
+        if not line:
+            raise IMAPError("connection closed by server")
+        parts = []
+        # 压缩后由 DeflateStream 统计线路字节数
+        counted = self.deflate is None
+        if counted:
+            self.received += len(line)
+        line = line.rstrip(b'\r\n')
+        while True:
+            match = LITERAL_RE.search(line)
+            if not match:
+                parts.append(line)
+                return parts
+            literal = await self.reader.readexactly(int(match.group(1)))
+            parts.append((line, literal))
+            line = await self.reader.readline()
+            if counted:
+                self.received += len(literal) + len(line)
+            line = line.rstrip(b'\r\n')
+
+    async def read_loop(self):
+        try:
+            while True:
+                parts = await self.read_response()
+                head = parts[0][0] if isinstance(parts[0], tuple) else parts[0]
+                if head.startswith(b'* '):
+                    self.dispatch_untagged(parts)
+                elif head.startswith(b'+'):
+                    continue
+                else:
+                    self.dispatch_tagged(head)
+        except Exception as e:
+            self.closed = True
+            for entry in self.pending.values():
+                if not entry["future"].done():
+                    if self.bye is not None and THROTTLE_RE.search(self.bye.encode()):
+                        entry["future"].set_exception(ThrottledError(f"BYE {self.bye}".strip()))
+                    elif self.bye is not None:
+                        entry["future"].set_exception(IMAPError(f"BYE {self.bye}".strip()))
+                    else:
+                        entry["future"].set_exception(IMAPError(str(e) or "connection lost"))
+
+    def dispatch_untagged(self, parts):
+        first = parts[0]
+        head = first[0] if isinstance(first, tuple) else first
+        head = head[2:]
+        words = head.split(b' ', 2)
+        if len(words) > 1 and words[0].isdigit():
+            # "* 5 FETCH (...)" -> FETCH: b"5 (...)", 与 imaplib 相同
+            name = words[1].decode().upper()
+            rest = words[0] + (b' ' + words[2] if len(words) > 2 else b'')
+        else:
+            name = words[0].decode().upper()
+            rest = head[len(words[0]) + 1:]
+        if name == 'BYE':
+            self.bye = rest.decode(errors='ignore')
+        if name in ('OK', 'NO', 'BAD', 'BYE'):
+            match = RESPONSE_CODE_RE.search(rest)
+            if match:
+                code = match.group(1).decode()
+                self.codes.setdefault(code, []).append(match.group(2))
+        if name == 'CAPABILITY':
+            self.capabilities = set(rest.decode().upper().split())
+        if isinstance(first, tuple):
+            value = [(rest, first[1])] + parts[1:]
+        else:
+            value = [rest] + parts[1:]
+        # 流水线中几个 UID FETCH 的响应可能交错 (RFC 3501 5.5), FETCH 按其中的 UID 归属 UID 集合包含它的命令;
+        # 其他未带标签的响应归属最早未完成的命令
+        entry = self.fetch_owner(parts) if name == 'FETCH' else None
+        if entry is None and self.pending:
+            entry = next(iter(self.pending.values()))
+        if entry is not None:
+            entry["untagged"].setdefault(name, []).extend(value)
+
+    def fetch_owner(self, parts):
+        # UID 可能在字面量之前或之后, 只在响应行里找, 不看字面量 (邮件头部) 的内容
+        text = b' '.join(part[0] if isinstance(part, tuple) else part for part in parts)
+        match = FETCH_UID_RE.search(text)
+        if not match:
+            return None
+        uid = int(match.group(1))
+        for entry in self.pending.values():
+            if any(low <= uid and (high is None or uid <= high) for low, high in entry["uids"] or ()):
+                return entry
+        return None
+
+    def dispatch_tagged(self, line):
+        match = TAGGED_RE.match(line)
+        if not match:
+            return
+        tag = match.group(1)
+        entry = self.pending.pop(tag, None)
+        if entry and entry["name"] == 'COMPRESS' and match.group(2) == b'OK':
+            # 在读取下一条响应之前切换, 服务器此后发来的都是压缩数据
+            self.reader = DeflateStream(self.reader, self)
+            self.deflate = zlib.compressobj(wbits=-15)
+        if entry and not entry["future"].done():
+            entry["future"].set_result((match.group(2).decode(), match.group(3) or b''))
+
+    # ------------------------------------------
+    # 命令
+    # ------------------------------------------
+
+    async def command(self, name, *args):
+        if self.closed:
+            raise IMAPError("connection is closed")
+        self.tag_counter += 1
+        tag = b'A%04d' % self.tag_counter
+        line = tag + b' ' + name.encode()
+        for arg in args:
+            if arg is None:
+                continue
+            line += b' ' + (arg if isinstance(arg, bytes) else str(arg).encode())
+        future = asyncio.get_running_loop().create_future()
+        # UID FETCH 记下请求的 UID 集合, 交错的响应按它归属
+        uids = uid_ranges(args[0]) if name == 'UID FETCH' and args else None
+        entry = {"future": future, "untagged": {}, "name": name, "uids": uids}
+        # 发出时没有其他命令在途, 才需要等一次完整的往返
+        round_trip = not self.pending
+        self.pending[tag] = entry
+        started = time.perf_counter()
+        line += b'\r\n'
+        if self.deflate is not None:
+            line = self.deflate.compress(line) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.writer.write(line)
+        await self.writer.drain()
+        try:
+            status, text = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # 不再等待的命令要移出 pending, 否则之后所有未带标签的响应都会被它吸走
+            self.pending.pop(tag, None)
+            raise
+        if self.diagnostics is not None:
+            received, self.reported = self.received - self.reported, self.received
+            self.diagnostics.command(name, time.perf_counter() - started, received, round_trip)
+        return status, text, entry["untagged"]
+
+    async def simple(self, name, *args, key=None):
+        status, text, untagged = await self.command(name, *args)
+        if status == 'BAD':
+            raise IMAPError(f"{name} command error: {text.decode(errors='ignore')}")
+        if status == 'NO' and THROTTLE_RE.search(text):
+            raise ThrottledError(text.decode(errors='ignore'))
+        return status, untagged.get(key or name.split()[-1], [None])
+
+    async def capability(self):
+        return await self.simple('CAPABILITY')
+
+    async def login(self, user, password):
+        status, text, _ = await self.command('LOGIN', quote(user), quote(password))
+        if status != 'OK':
+            raise IMAPError(text.decode(errors='ignore'))
+        # 登录后服务器可能更新能力列表
+        await self.capability()
+        return status, [text]
+
+    async def compress(self):
+        # RFC 4978, 返回是否已开启; 只能在没有其他命令在途时调用 (登录之后、流水线开始之前)
+        if 'COMPRESS=DEFLATE' not in self.capabilities or self.deflate is not None:
+            return False
+        try:
+            status, _ = await self.simple('COMPRESS', 'DEFLATE')
+        except IMAPError:
+            return False
+        return status == 'OK'
+
+    async def enable_qresync(self):
+        # RFC 7162, 返回是否已开启; 必须在 SELECT 之前
+        if 'QRESYNC' not in self.capabilities or 'ENABLE' not in self.capabilities:
+            return False
+        status, text, untagged = await self.command('ENABLE', 'QRESYNC')
+        enabled = b' '.join(item or b'' for item in untagged.get('ENABLED', []))
+        self.qresync = status == 'OK' and b'QRESYNC' in enabled.upper()
+        return self.qresync
+
+    async def select(self, mailbox="INBOX"):
+        self.codes = {}
+        status, text, untagged = await self.command('SELECT', quote(mailbox))
+        if status != 'OK':
+            raise IMAPError(text.decode(errors='ignore'))
+        return status, untagged.get('EXISTS', [None])
+
+    async def uid(self, command, *args):
+        command = command.upper()
+        key = command if command in ('SEARCH', 'SORT', 'THREAD') else 'FETCH'
+        if command == 'EXPUNGE':
+            key = 'EXPUNGE'
+        return await self.simple('UID ' + command, *args, key=key)
+
+    async def list(self, directory='""', pattern='"*"'):
+        return await self.simple('LIST', directory, pattern)
+
+    async def expunge(self):
+        return await self.simple('EXPUNGE')
+
+    async def noop(self):
+        return await self.simple('NOOP')
+
+    def response(self, code):
+        return code, self.codes.pop(code.upper(), [None])
+
+    async def logout(self):
+        try:
+            if not self.closed:
+                await self.command('LOGOUT')
+        except Exception:
+            pass
+        await self.close()
+
+    async def close(self):
+        self.closed = True
+        if self.reader_task:
+            self.reader_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
@@ -0,0 +1,126 @@
+import argparse
+import imaplib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_imap import AsyncIMAP
+from bench_scan import OPEN_ASYNC
+from fake_imap import FakeIMAPServer, generate_mailbox
+
+# ==========================================
+# 多账户: 逐个账户 vs 并发扫描, 检查同一服务器上的并发上限、合并后的账户分布和分发到各账户的删除
+# ==========================================
+
+# 服务器地址 -> 账户数; 两台服务器上的账户数不同, 用来检查按服务器计算的并发上限
+HOSTS = {"imap.shared.test": 4, "imap.other.test": 2}
+
+def use_fake_hosts(addresses):
+    # 按连接的服务器地址转到对应的假服务器
+    imaplib.IMAP4_SSL = lambda host, *args, **kwargs: imaplib.IMAP4(*addresses[host])
+    AsyncIMAP.open = classmethod(lambda cls, host, *args, **kwargs: OPEN_ASYNC(cls, *addresses[host], ssl=False))
+
+def expected_counts(core, mailboxes):
+    # {发件人: {账户: 封数}}, 直接从假服务器的邮件计算
+    counts = {}
+    for user, box in mailboxes.items():
+        for msg in box.messages:
+            row = core.parse_sender(msg.header)
+            if row:
+                account_counts = counts.setdefault(row["Email"], {})
+                account_counts[user] = account_counts.get(user, 0) + 1
+    return counts
+
+def check(core, rows, expected):
+    problems = []
+    found = {row["Email"]: core.parse_breakdown(row["Accounts"]) for row in rows}
+    if set(found) != set(expected):
+        problems.append(f"{len(found)} senders found, expected {len(expected)}")
+    for row in rows:
+        want = expected.get(row["Email"], {})
+        if found[row["Email"]] != want or row["Emails"] != sum(want.values()):
+            problems.append(f"{row['Email']}: {row['Emails']} emails in {row['Accounts']}, expected {want}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent multi-account scans against fake servers")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages per account")
+    parser.add_argument("--senders", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--engine", choices=["threaded", "asyncio"], default="threaded")
+    parser.add_argument("--delete-senders", type=int, default=5)
+    args = parser.parse_args()
+
+    import mail_core as core
+
+    mailboxes = {}
+    servers = {}
+    accounts = []
+    for host, count in HOSTS.items():
+        users = {}
+        for n in range(count):
+            user = f"user{len(mailboxes)}@{host.split('.', 1)[1]}"
+            users[user] = mailboxes[user] = generate_mailbox(args.messages, senders=args.senders,
+                                                             seed=len(mailboxes))
+            accounts.append({"u": user, "p": "x", "s": host, "limit": args.messages, "engine": args.engine,
+                             "use_trash": False})
+        servers[host] = FakeIMAPServer({}, args.latency, users=users).start()
+    failures = []
+    try:
+        use_fake_hosts({host: server.address for host, server in servers.items()})
+        expected = expected_counts(core, mailboxes)
+        creds = {"accounts": accounts}
+        print(f"{len(accounts)} accounts on {len(servers)} servers, {args.messages} messages each, "
+              f"{args.latency * 1000:.0f} ms per command, at most {core.ACCOUNTS_PER_HOST} accounts per server")
+
+        print(f"{'mode':>10} {'workers':>8} {'seconds':>8} {'senders':>8} {'per server':>12}")
+        baseline = None
+        default_workers = core.ACCOUNT_WORKERS
+        for label, workers in (("sequential", 1), ("concurrent", default_workers)):
+            core.ACCOUNT_WORKERS = workers
+            for server in servers.values():
+                server.reset_stats()
+            state = core.new_scan_state()
+            started = time.perf_counter()
+            rows = core.run_scan(creds, state)
+            elapsed = time.perf_counter() - started
+            if isinstance(rows, str):
+                raise SystemExit(rows)
+            baseline = baseline or elapsed
+            busiest = "/".join(str(server.stats["max_users"]) for server in servers.values())
+            print(f"{label:>10} {workers:>8} {elapsed:>8.2f} {len(rows):>8} {busiest:>12}  "
+                  f"({baseline / elapsed:.1f}x)")
+            failures += [f"{label}: {p}" for p in check(core, rows, expected)]
+            for host, server in servers.items():
+                if server.stats["max_users"] > core.ACCOUNTS_PER_HOST:
+                    failures.append(f"{label}: {server.stats['max_users']} accounts at once on {host}")
+        core.ACCOUNT_WORKERS = default_workers
+
+        # 退订: 每个账户一行, 用该账户收到的退订链接
+        targets = [row["Email"] for row in rows[:args.delete_senders]]
+        unsubscribe_rows = core.account_targets(state, targets)
+        want_rows = {(email, user) for email in targets for user in expected[email]}
+        if {(row["Email"], row["Account"]) for row in unsubscribe_rows} != want_rows:
+            failures.append(f"unsubscribe: {len(unsubscribe_rows)} account rows, expected {len(want_rows)}")
+
+        # 删除: 只分发到出现过这些发件人的账户, 之后哪个账户里都不应再有这些邮件
+        job = core.delete_job_for(creds, state, targets)
+        want = sum(sum(expected[email].values()) for email in targets)
+        success, message, counts = core.run_delete(creds, job)
+        print(f"{message} ({len(job['accounts'])} of {len(accounts)} accounts affected)")
+        left = {email: users for email, users in expected_counts(core, mailboxes).items() if email in targets}
+        if not success or sum(counts.values()) != want or left:
+            failures.append(f"delete: {sum(counts.values())} of {want} emails deleted, still left {left}")
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_scan import use_fake_server
+from fake_imap import FakeIMAPServer, filed_mailboxes, generate_mailbox
+
+# ==========================================
+# 多文件夹扫描: 逐个文件夹 vs 并发扫描, 并检查合并后的计数、文件夹分布和跨文件夹删除
+# ==========================================
+
+USER = "bench@example.com"
+
+def expected_counts(core, boxes, folders):
+    # {发件人: {文件夹: 封数}}, 直接从假服务器的邮件计算
+    counts = {}
+    for name in folders:
+        for msg in boxes[name].messages:
+            row = core.parse_sender(msg.header)
+            if row:
+                folder_counts = counts.setdefault(row["Email"], {})
+                folder_counts[name] = folder_counts.get(name, 0) + 1
+    return counts
+
+def folder_breakdown(text):
+    # "INBOX/Newsletters (11), Spam (3)" -> {"INBOX/Newsletters": 11, "Spam": 3}
+    parts = (part.rsplit(" (", 1) for part in text.split(", "))
+    return {name: int(count.rstrip(")")) for name, count in parts}
+
+def check(rows, expected):
+    problems = []
+    found = {row["Email"]: folder_breakdown(row["Folders"]) for row in rows}
+    if set(found) != set(expected):
+        problems.append(f"{len(found)} senders found, expected {len(expected)}")
+    for row in rows:
+        want = expected.get(row["Email"], {})
+        if found[row["Email"]] != want or row["Emails"] != sum(want.values()):
+            problems.append(f"{row['Email']}: {row['Emails']} emails in {row['Folders']}, expected {want}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent multi-folder scans against a fake server")
+    parser.add_argument("--messages", type=int, default=6000)
+    parser.add_argument("--senders", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--engine", choices=["threaded", "asyncio"], default="threaded")
+    parser.add_argument("--delete-senders", type=int, default=5)
+    args = parser.parse_args()
+
+    import mail_core as core
+
+    boxes = filed_mailboxes(generate_mailbox(args.messages, senders=args.senders))
+    failures = []
+    with FakeIMAPServer(boxes, args.latency) as server:
+        use_fake_server(server.address)
+        choices, folders = core.list_scan_folders(USER, "x", "localhost")
+        print(f"folders {choices}, scanning {folders}, {args.latency * 1000:.0f} ms per command")
+        expected = expected_counts(core, boxes, folders)
+        creds = {"u": USER, "p": "x", "s": "localhost", "limit": args.messages, "engine": args.engine,
+                 "folders": folders, "use_trash": False}
+
+        print(f"{'mode':>10} {'workers':>8} {'seconds':>8} {'senders':>8} {'commands':>9}")
+        baseline = None
+        default_workers = core.FOLDER_WORKERS
+        for label, workers in (("sequential", 1), ("concurrent", default_workers)):
+            core.FOLDER_WORKERS = workers
+            server.reset_stats()
+            started = time.perf_counter()
+            rows = core.run_scan(creds, core.new_scan_state())
+            elapsed = time.perf_counter() - started
+            if isinstance(rows, str):
+                raise SystemExit(rows)
+            baseline = baseline or elapsed
+            print(f"{label:>10} {workers:>8} {elapsed:>8.2f} {len(rows):>8} {server.stats['commands']:>9}  "
+                  f"({baseline / elapsed:.1f}x)")
+            failures += [f"{label}: {p}" for p in check(rows, expected)]
+        core.FOLDER_WORKERS = default_workers
+
+        # 删除: 选中的发件人在每个扫描过的文件夹里都不应再有邮件
+        targets = [row["Email"] for row in rows[:args.delete_senders]]
+        want = sum(sum(expected[email].values()) for email in targets)
+        success, message, counts = core.run_delete(creds, core.new_delete_job(targets, folders))
+        print(message)
+        left = {email: folders_left for email, folders_left in expected_counts(core, boxes, folders).items()
+                if email in targets}
+        if not success or sum(counts.values()) != want or left:
+            failures.append(f"delete: {sum(counts.values())} of {want} emails deleted, still left {left}")
+
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
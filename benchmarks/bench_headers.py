@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_imap import generate_mailbox
+from reference_headers import EDGE_CASES, stdlib_parse_sender
+
+# ==========================================
+# 头部解析器: 与标准库结果对比 + 每秒解析头部数
+# ==========================================
+
+def headers_per_second(parse, blocks, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for block in blocks:
+            parse(block)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(blocks) / best
+
+def main():
+    parser = argparse.ArgumentParser(description="Check parse_sender against the stdlib and measure headers/s")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--encoded-ratio", type=float, default=0.3)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    import mail_core as core
+
+    box = generate_mailbox(args.messages, senders=200, encoded_ratio=args.encoded_ratio)
+    blocks = [m.header_fields(["FROM", "LIST-UNSUBSCRIBE", "LIST-UNSUBSCRIBE-POST"]) for m in box.messages] + EDGE_CASES
+
+    mismatches = 0
+    for block in blocks:
+        expected = stdlib_parse_sender(core, block)
+        actual = core.parse_sender(block)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"mismatch for {block!r}\n  stdlib: {expected}\n  parser: {actual}")
+    print(f"parity: {len(blocks) - mismatches} / {len(blocks)} header blocks identical")
+
+    stdlib_rate = headers_per_second(lambda b: stdlib_parse_sender(core, b), blocks, args.rounds)
+    fast_rate = headers_per_second(core.parse_sender, blocks, args.rounds)
+    print(f"{'parser':>8} {'headers/s':>11}")
+    print(f"{'stdlib':>8} {stdlib_rate:>11,.0f}")
+    print(f"{'fast':>8} {fast_rate:>11,.0f}  ({fast_rate / stdlib_rate:.1f}x)")
+    if mismatches:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
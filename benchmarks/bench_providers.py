@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_scan import use_fake_server
+from fake_imap import PROVIDER_PROFILES, FakeIMAPServer, generate_mailbox, provider_mailboxes
+
+# ==========================================
+# 服务商快速路径: 通用 / Gmail / Outlook 三种假服务器上的扫描和删除
+# ==========================================
+# 检查能力和问候语的识别、扫描的文件夹、服务器端过滤的搜索条件, 以及删除的邮件最后去了哪里。
+
+USER = "bench@example.com"
+
+def make_server(profile, box, latency):
+    mailboxes, options = provider_mailboxes(profile, box)
+    return FakeIMAPServer(mailboxes, latency, **options)
+
+def run(core, profile, args):
+    box = generate_mailbox(args.messages, senders=args.senders)
+    reference = core.parse_sender
+    subscribed = {reference(m.header)["Email"] for m in box.messages if reference(m.header)}
+    provider, mailbox, search_key, trash = PROVIDER_PROFILES[profile]
+    problems = []
+    with make_server(profile, box, args.latency) as server:
+        use_fake_server(server.address)
+        filters = {"server_side": True}
+        rows_by_engine = {}
+        for engine in ("threaded", "asyncio"):
+            state = core.new_scan_state()
+            server.reset_stats()
+            started = time.perf_counter()
+            if engine == "asyncio":
+                rows = core.scan_inbox_asyncio(USER, "x", "localhost", args.messages, 200, state, filters=filters)
+            else:
+                rows = core.scan_inbox(USER, "x", "localhost", args.messages, 200, state, filters=filters)
+            elapsed = time.perf_counter() - started
+            if isinstance(rows, str):
+                raise SystemExit(f"{profile} {engine}: {rows}")
+            rows_by_engine[engine] = rows
+            stats = state["stats"]
+            searches = server.stats["by_command"].get("UID SEARCH", 0)
+            print(f"{profile:>8} {engine:>8} {str(stats['provider']):>8} {stats['mailbox']:<18} "
+                  f"{stats['fetched']:>8} {stats['in_scope']:>8} {server.stats['commands']:>6} {elapsed:>7.2f}")
+            if stats["provider"] != provider:
+                problems.append(f"{engine}: provider {stats['provider']} != {provider}")
+            if stats["mailbox"] != mailbox:
+                problems.append(f"{engine}: scanned {stats['mailbox']} != {mailbox}")
+            if not stats["server_filter"] or not searches:
+                problems.append(f"{engine}: server-side filter not used")
+            if {row["Email"] for row in rows} != subscribed:
+                problems.append(f"{engine}: {len(rows)} senders found, expected {len(subscribed)} from every message")
+        if rows_by_engine["threaded"] != rows_by_engine["asyncio"]:
+            problems.append("threaded and asyncio results differ")
+
+        # 只看搜索键: 通用服务器用 HEADER, Gmail 用 X-GM-RAW
+        criteria = core.filter_criteria("ALL", core.new_scan_state(), filters, provider)
+        if search_key not in criteria:
+            problems.append(f"search criteria {criteria!r} does not use {search_key}")
+
+        # 删除时不要求移到废纸篓: Gmail 仍然必须移到 Trash, 否则只是归档
+        targets = [row["Email"] for row in rows_by_engine["threaded"][:args.delete_senders]]
+        use_trash = profile == "outlook"
+        scanned = server.find_mailbox(mailbox)
+        before = len(scanned.messages)
+        success, message, counts = core.delete_emails(USER, "x", "localhost", targets, use_trash)
+        if not success:
+            raise SystemExit(f"{profile}: {message}")
+        removed = before - len(scanned.messages)
+        moved = len(server.find_mailbox(trash).messages) if trash else 0
+        print(f"{'':>8} {'delete':>8} {message}")
+        if removed != sum(counts.values()) or not removed:
+            problems.append(f"delete removed {removed} messages from {mailbox}, reported {sum(counts.values())}")
+        if trash and moved != removed:
+            problems.append(f"{moved} messages in {trash}, expected {removed}")
+    return [f"{profile}: {p}" for p in problems]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the Gmail / Outlook fast paths against fake servers")
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--senders", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--delete-senders", type=int, default=5)
+    args = parser.parse_args()
+
+    import mail_core as core
+
+    print(f"{'server':>8} {'engine':>8} {'provider':>8} {'mailbox':<18} {'fetched':>8} {'scope':>8} "
+          f"{'trips':>6} {'seconds':>7}")
+    failures = []
+    for profile in PROVIDER_PROFILES:
+        failures += run(core, profile, args)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import imaplib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_imap import AsyncIMAP
+from fake_imap import FakeIMAPServer, generate_mailbox
+
+# ==========================================
+# scan_inbox 批量大小 / 并行连接数 / 引擎基准测试
+# ==========================================
+
+OPEN_ASYNC = AsyncIMAP.open.__func__
+
+def use_fake_server(address):
+    host, port = address
+    imaplib.IMAP4_SSL = lambda *args, **kwargs: imaplib.IMAP4(host, port)
+    AsyncIMAP.open = classmethod(lambda cls, *args, **kwargs: OPEN_ASYNC(cls, host, port, ssl=False))
+
+def run(core, engine, messages, batch_size, concurrency):
+    if engine == "asyncio":
+        return core.scan_inbox_asyncio("bench@example.com", "x", "localhost", messages,
+                                      batch_size, max_in_flight=concurrency)
+    return core.scan_inbox("bench@example.com", "x", "localhost", messages,
+                          batch_size, pool_size=concurrency)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scan_inbox against a local fake IMAP server")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--senders", type=int, default=80)
+    parser.add_argument("--latency", type=float, default=0.02, help="Injected round-trip delay per IMAP command (s)")
+    parser.add_argument("--batch-sizes", default="1,50,200,500")
+    parser.add_argument("--engines", default="threaded")
+    parser.add_argument("--pool-sizes", default="1", help="Connections for the threaded engine")
+    parser.add_argument("--in-flight", default="8", help="Pipelined FETCH commands for the asyncio engine")
+    args = parser.parse_args()
+
+    import mail_core as core
+
+    box = generate_mailbox(args.messages, senders=args.senders)
+    with FakeIMAPServer(box, latency=args.latency) as server:
+        use_fake_server(server.address)
+        print(f"{args.messages} messages, {args.latency * 1000:.0f} ms per command")
+        print(f"{'engine':>9} {'batch':>6} {'conc':>5} {'seconds':>9} {'commands':>9} {'senders':>8} {'speedup':>8}")
+        baseline = None
+        expected = None
+        for engine in args.engines.split(","):
+            levels = args.in_flight if engine == "asyncio" else args.pool_sizes
+            for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+                for concurrency in [int(c) for c in levels.split(",")]:
+                    server.reset_stats()
+                    started = time.perf_counter()
+                    rows = run(core, engine, args.messages, batch_size, concurrency)
+                    elapsed = time.perf_counter() - started
+                    if isinstance(rows, str):
+                        raise SystemExit(rows)
+                    # 不同配置的结果必须完全一致
+                    expected = expected or rows
+                    if rows != expected:
+                        raise SystemExit(f"result mismatch at {engine} batch={batch_size} conc={concurrency}")
+                    baseline = baseline or elapsed
+                    print(f"{engine:>9} {batch_size:>6} {concurrency:>5} {elapsed:>9.2f} "
+                          f"{server.stats['commands']:>9} {len(rows):>8} {baseline / elapsed:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_scan import use_fake_server
+from fake_imap import CAPABILITIES, FakeIMAPServer, FakeMailbox, FakeMessage, generate_mailbox
+
+# ==========================================
+# 离线基准测试套件: 扫描 / 增量扫描 / 删除
+# ==========================================
+# 假服务器运行在单独的进程里, 这样峰值内存只统计客户端, 服务器也不会和客户端抢 GIL。
+
+USER = "bench@example.com"
+SCAN_ENGINES = "threaded:1,threaded:4,asyncio:8,whole:1"
+DELETE_ENGINES = "threaded,asyncio"
+# none: 服务器不支持压缩; deflate: 服务器声明 COMPRESS=DEFLATE
+COMPRESSION_MODES = "none,deflate"
+QRESYNC_CAPABILITIES = ["ENABLE", "CONDSTORE", "QRESYNC"]
+
+class RemoteServer:
+    # 与子进程中的假服务器通信: 读取/重置统计, 删除测试前恢复邮箱
+    def __init__(self, messages, senders, encoded_ratio, latency):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=serve, args=(child, messages, senders, encoded_ratio, latency), daemon=True)
+        self.process.start()
+        self.address = self.conn.recv()
+
+    def call(self, command):
+        self.conn.send(command)
+        return self.conn.recv()
+
+    def stop(self):
+        self.call("stop")
+        self.process.join()
+
+def serve(conn, messages, senders, encoded_ratio, latency):
+    box = generate_mailbox(messages, senders=senders, encoded_ratio=encoded_ratio)
+    snapshot = [(m.uid, m.header, m.internaldate, m.size) for m in box.messages]
+    server = FakeIMAPServer(box, latency=latency).start()
+    conn.send(server.address)
+    while True:
+        command = conn.recv()
+        if command == "stats":
+            conn.send(server.stats)
+        elif command == "reset":
+            server.reset_stats()
+            conn.send(True)
+        elif isinstance(command, tuple) and command[0] == "capabilities":
+            server.capabilities = list(command[1])
+            conn.send(True)
+        elif command == "restore":
+            server.mailboxes = {"INBOX": FakeMailbox([FakeMessage(*m) for m in snapshot], box.uidvalidity)}
+            conn.send(True)
+        elif command == "stop":
+            server.stop()
+            conn.send(True)
+            return
+
+def measure(remote, func):
+    remote.call("reset")
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    stats = remote.call("stats")
+    return result, elapsed, stats
+
+def peak_memory(func):
+    # 单独在 tracemalloc 下重跑一次, tracemalloc 会明显拖慢计时
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def scan_func(core, engine, concurrency, messages, batch_size, state=None):
+    # whole: 整个邮箱模式, 批次自适应, 忽略 batch_size
+    if engine == "whole":
+        return lambda: core.scan_whole_inbox(USER, "x", "localhost", state)
+    if engine == "asyncio":
+        return lambda: core.scan_inbox_asyncio(USER, "x", "localhost", messages, batch_size, state,
+                                              max_in_flight=concurrency)
+    return lambda: core.scan_inbox(USER, "x", "localhost", messages, batch_size, state, pool_size=concurrency)
+
+def delete_func(core, engine, targets):
+    if engine == "asyncio":
+        return lambda: core.delete_emails_asyncio(USER, "x", "localhost", targets)
+    return lambda: core.delete_emails(USER, "x", "localhost", targets)
+
+def record(results, size, name, elapsed, count, stats, peak):
+    row = {
+        "messages": size,
+        "benchmark": name,
+        "seconds": round(elapsed, 4),
+        "messages_per_s": round(count / elapsed, 1) if elapsed else 0.0,
+        "round_trips": stats["commands"],
+        "bytes_out": stats["bytes_out"],
+        "peak_mib": round(peak / 2 ** 20, 2) if peak is not None else None,
+    }
+    results.append(row)
+    peak_text = f"{row['peak_mib']:>8.1f}" if peak is not None else f"{'-':>8}"
+    print(f"{size:>8} {name:<30} {row['seconds']:>8.2f} {row['messages_per_s']:>11,.0f} "
+          f"{row['round_trips']:>7} {row['bytes_out'] / 2 ** 20:>8.1f} {peak_text}", flush=True)
+
+def run_size(core, size, args, results):
+    remote = RemoteServer(size, args.senders, args.encoded_ratio, args.latency)
+    try:
+        use_fake_server(remote.address)
+        expected = None
+        for mode in args.compression.split(","):
+            capabilities = CAPABILITIES + (["COMPRESS=DEFLATE"] if mode == "deflate" else [])
+            remote.call(("capabilities", capabilities))
+            # 上一轮的删除测试改动了邮箱
+            remote.call("restore")
+            suffix = "" if mode == "none" else f" +{mode}"
+            expected = run_mode(core, size, args, results, remote, suffix, expected, capabilities)
+    finally:
+        remote.stop()
+
+def run_mode(core, size, args, results, remote, suffix, expected, capabilities):
+    for spec in args.scan_engines.split(","):
+        engine, concurrency = spec.split(":")
+        func = scan_func(core, engine, int(concurrency), size, args.batch_size)
+        rows, elapsed, stats = measure(remote, func)
+        if isinstance(rows, str):
+            raise SystemExit(rows)
+        # 不同引擎的结果必须一致
+        expected = expected or rows
+        if rows != expected:
+            raise SystemExit(f"scan result mismatch for {spec} at {size} messages")
+        peak = peak_memory(func) if args.memory else None
+        record(results, size, f"scan {spec}{suffix}", elapsed, size, stats, peak)
+
+    # 没有新邮件时的增量重扫
+    state = core.new_scan_state()
+    scan_func(core, "threaded", 1, size, args.batch_size, state)()
+    func = scan_func(core, "threaded", 1, size, args.batch_size, state)
+    _, elapsed, stats = measure(remote, func)
+    record(results, size, f"rescan (no new mail){suffix}", elapsed, size, stats,
+           peak_memory(func) if args.memory else None)
+
+    # 另一个客户端删除了部分发件人之后重扫: 服务器支持 QRESYNC 时只取消失的 UID, 不重新下载头部
+    targets = [row["Email"] for row in expected[:args.delete_senders]]
+    remote.call(("capabilities", capabilities + QRESYNC_CAPABILITIES))
+    state = core.new_scan_state()
+    scan_func(core, "threaded", 1, size, args.batch_size, state)()
+    core.delete_emails(USER, "x", "localhost", targets)
+    func = scan_func(core, "threaded", 1, size, args.batch_size, state)
+    rows, elapsed, stats = measure(remote, func)
+    if rows != scan_func(core, "threaded", 1, size, args.batch_size)():
+        raise SystemExit(f"rescan after delete does not match a full scan at {size} messages")
+    record(results, size, f"rescan (after delete){suffix}", elapsed, size, stats,
+           peak_memory(func) if args.memory else None)
+    remote.call(("capabilities", capabilities))
+    remote.call("restore")
+
+    for engine in args.delete_engines.split(","):
+        remote.call("restore")
+        result, elapsed, stats = measure(remote, delete_func(core, engine, targets))
+        success, message, counts = result
+        if not success:
+            raise SystemExit(message)
+        peak = None
+        if args.memory:
+            remote.call("restore")
+            peak = peak_memory(delete_func(core, engine, targets))
+        record(results, size, f"delete {engine}{suffix}", elapsed, sum(counts.values()), stats, peak)
+    return expected
+
+def wire_summary(results):
+    # 同一基准测试开启压缩前后的线路字节数
+    plain = {(r["messages"], r["benchmark"]): r for r in results}
+    for row in results:
+        name, _, mode = row["benchmark"].rpartition(" +")
+        old = plain.get((row["messages"], name)) if name else None
+        if old is None or not old["bytes_out"]:
+            continue
+        change = row["bytes_out"] / old["bytes_out"] - 1
+        print(f"{row['messages']:>8} {name:<30} {old['bytes_out'] / 2 ** 20:>8.2f} -> "
+              f"{row['bytes_out'] / 2 ** 20:>6.2f} MiB on the wire with {mode} ({change:+.0%})")
+
+def compare(results, baseline, tolerance):
+    # 同一配置下: 往返次数不能变多, 吞吐量下降不能超过 tolerance
+    failures = []
+    previous = {(r["messages"], r["benchmark"]): r for r in baseline}
+    for row in results:
+        old = previous.get((row["messages"], row["benchmark"]))
+        if not old:
+            continue
+        if row["round_trips"] > old["round_trips"]:
+            failures.append(f"{row['benchmark']} @ {row['messages']}: round trips "
+                            f"{old['round_trips']} -> {row['round_trips']}")
+        if row["messages_per_s"] < old["messages_per_s"] * (1 - tolerance):
+            failures.append(f"{row['benchmark']} @ {row['messages']}: messages/s "
+                            f"{old['messages_per_s']:,.0f} -> {row['messages_per_s']:,.0f}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scan/delete benchmark suite against a fake IMAP server")
+    parser.add_argument("--sizes", default="1000,10000", help="Mailbox sizes, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--senders", type=int, default=200, help="Distinct senders per mailbox")
+    parser.add_argument("--encoded-ratio", type=float, default=0.2, help="Share of RFC 2047 encoded sender names")
+    parser.add_argument("--latency", type=float, default=0.02, help="Injected round-trip delay per IMAP command (s)")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--scan-engines", default=SCAN_ENGINES,
+                        help="engine:concurrency list; whole:1 is the entire-mailbox mode")
+    parser.add_argument("--delete-engines", default=DELETE_ENGINES)
+    parser.add_argument("--delete-senders", type=int, default=10)
+    parser.add_argument("--compression", default=COMPRESSION_MODES,
+                        help="Run everything with and without COMPRESS=DEFLATE offered (none,deflate)")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the tracemalloc pass")
+    parser.add_argument("--save", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Baseline JSON report; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed messages/s drop vs baseline")
+    args = parser.parse_args()
+
+    import mail_core as core
+
+    print(f"{args.senders} senders, {args.latency * 1000:.0f} ms per command, batch {args.batch_size}")
+    print(f"{'messages':>8} {'benchmark':<30} {'seconds':>8} {'messages/s':>11} "
+          f"{'trips':>7} {'MiB out':>8} {'peak MiB':>8}")
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        run_size(core, size, args, results)
+    if "deflate" in args.compression.split(","):
+        print()
+        wire_summary(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            failures = compare(results, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_scan import use_fake_server
+from fake_imap import FakeIMAPServer, generate_mailbox
+
+# ==========================================
+# 自适应限流: 服务器按每秒 FETCH 封数限流时, 固定设置 vs 自适应控制器
+# ==========================================
+# 固定的大批次 + 多连接很快被限流、扫描失败; 固定的小批次能完成但慢; 自适应应当完成, 结果正确, 并且比小批次快。
+# 整个邮箱模式同样应当完成。
+
+USER = "bench@example.com"
+
+# (名称, creds 中的设置, 是否应当完成)
+RUNS = [
+    ("fixed fast", {"batch_size": 500, "pool_size": 4}, False),
+    ("fixed careful", {"batch_size": 25, "pool_size": 1}, True),
+    ("adaptive", {"adaptive": True}, True),
+    ("adaptive", {"adaptive": True, "engine": "asyncio"}, True),
+    # 整个邮箱模式: 单连接, 被 NO 或 BYE 限流时也要暂停后从同一个区间继续
+    ("whole mailbox", {"adaptive": True, "limit": None}, True),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark adaptive throttling against a rate-limited fake server")
+    parser.add_argument("--messages", type=int, default=6000)
+    parser.add_argument("--senders", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--rate", type=int, default=4000, help="Headers per second the fake server allows")
+    parser.add_argument("--reply", choices=["no", "bye", "both"], default="both",
+                        help="Throttle with NO [THROTTLED], with BYE and a dropped connection, or both")
+    parser.add_argument("--delete-senders", type=int, default=10)
+    args = parser.parse_args()
+
+    import mail_core as core
+
+    # 服务商配置按服务器地址查找; 假服务器用一份暂停时间很短的配置, 基准测试不必等几秒
+    core.THROTTLE_PROFILES["localhost"] = {"batch": 100, "max_batch": 1000, "connections": 4, "in_flight": 8,
+                                           "cooldown": 0.2}
+    box = generate_mailbox(args.messages, senders=args.senders)
+    reference = core.parse_sender
+    subscribed = {reference(m.header)["Email"] for m in box.messages if reference(m.header)}
+    replies = ["no", "bye"] if args.reply == "both" else [args.reply]
+
+    print(f"{args.messages} messages, {args.latency * 1000:.0f} ms per command, "
+          f"server allows {args.rate} headers/s")
+    print(f"{'reply':>5} {'run':>14} {'engine':>8} {'seconds':>8} {'throttled':>9} {'batch':>6} {'conns':>5}  result")
+    failures = []
+    for reply in replies:
+        careful = None
+        for label, settings, should_finish in RUNS:
+            with FakeIMAPServer(box, args.latency, rate_limit=args.rate, throttle_reply=reply) as server:
+                use_fake_server(server.address)
+                creds = dict({"u": USER, "p": "x", "s": "localhost", "limit": args.messages,
+                              "engine": "threaded"}, **settings)
+                state = core.new_scan_state()
+                started = time.perf_counter()
+                rows = core.run_scan(creds, state)
+                elapsed = time.perf_counter() - started
+                stats = state["stats"]
+                finished = not isinstance(rows, str)
+                result = rows if not finished else f"{len(rows)} senders"
+                print(f"{reply:>5} {label:>14} {creds['engine']:>8} {elapsed:>8.2f} {server.stats['throttled']:>9} "
+                      f"{str(stats.get('batch_size', '-')):>6} {str(stats.get('connections', '-')):>5}  {result}")
+            name = f"{reply} {label} {creds['engine']}"
+            if finished != should_finish:
+                failures.append(f"{name}: {'finished' if finished else rows}")
+            elif finished and {row['Email'] for row in rows} != subscribed:
+                failures.append(f"{name}: {len(rows)} senders found, expected {len(subscribed)}")
+            elif not finished and "throttling" not in rows:
+                failures.append(f"{name}: error does not explain the throttling: {rows}")
+            if label == "fixed careful":
+                careful = elapsed
+            elif label == "adaptive" and finished and careful and elapsed > careful:
+                failures.append(f"{name}: {elapsed:.2f}s, slower than fixed careful settings ({careful:.2f}s)")
+
+        # 删除: 不需要打开自适应, 被限流时也应暂停后继续, 删完所有选中发件人的邮件
+        # 删除会改动邮箱, 用一份新生成的; 补取 FROM 的封数不多, 限得更紧才会被限流
+        doomed = generate_mailbox(args.messages, senders=args.senders)
+        targets = sorted(subscribed)[:args.delete_senders]
+        want = sum(1 for m in doomed.messages if (reference(m.header) or {}).get("Email") in targets)
+        with FakeIMAPServer(doomed, args.latency, rate_limit=args.rate // 20, throttle_reply=reply) as server:
+            use_fake_server(server.address)
+            creds = {"u": USER, "p": "x", "s": "localhost", "use_trash": False}
+            started = time.perf_counter()
+            success, message, counts = core.run_delete(creds, core.new_delete_job(targets))
+            print(f"{reply:>5} {'delete':>14} {'':>8} {time.perf_counter() - started:>8.2f} "
+                  f"{server.stats['throttled']:>9} {'':>6} {'':>5}  {message}")
+        left = sum(1 for m in doomed.messages if (reference(m.header) or {}).get("Email") in targets)
+        if not success or sum(counts.values()) != want or left:
+            failures.append(f"{reply} delete: {sum(counts.values())} of {want} emails deleted, {left} left")
+
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
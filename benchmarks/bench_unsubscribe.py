@@ -0,0 +1,114 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_unsubscribe import (FakeSMTPServer, FakeUnsubscribeServer, account_rows, client_context, expected_status,
+                              make_certificate, make_rows, reset_stand_ins)
+
+# ==========================================
+# 批量退订: 串行 vs 并发, 并检查每个主机的并发上限 / 连接复用 / 单个 SMTP 会话
+# ==========================================
+
+USER = "bench@example.com"
+
+def run(core, rows, servers, smtp, context, workers, per_host):
+    reset_stand_ins(servers, smtp)
+    started = time.perf_counter()
+    results = core.unsubscribe_senders(rows, USER, "x", smtp.address, workers=workers, per_host=per_host,
+                                       context=context)
+    return results, time.perf_counter() - started
+
+def run_accounts(core, rows, servers, smtp, context, workers, per_host):
+    # rows 来自 account_rows; 所有账户都从同一个 SMTP 替身发信
+    reset_stand_ins(servers, smtp)
+    accounts = [{"u": user, "p": "x", "smtp": smtp.address} for user in dict.fromkeys(row["Account"] for row in rows)]
+    started = time.perf_counter()
+    results = core.unsubscribe_accounts(rows, accounts, workers=workers, per_host=per_host, context=context)
+    return results, time.perf_counter() - started
+
+def check(rows, results, servers, smtp, per_host):
+    # 多账户时同一个发件人每个账户各有一条结果, 每个主机的并发上限对所有账户一起检查
+    problems = []
+    statuses = {(r.get("Account"), r["Email"]): r["Status"] for r in results}
+    if len(results) != len(rows) or set(statuses) != {(row.get("Account"), row["Email"]) for row in rows}:
+        problems.append(f"{len(results)} results for {len(rows)} senders")
+    for row in rows:
+        email = (row.get("Account"), row["Email"])
+        expected = expected_status(row)
+        if statuses.get(email) != expected:
+            problems.append(f"{email}: {statuses.get(email)} != {expected}")
+    for server in servers:
+        if server.stats["max_active"] > per_host:
+            problems.append(f"{server.netloc}: {server.stats['max_active']} concurrent requests > {per_host}")
+        if server.stats["connections"] > per_host:
+            problems.append(f"{server.netloc}: {server.stats['connections']} connections (keep-alive not reused)")
+        for path, body, content_type in server.requests:
+            if body != b"List-Unsubscribe=One-Click" or content_type != "application/x-www-form-urlencoded":
+                problems.append(f"{server.netloc}{path}: bad one-click request {body!r} {content_type!r}")
+    # 每个账户一个 SMTP 会话
+    sessions = len({row.get("Account") for row in rows if row["Mailto"] and not row["One-Click"]})
+    if smtp.stats["sessions"] != sessions:
+        problems.append(f"{smtp.stats['sessions']} SMTP sessions (expected {sessions})")
+    sent = sum(1 for row in rows if expected_status(row) == "Sent")
+    if len(smtp.messages) != sent:
+        problems.append(f"{len(smtp.messages)} unsubscribe emails delivered (expected {sent})")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the unsubscribe executor against local HTTPS/SMTP stand-ins")
+    parser.add_argument("--hosts", type=int, default=4, help="Distinct one-click hosts")
+    parser.add_argument("--one-click", type=int, default=120)
+    parser.add_argument("--mailto", type=int, default=30)
+    parser.add_argument("--manual", type=int, default=10)
+    parser.add_argument("--failing", type=int, default=3, help="One-click and mailto targets that fail")
+    parser.add_argument("--latency", type=float, default=0.05, help="Server delay per request / message (s)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--accounts", type=int, default=3, help="Accounts sharing the same senders (1 to skip)")
+    args = parser.parse_args()
+
+    import unsubscribe as core
+
+    certfile, keyfile = make_certificate()
+    context = client_context(certfile)
+    servers = [FakeUnsubscribeServer(certfile, keyfile, args.latency).start() for _ in range(args.hosts)]
+    smtp = FakeSMTPServer(args.latency).start()
+    try:
+        rows = make_rows(servers, args.one_click, args.mailto, args.manual, args.failing)
+        print(f"{len(rows)} senders: {args.one_click} one-click on {args.hosts} hosts, {args.mailto} mailto, "
+              f"{args.manual} manual, {args.latency * 1000:.0f} ms per request")
+        print(f"{'mode':>10} {'workers':>8} {'per host':>9} {'seconds':>8} {'connections':>12} {'smtp':>5}")
+        baseline = None
+        failures = []
+        for label, workers, per_host in (("serial", 1, 1), ("concurrent", args.workers, args.per_host)):
+            results, elapsed = run(core, rows, servers, smtp, context, workers, per_host)
+            baseline = baseline or elapsed
+            connections = sum(server.stats["connections"] for server in servers)
+            print(f"{label:>10} {workers:>8} {per_host:>9} {elapsed:>8.2f} {connections:>12} "
+                  f"{smtp.stats['sessions']:>5}  ({baseline / elapsed:.1f}x)")
+            failures += [f"{label}: {p}" for p in check(rows, results, servers, smtp, per_host)]
+        print(core.unsubscribe_summary(results))
+        if args.accounts > 1:
+            # 几个账户收到同一批发件人: 每个主机的并发上限和线程总数仍然对整个进程生效
+            multi = account_rows(rows, args.accounts)
+            results, elapsed = run_accounts(core, multi, servers, smtp, context, args.workers, args.per_host)
+            peak = max(server.stats["max_active"] for server in servers)
+            print(f"{args.accounts} accounts: {len(multi)} senders in {elapsed:.2f}s, "
+                  f"peak {peak} concurrent requests per host, {smtp.stats['sessions']} SMTP sessions")
+            failures += [f"accounts: {p}" for p in check(multi, results, servers, smtp, args.per_host)]
+            print(core.unsubscribe_summary(results))
+    finally:
+        for server in servers:
+            server.stop()
+        smtp.stop()
+
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
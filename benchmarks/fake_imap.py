@@ -0,0 +1,825 @@
+import bisect
+import io
+import random
+import re
+import socket
+import queue
+import socketserver
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from email.header import Header
+from email.utils import format_datetime
+
+# ==========================================
+# 本地假 IMAP 服务器 (仅用于离线基准测试和 tests/ 中的测试)
+# ==========================================
+
+CAPABILITIES = ["IMAP4rev1", "UIDPLUS", "MOVE"]
+GMAIL_CAPABILITIES = CAPABILITIES + ["X-GM-EXT-1"]
+GREETING = "Fake IMAP server ready"
+OUTLOOK_GREETING = "The Microsoft Exchange IMAP4 service is ready."
+COMPRESS_RE = re.compile(r"^\S+ COMPRESS DEFLATE$", re.I)
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+class FakeMessage:
+    def __init__(self, uid, header, internaldate, size=None):
+        self.uid = uid
+        self.header = header
+        self.internaldate = internaldate
+        self.size = size if size is not None else len(header) + 2048
+        self.flags = set()
+        self.modseq = 1
+        # Gmail 分类 (X-GM-RAW "category:..." 搜索用)
+        self.category = None
+        self.values = None
+
+    def header_fields(self, names):
+        # 只返回请求的字段, 保留折行
+        wanted = {n.upper() for n in names}
+        out = []
+        keep = False
+        for line in self.header.split(b"\r\n"):
+            if not line:
+                continue
+            if line[:1] in (b" ", b"\t"):
+                if keep:
+                    out.append(line)
+                continue
+            name = line.split(b":", 1)[0].decode("ascii", "ignore").upper()
+            keep = name in wanted
+            if keep:
+                out.append(line)
+        return b"\r\n".join(out) + b"\r\n\r\n"
+
+    def header_value(self, name):
+        if self.values is None:
+            # 第一次搜索时解析一次并缓存, 展开折行
+            self.values = {}
+            for line in self.header.replace(b"\r\n ", b" ").replace(b"\r\n\t", b" ").split(b"\r\n"):
+                key, sep, rest = line.partition(b":")
+                if sep:
+                    self.values.setdefault(key.decode("ascii", "ignore").lower(),
+                                           rest.decode("utf-8", "ignore").strip())
+        return self.values.get(name.lower())
+
+class FakeMailbox:
+    def __init__(self, messages=None, uidvalidity=1, special_use=None):
+        self.messages = list(messages or [])
+        self.uidvalidity = uidvalidity
+        self.special_use = special_use
+        self.uidnext = (self.messages[-1].uid + 1) if self.messages else 1
+        # CONDSTORE / QRESYNC: 每次新增 / 改标记 / 删除都推进 modseq, 删除的 UID 留下记录供 VANISHED 使用
+        self.highestmodseq = max((m.modseq for m in self.messages), default=1)
+        self.vanished = []
+
+    def bump(self):
+        self.highestmodseq += 1
+        return self.highestmodseq
+
+    def append(self, header, internaldate=None, size=None):
+        msg = FakeMessage(self.uidnext, header, internaldate or datetime.now(timezone.utc), size)
+        msg.modseq = self.bump()
+        self.messages.append(msg)
+        self.uidnext += 1
+        return msg
+
+    def remove(self, keep):
+        # 一次重建列表, 返回被删除的 [(序号, 邮件)]
+        removed = [(seq, m) for seq, m in enumerate(self.messages, 1) if not keep(m)]
+        if removed:
+            self.messages = [m for m in self.messages if keep(m)]
+            modseq = self.bump()
+            self.vanished.extend((m.uid, modseq) for seq, m in removed)
+        return removed
+
+def make_header(sender_name, sender_email, date, unsubscribe=None, encoded=False, extra=()):
+    if encoded:
+        from_value = f'{Header(sender_name, "utf-8").encode()} <{sender_email}>'
+    else:
+        from_value = f'"{sender_name}" <{sender_email}>'
+    lines = [
+        f"From: {from_value}",
+        "To: someone@example.com",
+        f"Subject: Update from {sender_email.split('@')[1]}",
+        f"Date: {format_datetime(date)}",
+    ]
+    if unsubscribe:
+        lines.append(f"List-Unsubscribe: {unsubscribe}")
+    lines.extend(extra)
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+def generate_mailbox(count, senders=50, newsletter_ratio=0.6, encoded_ratio=0.2, seed=0, uidvalidity=1):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    pool = []
+    for i in range(senders):
+        domain = f"news{i}.example.com"
+        is_newsletter = rng.random() < newsletter_ratio
+        unsub = None
+        extra = ()
+        if is_newsletter:
+            style = rng.randrange(3)
+            if style == 0:
+                unsub = f"<https://{domain}/unsubscribe?id={i}>"
+            elif style == 1:
+                unsub = f"<mailto:leave-{i}@{domain}>"
+            else:
+                unsub = f"<mailto:leave-{i}@{domain}>,\r\n <https://{domain}/u/{i}>"
+            # 一半带 https 链接的发件人支持 RFC 8058 一键退订 (不额外消耗随机数, 邮箱内容保持不变)
+            if style != 1 and i % 2 == 0:
+                extra = ("List-Unsubscribe-Post: List-Unsubscribe=One-Click",)
+        name = f"Sender {i}" if rng.random() >= encoded_ratio else f"发件人 {i}"
+        # 订阅邮件都在推广分类里, 另有一部分没有退订头部的发件人也被归入推广
+        category = "promotions" if unsub or i % 5 == 1 else "primary"
+        pool.append((name, f"hello@{domain}", unsub, not name.isascii(), extra, category))
+
+    box = FakeMailbox(uidvalidity=uidvalidity)
+    for n in range(count):
+        name, addr, unsub, encoded, extra, category = pool[rng.randrange(len(pool))]
+        date = start + timedelta(minutes=n * 7)
+        msg = box.append(make_header(name, addr, date, unsub, encoded, extra), date, rng.randrange(2000, 80000))
+        msg.category = category
+    return box
+
+def copy_message(msg, uid):
+    copy = FakeMessage(uid, msg.header, msg.internaldate, msg.size)
+    copy.category = msg.category
+    return copy
+
+def gmail_mailboxes(box, archived_every=3):
+    # Gmail 的文件夹布局: box 作为 "所有邮件"; 每 archived_every 封中有一封已归档, 不在收件箱里
+    inbox = FakeMailbox(uidvalidity=box.uidvalidity + 1)
+    for msg in box.messages:
+        if msg.uid % archived_every:
+            inbox.messages.append(copy_message(msg, len(inbox.messages) + 1))
+    inbox.uidnext = len(inbox.messages) + 1
+    return {
+        "INBOX": inbox,
+        "[Gmail]/All Mail": FakeMailbox(box.messages, box.uidvalidity, special_use="\\All"),
+        "[Gmail]/Trash": FakeMailbox(uidvalidity=box.uidvalidity + 2, special_use="\\Trash"),
+        "[Gmail]/Spam": FakeMailbox(uidvalidity=box.uidvalidity + 3, special_use="\\Junk"),
+    }
+
+def outlook_mailboxes(box):
+    # Outlook 的文件夹名, 不带 SPECIAL-USE 标记
+    return {
+        "INBOX": box,
+        "Archive": FakeMailbox(uidvalidity=box.uidvalidity + 1),
+        "Deleted Items": FakeMailbox(uidvalidity=box.uidvalidity + 2),
+        "Junk Email": FakeMailbox(uidvalidity=box.uidvalidity + 3),
+    }
+
+# 每种服务商的假服务器上应该扫描的文件夹、服务器端过滤用的搜索键、删除后邮件所在的文件夹 (None 为直接删除)
+# {名称: (识别出的服务商, 扫描的文件夹, 搜索键, 废纸篓)}
+PROVIDER_PROFILES = {
+    "generic": (None, "INBOX", "HEADER", None),
+    "gmail": ("gmail", "[Gmail]/All Mail", "X-GM-RAW", "[Gmail]/Trash"),
+    "outlook": ("outlook", "INBOX", "HEADER", "Deleted Items"),
+}
+
+def provider_mailboxes(profile, box):
+    # 返回 (文件夹, FakeIMAPServer 的其他参数), 模拟 PROVIDER_PROFILES 中的一种服务器
+    if profile == "gmail":
+        return gmail_mailboxes(box), {"capabilities": GMAIL_CAPABILITIES}
+    if profile == "outlook":
+        return outlook_mailboxes(box), {"greeting": OUTLOOK_GREETING}
+    return box, {}
+
+def filed_mailboxes(box):
+    # 服务器规则把推广邮件分到 Newsletters 和垃圾邮件里, 同一个发件人的邮件分散在几个文件夹中;
+    # 另有不该扫描的已发送 / 废纸篓和默认不选的 Archive
+    folders = {
+        "INBOX": FakeMailbox(uidvalidity=box.uidvalidity),
+        "INBOX/Newsletters": FakeMailbox(uidvalidity=box.uidvalidity + 1),
+        "Spam": FakeMailbox(uidvalidity=box.uidvalidity + 2, special_use="\\Junk"),
+        "Archive": FakeMailbox(uidvalidity=box.uidvalidity + 3),
+        "Sent": FakeMailbox(uidvalidity=box.uidvalidity + 4, special_use="\\Sent"),
+        "Trash": FakeMailbox(uidvalidity=box.uidvalidity + 5, special_use="\\Trash"),
+    }
+    for msg in box.messages:
+        name = "INBOX"
+        if msg.category == "promotions":
+            name = {0: "Spam", 1: "INBOX/Newsletters", 2: "INBOX/Newsletters"}.get(msg.uid % 4, "INBOX")
+        target = folders[name]
+        target.messages.append(copy_message(msg, len(target.messages) + 1))
+    for target in folders.values():
+        target.uidnext = len(target.messages) + 1
+    return folders
+
+# ==========================================
+# 协议解析
+# ==========================================
+
+def tokenize(text):
+    # 把命令参数拆成 token, 括号列表变成嵌套 list, [] 内的内容算作同一个 atom
+    tokens, stack = [], []
+    current = tokens
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == " ":
+            i += 1
+        elif c == "(":
+            stack.append(current)
+            current.append([])
+            current = current[-1]
+            i += 1
+        elif c == ")":
+            current = stack.pop()
+            i += 1
+        elif c == '"':
+            j = i + 1
+            buf = []
+            while text[j] != '"':
+                if text[j] == "\\":
+                    j += 1
+                buf.append(text[j])
+                j += 1
+            current.append(("str", "".join(buf)))
+            i = j + 1
+        else:
+            j = i
+            depth = 0
+            while j < len(text):
+                if text[j] == "[":
+                    depth += 1
+                elif text[j] == "]":
+                    depth -= 1
+                elif depth == 0 and text[j] in " ()":
+                    break
+                j += 1
+            current.append(text[i:j])
+            i = j
+    return tokens
+
+def value(token):
+    return token[1] if isinstance(token, tuple) else token
+
+def seq_ranges(spec, largest):
+    # "1:5,9,12:*" -> [(1, 5), (9, 9), (12, largest)]
+    ranges = []
+    for part in spec.split(","):
+        if ":" in part:
+            a, b = part.split(":")
+            a = largest if a == "*" else int(a)
+            b = largest if b == "*" else int(b)
+            ranges.append((min(a, b), max(a, b)))
+        else:
+            n = largest if part == "*" else int(part)
+            ranges.append((n, n))
+    return ranges
+
+def parse_seq_set(spec, largest):
+    # 序列集 -> 判断函数
+    ranges = seq_ranges(spec, largest)
+    return lambda n: any(a <= n <= b for a, b in ranges)
+
+def uid_set_text(uids):
+    # 升序的 UID 列表 -> "3:5,9"
+    parts = []
+    for uid in uids:
+        if parts and parts[-1][1] == uid - 1:
+            parts[-1][1] = uid
+        else:
+            parts.append([uid, uid])
+    return ",".join(f"{a}:{b}" if a != b else str(a) for a, b in parts)
+
+def gmail_query(query):
+    # X-GM-RAW 只支持 "a OR b" 形式; 假服务器没有正文, 以 List-Unsubscribe 头部代替正文中的 "unsubscribe"
+    terms = []
+    for term in query.split(" OR "):
+        term = term.strip().lower()
+        if term.startswith("category:"):
+            category = term[len("category:"):]
+            terms.append(lambda m, category=category: m.category == category)
+        elif term.startswith("from:"):
+            needle = term[len("from:"):]
+            terms.append(lambda m, needle=needle: needle in (m.header_value("From") or "").lower())
+        elif term == "unsubscribe":
+            terms.append(lambda m: m.header_value("List-Unsubscribe") is not None)
+        else:
+            raise ValueError(f"unsupported X-GM-RAW term {term}")
+    return lambda m: any(t(m) for t in terms)
+
+def parse_imap_date(text):
+    day, mon, year = text.split("-")
+    return datetime(int(year), MONTHS.index(mon.capitalize()) + 1, int(day), tzinfo=timezone.utc)
+
+def format_internaldate(date):
+    return date.strftime("%d-") + MONTHS[date.month - 1] + date.strftime("-%Y %H:%M:%S +0000")
+
+SEQ_SET_RE = re.compile(r"^[\d*:,]+$")
+
+def build_search(tokens, box):
+    # 返回 (predicate, rest), predicate(seq, msg) -> bool
+    key = tokens[0]
+    rest = tokens[1:]
+    if isinstance(key, list):
+        preds = []
+        while key:
+            pred, key = build_search(key, box)
+            preds.append(pred)
+        return (lambda s, m: all(p(s, m) for p in preds)), rest
+    key = value(key)
+    upper = key.upper()
+    if upper == "ALL":
+        return (lambda s, m: True), rest
+    if upper == "UID":
+        largest = box.messages[-1].uid if box.messages else 0
+        match = parse_seq_set(value(rest[0]), largest)
+        return (lambda s, m: match(m.uid)), rest[1:]
+    if upper == "FROM":
+        needle = value(rest[0]).lower()
+        return (lambda s, m: needle in (m.header_value("From") or "").lower()), rest[1:]
+    if upper == "HEADER":
+        field, needle = value(rest[0]), value(rest[1]).lower()
+        return (lambda s, m: m.header_value(field) is not None
+                and needle in m.header_value(field).lower()), rest[2:]
+    if upper == "SINCE":
+        day = parse_imap_date(value(rest[0]))
+        return (lambda s, m: m.internaldate >= day), rest[1:]
+    if upper == "BEFORE":
+        day = parse_imap_date(value(rest[0]))
+        return (lambda s, m: m.internaldate < day), rest[1:]
+    if upper == "X-GM-RAW":
+        pred = gmail_query(value(rest[0]))
+        return (lambda s, m: pred(m)), rest[1:]
+    if upper == "DELETED":
+        return (lambda s, m: "\\Deleted" in m.flags), rest
+    if upper == "UNDELETED":
+        return (lambda s, m: "\\Deleted" not in m.flags), rest
+    if upper == "NOT":
+        pred, rest = build_search(rest, box)
+        return (lambda s, m: not pred(s, m)), rest
+    if upper == "OR":
+        left, rest = build_search(rest, box)
+        right, rest = build_search(rest, box)
+        return (lambda s, m: left(s, m) or right(s, m)), rest
+    if SEQ_SET_RE.match(key):
+        match = parse_seq_set(key, len(box.messages))
+        return (lambda s, m: match(s)), rest
+    raise ValueError(f"unsupported search key {key}")
+
+# ==========================================
+# 服务器
+# ==========================================
+
+class BadCommand(Exception):
+    pass
+
+class InflateReader(io.RawIOBase):
+    # COMPRESS=DEFLATE 之后客户端发来的数据需要先解压
+    def __init__(self, source):
+        self.source = source
+        self.inflater = zlib.decompressobj(wbits=-15)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            data = self.inflater.unconsumed_tail or self.source.read1(65536)
+            if not data:
+                return 0
+            out = self.inflater.decompress(data, len(buffer))
+            if out:
+                buffer[:len(out)] = out
+                return len(out)
+
+class FakeIMAPHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.box = None
+        self.selected = None
+        self.user = None
+        self.mailboxes = self.server.mailboxes
+        self.write_lock = threading.Lock()
+        self.incoming = queue.Queue()
+        self.deflate = None
+        self.compress_handled = threading.Event()
+        self.condstore = False
+        self.qresync = False
+
+    def finish(self):
+        # 先关闭套接字, 让阻塞在 readline 上的读线程退出
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.compress_handled.set()
+        if self.user is not None:
+            self.server.logout(self.user)
+        super().finish()
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self.write_lock:
+            # bytes_out 是线路上的字节数 (压缩后), bytes_out_raw 是压缩前的字节数
+            self.server.stats["bytes_out_raw"] += len(data)
+            if self.deflate is not None:
+                data = self.deflate.compress(data) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+            self.server.stats["bytes_out"] += len(data)
+            self.wfile.write(data)
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        # 处理同步字面量 {n}
+        while True:
+            match = re.search(rb"\{(\d+)\}\r\n$", line)
+            if not match:
+                break
+            self.send("+ Ready\r\n")
+            literal = self.rfile.read(int(match.group(1)))
+            line = line[:match.start()] + b'"' + literal.replace(b'"', b'\\"') + b'"' + self.rfile.readline()
+        with self.server.lock:
+            self.server.stats["bytes_in"] += len(line)
+        return line.decode("utf-8", "ignore").rstrip("\r\n")
+
+    def read_loop(self):
+        # 单独的线程读取命令并记录到达时间, 这样流水线发送的命令能按真实到达时间计算延迟
+        while True:
+            try:
+                line = self.read_command()
+            except (OSError, ValueError):
+                line = None
+            self.incoming.put((time.monotonic(), line))
+            if line is None:
+                return
+            if COMPRESS_RE.match(line):
+                # 等命令处理完再读下一行: 接受后客户端发来的都是压缩数据
+                self.compress_handled.wait()
+                if self.deflate is not None:
+                    self.rfile = io.BufferedReader(InflateReader(self.rfile))
+
+    def handle(self):
+        self.send(f"* OK {self.server.greeting}\r\n")
+        threading.Thread(target=self.read_loop, daemon=True).start()
+        handled = 0
+        while True:
+            arrived, line = self.incoming.get()
+            if line is None:
+                break
+            handled += 1
+            if self.server.drop_after and handled > self.server.drop_after:
+                break
+            tag, _, rest = line.partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            uid = False
+            if command == "UID":
+                uid = True
+                command, _, args = args.partition(" ")
+                command = command.upper()
+            name = ("UID " if uid else "") + command
+            with self.server.lock:
+                self.server.stats["commands"] += 1
+                self.server.stats["by_command"][name] = self.server.stats["by_command"].get(name, 0) + 1
+            # 延迟按往返时间计算: 流水线中已到达的命令不必逐条等待
+            delay = arrived + self.server.latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            handler = getattr(self, "do_" + command, None)
+            if handler is None:
+                self.send(f"{tag} BAD unknown command {command}\r\n")
+                continue
+            try:
+                with self.server.lock:
+                    done = handler(tag, tokenize(args), uid)
+            except (BadCommand, ValueError, IndexError, AttributeError) as e:
+                self.send(f"{tag} BAD {e}\r\n")
+                continue
+            if done:
+                break
+
+    def ok(self, tag, text="completed"):
+        self.send(f"{tag} OK {text}\r\n")
+
+    def do_CAPABILITY(self, tag, args, uid):
+        self.send("* CAPABILITY " + " ".join(self.server.capabilities) + "\r\n")
+        self.ok(tag)
+
+    def do_NOOP(self, tag, args, uid):
+        self.ok(tag)
+
+    def do_LOGIN(self, tag, args, uid):
+        # 不检查密码; 配置了多个用户时按用户名选择邮箱
+        if self.user is None:
+            self.user = value(args[0]).lower()
+            self.mailboxes = self.server.login(self.user)
+        self.ok(tag, "LOGIN completed")
+
+    def find_mailbox(self, name):
+        for key, box in self.mailboxes.items():
+            if key.upper() == name.upper():
+                return box
+        return None
+
+    def do_COMPRESS(self, tag, args, uid):
+        try:
+            if "COMPRESS=DEFLATE" not in self.server.capabilities or value(args[0]).upper() != "DEFLATE":
+                self.send(f"{tag} BAD compression not supported\r\n")
+            elif self.deflate is not None:
+                self.send(f"{tag} NO [COMPRESSIONACTIVE] already compressing\r\n")
+            else:
+                self.ok(tag, "DEFLATE active")
+                with self.write_lock:
+                    self.deflate = zlib.compressobj(wbits=-15)
+        finally:
+            self.compress_handled.set()
+
+    def do_ENABLE(self, tag, args, uid):
+        # QRESYNC 同时开启 CONDSTORE (RFC 7162)
+        enabled = [n for n in (value(a).upper() for a in args)
+                   if n in ("CONDSTORE", "QRESYNC") and n in self.server.capabilities]
+        self.condstore = self.condstore or bool(enabled)
+        self.qresync = self.qresync or "QRESYNC" in enabled
+        self.send("* ENABLED" + "".join(" " + n for n in enabled) + "\r\n")
+        self.ok(tag, "ENABLE completed")
+
+    def do_LOGOUT(self, tag, args, uid):
+        self.send("* BYE logging out\r\n")
+        self.ok(tag)
+        return True
+
+    def do_SELECT(self, tag, args, uid):
+        name = value(args[0])
+        box = self.find_mailbox(name)
+        if box is None:
+            self.send(f"{tag} NO no such mailbox\r\n")
+            return
+        self.box = box
+        self.selected = name
+        self.send(f"* {len(box.messages)} EXISTS\r\n* 0 RECENT\r\n")
+        self.send(f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid\r\n")
+        self.send(f"* OK [UIDNEXT {box.uidnext}] next UID\r\n")
+        if self.condstore:
+            self.send(f"* OK [HIGHESTMODSEQ {box.highestmodseq}] modseq\r\n")
+        self.ok(tag, "[READ-WRITE] SELECT completed")
+
+    do_EXAMINE = do_SELECT
+
+    def require_selected(self):
+        if self.box is None:
+            raise BadCommand("no mailbox selected")
+
+    def do_SEARCH(self, tag, args, uid):
+        self.require_selected()
+        if "X-GM-EXT-1" not in self.server.capabilities and "X-GM-RAW" in str(args).upper():
+            raise BadCommand("unknown search key X-GM-RAW")
+        if args and not isinstance(args[0], list) and value(args[0]).upper() == "CHARSET":
+            args = args[2:]
+        preds = []
+        while args:
+            pred, args = build_search(args, self.box)
+            preds.append(pred)
+        hits = [(seq, m) for seq, m in enumerate(self.box.messages, 1) if all(p(seq, m) for p in preds)]
+        ids = [str(m.uid if uid else seq) for seq, m in hits]
+        self.send("* SEARCH" + "".join(" " + i for i in ids) + "\r\n")
+        self.ok(tag, "SEARCH completed")
+
+    def select_messages(self, spec, uid):
+        # 邮件按 UID 升序存放, 每个区间二分查找, 不必遍历整个邮箱
+        messages = self.box.messages
+        if uid:
+            largest = messages[-1].uid if messages else 0
+            spans = [(bisect.bisect_left(messages, a, key=lambda m: m.uid),
+                      bisect.bisect_right(messages, b, key=lambda m: m.uid))
+                     for a, b in seq_ranges(spec, largest)]
+        else:
+            spans = [(a - 1, b) for a, b in seq_ranges(spec, len(messages))]
+        selected = sorted({i for start, end in spans for i in range(max(start, 0), min(end, len(messages)))})
+        return [(i + 1, messages[i]) for i in selected]
+
+    def remove_messages(self, keep):
+        # 按序号从大到小发送 EXPUNGE, 这样每条响应中的序号都是有效的; 开启 QRESYNC 后改为一条 VANISHED
+        removed = self.box.remove(keep)
+        if self.qresync:
+            if removed:
+                self.send(f"* VANISHED {uid_set_text([m.uid for seq, m in removed])}\r\n")
+            return
+        for seq, m in reversed(removed):
+            self.send(f"* {seq} EXPUNGE\r\n")
+
+    def fetch_items(self, msg, items, uid):
+        items = [value(i) if not isinstance(i, list) else i for i in items]
+        names = [i.upper() for i in items if isinstance(i, str)]
+        if uid and "UID" not in names:
+            items = ["UID"] + items
+        parts = []
+        literal = None
+        for item in items:
+            upper = item.upper()
+            if upper == "UID":
+                parts.append(f"UID {msg.uid}")
+            elif upper == "FLAGS":
+                parts.append("FLAGS (" + " ".join(sorted(msg.flags)) + ")")
+            elif upper == "RFC822.SIZE":
+                parts.append(f"RFC822.SIZE {msg.size}")
+            elif upper == "INTERNALDATE":
+                parts.append(f'INTERNALDATE "{format_internaldate(msg.internaldate)}"')
+            elif upper.startswith("BODY"):
+                section = item[item.index("["):]
+                inner = section[1:-1]
+                if inner.upper().startswith("HEADER.FIELDS"):
+                    fields = inner[inner.index("(") + 1:inner.index(")")].split()
+                    body = msg.header_fields(fields)
+                elif inner.upper() == "HEADER":
+                    body = msg.header + b"\r\n"
+                else:
+                    body = msg.header + b"\r\n"
+                literal = (f"BODY{section}", body)
+            else:
+                raise BadCommand(f"unsupported fetch item {item}")
+        return parts, literal
+
+    def do_FETCH(self, tag, args, uid):
+        self.require_selected()
+        spec = value(args[0])
+        items = args[1] if isinstance(args[1], list) else args[1:]
+        # 修饰符 (CHANGEDSINCE n VANISHED): 只返回 modseq 更大的邮件, 并先列出之后消失的 UID
+        modifiers = []
+        if isinstance(args[1], list) and len(args) > 2 and isinstance(args[2], list):
+            modifiers = [value(m).upper() for m in args[2]]
+        since = int(modifiers[modifiers.index("CHANGEDSINCE") + 1]) if "CHANGEDSINCE" in modifiers else None
+        if since is not None and not self.condstore:
+            raise BadCommand("CHANGEDSINCE needs CONDSTORE")
+        if "VANISHED" in modifiers:
+            if not (uid and self.qresync and since is not None):
+                raise BadCommand("VANISHED needs UID FETCH, CHANGEDSINCE and QRESYNC")
+            ranges = seq_ranges(spec, self.box.uidnext - 1)
+            gone = sorted(u for u, modseq in self.box.vanished
+                          if modseq > since and any(a <= u <= b for a, b in ranges))
+            if gone:
+                self.send(f"* VANISHED (EARLIER) {uid_set_text(gone)}\r\n")
+        selected = self.select_messages(spec, uid)
+        if not self.server.take(len(selected)):
+            if self.server.throttle_reply == "bye":
+                self.send("* BYE [UNAVAILABLE] Too many requests, try again later\r\n")
+                return True
+            self.send(f"{tag} NO [THROTTLED] Request is throttled. Try again later.\r\n")
+            return
+        for seq, msg in selected:
+            if since is not None and msg.modseq <= since:
+                continue
+            parts, literal = self.fetch_items(msg, items, uid)
+            if since is not None:
+                parts.append(f"MODSEQ ({msg.modseq})")
+            head = f"* {seq} FETCH (" + " ".join(parts)
+            if literal:
+                name, body = literal
+                head += (" " if parts else "") + f"{name} {{{len(body)}}}\r\n"
+                self.send(head.encode("utf-8") + body + b")\r\n")
+            else:
+                self.send(head + ")\r\n")
+        self.ok(tag, "FETCH completed")
+
+    def do_STORE(self, tag, args, uid):
+        self.require_selected()
+        spec, mode = value(args[0]), value(args[1]).upper()
+        flags = args[2] if isinstance(args[2], list) else args[2:]
+        flags = {value(f) for f in flags}
+        for seq, msg in self.select_messages(spec, uid):
+            before = set(msg.flags)
+            if mode.startswith("+"):
+                msg.flags |= flags
+            elif mode.startswith("-"):
+                msg.flags -= flags
+            else:
+                msg.flags = set(flags)
+            if msg.flags != before:
+                msg.modseq = self.box.bump()
+            if not mode.endswith(".SILENT"):
+                extra = f"UID {msg.uid} " if uid else ""
+                self.send(f"* {seq} FETCH ({extra}FLAGS (" + " ".join(sorted(msg.flags)) + "))\r\n")
+        self.ok(tag, "STORE completed")
+
+    def expunge(self, only=None):
+        # only: UID EXPUNGE 限定的 UID 集合
+        self.remove_messages(lambda m: "\\Deleted" not in m.flags or (only is not None and m.uid not in only))
+
+    def do_EXPUNGE(self, tag, args, uid):
+        self.require_selected()
+        only = None
+        if uid:
+            only = {m.uid for seq, m in self.select_messages(value(args[0]), True)}
+        self.expunge(only)
+        self.ok(tag, "EXPUNGE completed")
+
+    def do_LIST(self, tag, args, uid):
+        for name, box in self.mailboxes.items():
+            flags = ["\\HasNoChildren"] + ([box.special_use] if box.special_use else [])
+            self.send(f'* LIST ({" ".join(flags)}) "/" "{name}"\r\n')
+        self.ok(tag, "LIST completed")
+
+    def do_MOVE(self, tag, args, uid):
+        self.require_selected()
+        target = self.find_mailbox(value(args[1]))
+        if target is None:
+            self.send(f"{tag} NO [TRYCREATE] no such mailbox\r\n")
+            return
+        moved = self.select_messages(value(args[0]), uid)
+        for seq, msg in moved:
+            copy = target.append(msg.header, msg.internaldate, msg.size)
+            copy.flags = set(msg.flags)
+        moved_ids = {id(msg) for seq, msg in moved}
+        self.remove_messages(lambda m: id(m) not in moved_ids)
+        self.ok(tag, "MOVE completed")
+
+    def do_CLOSE(self, tag, args, uid):
+        self.require_selected()
+        self.box.remove(lambda m: "\\Deleted" not in m.flags)
+        self.box = None
+        self.ok(tag, "CLOSE completed")
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailboxes, latency=0.0, capabilities=None, drop_after=None, greeting=GREETING,
+                 host="127.0.0.1", port=0, users=None, rate_limit=None, throttle_reply="no"):
+        if isinstance(mailboxes, FakeMailbox):
+            mailboxes = {"INBOX": mailboxes}
+        self.mailboxes = mailboxes
+        # 多个账户共用一台服务器: {用户名: 邮箱}, 未列出的用户使用 mailboxes
+        self.users = {user.lower(): {"INBOX": boxes} if isinstance(boxes, FakeMailbox) else boxes
+                      for user, boxes in (users or {}).items()}
+        self.sessions = {}
+        self.latency = latency
+        # 模拟断线: 每个连接处理 drop_after 条命令后直接断开
+        self.drop_after = drop_after
+        # 模拟服务商限流: 所有连接合计每秒最多 FETCH rate_limit 封 (令牌桶, 最多攒一秒的量),
+        # 超出时回复 NO [THROTTLED] (throttle_reply="no") 或者 BYE 后断开 ("bye")
+        self.rate_limit = rate_limit
+        self.throttle_reply = throttle_reply
+        self.tokens = rate_limit or 0
+        self.refilled = time.monotonic()
+        self.capabilities = list(capabilities or CAPABILITIES)
+        self.greeting = greeting
+        self.lock = threading.RLock()
+        self.reset_stats()
+        super().__init__((host, port), FakeIMAPHandler)
+        self.thread = None
+
+    def reset_stats(self):
+        # max_users: 同时有连接的不同用户数的最大值
+        self.stats = {"commands": 0, "by_command": {}, "bytes_in": 0, "bytes_out": 0, "bytes_out_raw": 0,
+                      "max_users": 0, "throttled": 0}
+
+    def take(self, count):
+        # 调用时已经持有 self.lock
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled) * self.rate_limit)
+        self.refilled = now
+        if count > self.tokens:
+            self.stats["throttled"] += 1
+            return False
+        self.tokens -= count
+        return True
+
+    def login(self, user):
+        with self.lock:
+            self.sessions[user] = self.sessions.get(user, 0) + 1
+            self.stats["max_users"] = max(self.stats["max_users"], len(self.sessions))
+        return self.users.get(user, self.mailboxes)
+
+    def logout(self, user):
+        with self.lock:
+            self.sessions[user] -= 1
+            if not self.sessions[user]:
+                del self.sessions[user]
+
+    def find_mailbox(self, name, user=None):
+        mailboxes = self.users.get(user.lower(), self.mailboxes) if user else self.mailboxes
+        for key, box in mailboxes.items():
+            if key.upper() == name.upper():
+                return box
+        return None
+
+    @property
+    def address(self):
+        return self.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,218 @@
+import datetime
+import ipaddress
+import os
+import socketserver
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+# ==========================================
+# 离线退订测试用的假服务器: HTTPS 一键退订端点 + 最小 SMTP 服务器
+# ==========================================
+# HTTPS 服务器使用临时生成的自签名证书, 客户端用 client_context() 信任它。
+# 两个服务器都记录连接数和收到的请求, 用来检查连接复用和并发上限。
+# make_rows / account_rows 生成指向这些服务器的发件人, expected_status 给出每一行应得的结果。
+
+def make_certificate():
+    # 返回 (证书文件, 私钥文件), 证书对 localhost 和 127.0.0.1 有效
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    folder = tempfile.mkdtemp(prefix="fake-unsubscribe-")
+    certfile = os.path.join(folder, "cert.pem")
+    keyfile = os.path.join(folder, "key.pem")
+    with open(certfile, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return certfile, keyfile
+
+def client_context(certfile):
+    return ssl.create_default_context(cafile=certfile)
+
+class UnsubscribeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.stats["max_active"] = max(server.stats["max_active"], server.active)
+        try:
+            time.sleep(server.latency)
+        finally:
+            with server.lock:
+                server.active -= 1
+                server.requests.append((self.path, body, self.headers.get("Content-Type")))
+        # 路径里带 fail 的返回 500, 带 redirect 的返回 303, 用来测试失败和重定向状态
+        status = 500 if "fail" in self.path else 303 if "redirect" in self.path else 200
+        self.send_response(status)
+        if status == 303:
+            self.send_header("Location", "/u/done")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeUnsubscribeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, certfile, keyfile, latency=0.0, host="127.0.0.1", port=0):
+        super().__init__((host, port), UnsubscribeHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = 0
+        self.requests = []
+        self.stats = {"connections": 0, "max_active": 0}
+
+    @property
+    def netloc(self):
+        return f"localhost:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    # 只实现发送退订邮件需要的命令; 不支持 STARTTLS / AUTH, 客户端不会登录
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.stats["sessions"] += 1
+        self.reply("220 localhost fake SMTP ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-localhost\r\n250-8BITMIME\r\n250 SIZE 10485760\r\n")
+            elif verb == "HELO":
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].split(">")[0].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command[8:].split(">")[0].strip("<> ")
+                # 收件人里带 reject 的拒收, 用来测试失败状态
+                if "reject" in recipient:
+                    self.reply("550 No such user")
+                    continue
+                recipients.append(recipient)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    data.append(chunk)
+                time.sleep(server.latency)
+                with server.lock:
+                    server.messages.append((sender, recipients, b"".join(data)))
+                self.reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        super().__init__((host, port), SMTPHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.messages = []
+        self.stats = {"sessions": 0}
+
+    @property
+    def address(self):
+        return f"{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def make_rows(servers, one_click, mailto, manual, failing):
+    # 前 failing 个一键退订链接返回 500, 前 failing 个 mailto 地址被 SMTP 服务器拒收
+    rows = []
+    for i in range(one_click):
+        server = servers[i % len(servers)]
+        path = f"/fail/{i}" if i < failing else f"/u/{i}"
+        rows.append({"Email": f"oc{i}@example.com", "Unsubscribe": f"https://{server.netloc}{path}",
+                     "One-Click": True, "Mailto": None})
+    for i in range(mailto):
+        address = f"reject-{i}@example.com" if i < failing else f"leave-{i}@example.com"
+        rows.append({"Email": f"mt{i}@example.com", "Unsubscribe": f"mailto:{address}?subject=stop%20{i}",
+                     "One-Click": False, "Mailto": f"{address}?subject=stop%20{i}"})
+    for i in range(manual):
+        rows.append({"Email": f"man{i}@example.com", "Unsubscribe": f"https://example.com/manual/{i}",
+                     "One-Click": False, "Mailto": None})
+    return rows
+
+def account_rows(rows, accounts):
+    # 每个账户都收到同样的一批发件人, 一键退订链接指向同样的几个主机
+    return [dict(row, Account=f"user{i}@example.com") for i in range(accounts) for row in rows]
+
+def expected_status(row):
+    if row["One-Click"]:
+        return "Failed" if "/fail/" in row["Unsubscribe"] else "Unsubscribed"
+    if row["Mailto"]:
+        return "Failed" if row["Mailto"].startswith("reject") else "Sent"
+    return "Open Link"
+
+def reset_stand_ins(servers, smtp):
+    for server in servers:
+        server.requests.clear()
+        server.stats.update(connections=0, max_active=0)
+    smtp.messages.clear()
+    smtp.stats["sessions"] = 0
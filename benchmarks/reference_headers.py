@@ -0,0 +1,69 @@
+import email
+import re
+from email.header import decode_header, make_header
+
+# ==========================================
+# 头部解析的参考实现: 标准库 (email.message_from_bytes + decode_header) 和容易出错的样例
+# ==========================================
+# bench_headers.py 和 tests/test_header_parser.py 都拿 mail_core 的解析器与这里的结果对比。
+
+FOLD_RE = re.compile(r'\r?\n(?=[ \t])')
+
+# 标准库容易处理出错的写法: 折行, 多个 encoded-word, Q 编码, 其他字符集, 被拆开的多字节字符
+EDGE_CASES = [
+    b"From: \"Plain Name\" <plain@example.com>\r\n"
+    b"List-Unsubscribe: <https://example.com/u?id=1>\r\n"
+    b"Date: Mon, 01 Jan 2024 10:00:00 +0000\r\n\r\n",
+    b"From: =?utf-8?b?5Y+R5Lu25Lq6?= =?utf-8?b?IDE=?= <multi@example.com>\r\n"
+    b"List-Unsubscribe: <mailto:leave@example.com>\r\n\r\n",
+    b"From: =?ISO-8859-1?Q?Andr=E9_Pirard?= <andre@example.com>\r\n"
+    b"List-Unsubscribe:\r\n <mailto:a@example.com>,\r\n\t<https://example.com/long/\r\n path>\r\n"
+    b"Date: Tue, 02 Jan 2024\r\n 11:00:00 +0100\r\n\r\n",
+    b"From: =?utf-8?q?=E5=8F=91?= =?utf-8?q?=E4=BB=B6?=\r\n =?utf-8?q?=E4=BA=BA?= <split@example.com>\r\n"
+    b"List-Unsubscribe: <https://example.com/x>\r\n\r\n",
+    b"from: Lower Case <lower@example.com>\r\n"
+    b"LIST-UNSUBSCRIBE: https://example.com/bare\r\n"
+    b"From: Second <second@example.com>\r\n\r\n",
+    b"From: Prefix =?utf-8?b?5ZCN?= Suffix <mixed@example.com>\r\n"
+    b"List-Unsubscribe: <mailto:m@example.com>\r\n\r\n",
+    b"From: =?gb2312?b?0MLOxQ==?= <news@example.cn>\r\n"
+    b"List-Unsubscribe: <https://example.cn/u>\r\n\r\n",
+    b"From: nobody@example.com\r\n"
+    b"Date: Wed, 03 Jan 2024 12:00:00 +0000\r\n\r\n",
+    b"List-Unsubscribe: <https://example.com/no-from>\r\n\r\n",
+    b"From: One Click <oneclick@example.com>\r\n"
+    b"List-Unsubscribe: <mailto:oc@example.com?subject=stop>, <https://example.com/oc>\r\n"
+    b"List-Unsubscribe-Post: List-Unsubscribe=One-Click\r\n\r\n",
+    b"From: Plain Http <http@example.com>\r\n"
+    b"List-Unsubscribe: <http://example.com/insecure>\r\n"
+    b"List-Unsubscribe-Post: List-Unsubscribe=One-Click\r\n\r\n",
+]
+
+def stdlib_field(value):
+    # 参考实现: 标准库的完整解码 (所有 encoded-word), 并按 RFC 5322 展开折行
+    if value is None:
+        return None
+    return str(make_header(decode_header(FOLD_RE.sub("", str(value))))).strip()
+
+def stdlib_parse_sender(core, header_bytes):
+    msg = email.message_from_bytes(header_bytes)
+    unsub = stdlib_field(msg.get("List-Unsubscribe"))
+    if not unsub:
+        return None
+    from_header = stdlib_field(msg.get("From")) or "Unknown"
+    sender_name = from_header.split("<")[0].strip().replace('"', '')
+    sender_email = core.extract_email_address(from_header)
+    link, mailto = core.parse_unsubscribe(unsub)
+    if not link and not mailto:
+        return None
+    post = stdlib_field(msg.get("List-Unsubscribe-Post"))
+    one_click = bool(link and link.lower().startswith("https://") and post
+                     and post.replace(" ", "").lower() == "list-unsubscribe=one-click")
+    return {
+        "Select": False,
+        "Sender": sender_name if sender_name else sender_email,
+        "Email": sender_email,
+        "Unsubscribe": link if link else f"mailto:{mailto}",
+        "One-Click": one_click,
+        "Mailto": mailto
+    }
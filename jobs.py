@@ -0,0 +1,157 @@
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mail_core import Diagnostics, delete_search_groups, run_delete, run_scan, state_rows
+from unsubscribe import unsubscribe_accounts, unsubscribe_senders
+
+# ==========================================
+# 后台任务 (扫描 / 删除 / 退订在工作线程中运行, 不阻塞页面)
+# ==========================================
+# 任务保存在进程级的 JobManager 里, 不依赖 session_state, 页面重跑或浏览器刷新后都能按 id 找回。
+# 工作线程只写任务字典, 页面定时读取; 结果行在回调中生成快照, 页面不会读到合并到一半的状态。
+
+JOB_WORKERS = 4
+JOB_RETENTION = 60 * 60
+PUBLISH_INTERVAL = 0.5
+
+def new_job(kind, creds, session=None, **extra):
+    # kind: "scan" / "delete" / "unsubscribe"; status: running -> done / cancelled
+    job = {
+        "id": secrets.token_urlsafe(16),
+        "kind": kind,
+        "creds": creds,
+        "session": session,
+        "status": "running",
+        "cancel": threading.Event(),
+        "progress": None,
+        "folder_progress": None,
+        "retry": None,
+        "rows": None,
+        "result": None,
+        "diagnostics": None,
+        "started": time.time(),
+        "finished": None,
+    }
+    job.update(extra)
+    return job
+
+class JobManager:
+    def __init__(self, workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="email-job")
+        self.retention = retention
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job, work):
+        with self.lock:
+            self.prune()
+            self.jobs[job["id"]] = job
+        self.executor.submit(self.run, job, work)
+        return job
+
+    def run(self, job, work):
+        try:
+            job["result"] = work(job)
+        except Exception as e:
+            job["result"] = f"Error: {str(e)}"
+        finally:
+            job["status"] = "cancelled" if job.get("stopped") else "done"
+            job["finished"] = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job["cancel"].set()
+
+    def discard(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def prune(self):
+        # 结束后保留一段时间, 供刷新后的页面取回结果
+        cutoff = time.time() - self.retention
+        for job_id in [k for k, job in self.jobs.items() if job["finished"] and job["finished"] < cutoff]:
+            del self.jobs[job_id]
+
+# ==========================================
+# 扫描 / 删除 / 退订任务
+# ==========================================
+
+def scan_work(job):
+    state = job["scan_state"]
+    last_publish = 0.0
+
+    def on_progress(done, total, folders=None):
+        # folders: 多文件夹扫描时每个文件夹的 (已处理, 总数)
+        nonlocal last_publish
+        job["progress"] = (done, total)
+        job["folder_progress"] = folders
+        # 在工作线程里生成结果快照, 节流避免大邮箱反复聚合
+        now = time.monotonic()
+        if done >= total or now - last_publish >= PUBLISH_INTERVAL:
+            last_publish = now
+            job["rows"] = state_rows(state)
+
+    job["diagnostics"] = Diagnostics("scan")
+    res = run_scan(job["creds"], state, job["session"], on_progress, job["cancel"], job["diagnostics"])
+    done, total = job["progress"] or (0, 0)
+    job["stopped"] = job["cancel"].is_set() and done < total
+    return res
+
+def delete_work(job):
+    checkpoint = job["delete_job"]
+    groups = delete_search_groups(checkpoint)
+
+    def on_progress(current):
+        job["retry"] = None
+        job["progress"] = {
+            "searched": current["searched"],
+            "groups": groups,
+            "done": current["done"],
+            "total": len(current["uids"]) if current["uids"] is not None else None,
+        }
+
+    def on_retry(error, delay):
+        job["retry"] = f"Connection lost ({error}), reconnecting in {delay:.1f}s..."
+
+    job["diagnostics"] = Diagnostics("delete")
+    res = run_delete(job["creds"], checkpoint, job["session"], on_progress, on_retry, job["cancel"],
+                     job["diagnostics"])
+    job["stopped"] = not res[0] and job["cancel"].is_set()
+    return res
+
+def unsubscribe_work(job):
+    targets = job["targets"]
+    done = job["unsubscribed"] = []
+
+    def on_progress(result):
+        done.append(result)
+        job["progress"] = (len(done), len(targets))
+
+    creds = job["creds"]
+    if creds.get('accounts'):
+        # 多账户: targets 带 Account 列, 每个账户用自己的退订链接和 SMTP 账户
+        results = unsubscribe_accounts(targets, creds['accounts'], on_progress=on_progress, cancel=job["cancel"])
+    else:
+        results = unsubscribe_senders(targets, creds['u'], creds['p'], creds.get('smtp'),
+                                      on_progress=on_progress, cancel=job["cancel"])
+    job["stopped"] = any(r["Status"] == "Cancelled" for r in results)
+    return results
+
+def submit_scan(manager, creds, scan_state, session=None, **extra):
+    # extra: 页面在任务结束后需要的信息 (例如开始前的结果表)
+    return manager.submit(new_job("scan", creds, session, scan_state=scan_state, **extra), scan_work)
+
+def submit_delete(manager, creds, delete_job, session=None, **extra):
+    return manager.submit(new_job("delete", creds, session, delete_job=delete_job, **extra), delete_work)
+
+def submit_unsubscribe(manager, creds, targets, session=None, **extra):
+    # targets: 选中发件人的结果行 (需要 Email / Unsubscribe / One-Click / Mailto, 多账户时还有 Account)
+    # 退订不用 IMAP, session 只是随任务保存, 刷新后交还给页面
+    return manager.submit(new_job("unsubscribe", creds, session, targets=targets, **extra), unsubscribe_work)
@@ -0,0 +1,2796 @@
+import bisect
+import imaplib
+import io
+import re
+import binascii
+import pandas as pd
+import time
+import random
+import queue
+import threading
+import os
+import json
+import zlib
+import base64
+import calendar
+import hashlib
+import hmac
+import sqlite3
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import asyncio
+from async_imap import THROTTLE_RE, AsyncIMAP, IMAPError, MAX_LINE_LENGTH, ThrottledError, quote
+
+# ==========================================
+# IMAP 扫描 / 删除核心 (不依赖 Streamlit, 界面和命令行共用)
+# ==========================================
+# 进度通过回调函数报告; 出错时与界面约定一致, 返回 "Error: ..." 字符串或 (False, 消息, ...)。
+
+# imaplib 默认单行最多 1 MB, 大邮箱的 UID SEARCH 响应会超出
+imaplib._MAXLINE = max(imaplib._MAXLINE, MAX_LINE_LENGTH)
+
+# ==========================================
+# 诊断数据 (各阶段耗时 / IMAP 命令和往返次数 / 收到的字节数 / 解析失败原因)
+# ==========================================
+# 一直开启: 每条 IMAP 命令只多两次计时和几次加法, 收到的字节数在 socket 读取时累加。
+# 多连接和流水线引擎的各阶段耗时会相互重叠, 加起来可能超过总耗时。
+
+COMMAND_PHASES = {
+    "CAPABILITY": "login",
+    "LOGIN": "login",
+    "SELECT": "select",
+    "UID SEARCH": "search",
+    "UID FETCH": "fetch",
+    "UID STORE": "delete",
+    "UID MOVE": "delete",
+    "UID EXPUNGE": "delete",
+    "EXPUNGE": "delete",
+    "COMPRESS": "login",
+    "ENABLE": "login",
+    "LIST": "select",
+    "LOGOUT": "logout",
+}
+
+class Diagnostics:
+    # 一次扫描 / 删除的计数器; 多个连接线程会同时写入, 用锁保护
+    def __init__(self, operation, engine=None):
+        self.operation = operation
+        self.engine = engine
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.finished = None
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.commands = {}
+        self.round_trips = 0
+        self.bytes_received = 0
+        self.headers = 0
+        self.failures = {}
+        self.connections = 0
+        self.compressed = 0
+    
+    def connected(self, compressed):
+        with self.lock:
+            self.connections += 1
+            self.compressed += compressed
+    
+    def add_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+    
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+    
+    def command(self, label, seconds, received, round_trip=True):
+        # round_trip: 流水线引擎中, 只有发出时没有其他命令在途的才算一次新的往返
+        phase = COMMAND_PHASES.get(label, "other")
+        with self.lock:
+            entry = self.commands.setdefault(label, {"count": 0, "seconds": 0.0, "bytes": 0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["bytes"] += received
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.round_trips += round_trip
+            self.bytes_received += received
+    
+    def parsed(self, count, failures, seconds):
+        with self.lock:
+            self.headers += count
+            self.phases["parse"] = self.phases.get("parse", 0.0) + seconds
+            for reason, n in failures.items():
+                self.failures[reason] = self.failures.get(reason, 0) + n
+    
+    def failure(self, reason, count=1):
+        with self.lock:
+            self.failures[reason] = self.failures.get(reason, 0) + count
+    
+    def finish(self):
+        self.finished = time.perf_counter()
+    
+    def report(self):
+        # 可直接 json.dumps 的快照; 运行中也可以调用
+        with self.lock:
+            wall = (self.finished or time.perf_counter()) - self.clock
+            failures = dict(self.failures)
+            commands = {label: dict(entry, seconds=round(entry["seconds"], 4))
+                        for label, entry in sorted(self.commands.items())}
+            return {
+                "operation": self.operation,
+                "engine": self.engine,
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+                "finished": self.finished is not None,
+                "wall_seconds": round(wall, 4),
+                "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+                "imap_commands": sum(entry["count"] for entry in commands.values()),
+                "round_trips": self.round_trips,
+                "connections": self.connections,
+                "compressed_connections": self.compressed,
+                "bytes_received": self.bytes_received,
+                "commands": commands,
+                "headers_parsed": self.headers,
+                "headers_per_second": round(self.headers / wall, 1) if wall > 0 else 0.0,
+                # 没有 List-Unsubscribe 的邮件是正常跳过, 不算解析失败
+                "headers_without_unsubscribe": failures.pop("no_list_unsubscribe", 0),
+                "parse_failures": failures,
+            }
+
+def instrument(mail, diagnostics):
+    # 在 imaplib 连接对象上包一层命令和读取函数; 同一个连接只包一次, 之后只切换 mail.diagnostics
+    mail.diagnostics = diagnostics
+    if hasattr(mail, "received"):
+        return mail
+    mail.received = 0
+    # 在 socket 层计数: 缓冲区每填充一次才调用一次, 比按行计数开销小得多; 开启压缩后统计的是压缩后的字节数
+    raw = getattr(mail, "wire_file", mail.file).raw
+    simple_command, readinto = mail._simple_command, raw.readinto
+    
+    def counted_readinto(buffer):
+        n = readinto(buffer)
+        mail.received += n or 0
+        return n
+    
+    def timed_command(name, *args):
+        if mail.diagnostics is None:
+            return simple_command(name, *args)
+        label = f"{name} {args[0].upper()}" if name == "UID" and args else name
+        received = mail.received
+        started = time.perf_counter()
+        try:
+            return simple_command(name, *args)
+        finally:
+            if mail.diagnostics is not None:
+                mail.diagnostics.command(label, time.perf_counter() - started, mail.received - received)
+    
+    raw.readinto, mail._simple_command = counted_readinto, timed_command
+    return mail
+
+# ==========================================
+# 头部快速解析 (只需要 FROM / LIST-UNSUBSCRIBE / LIST-UNSUBSCRIBE-POST, 不构造完整的 Message 对象)
+# ==========================================
+
+WANTED_HEADERS = (b"from", b"list-unsubscribe", b"list-unsubscribe-post")
+ENCODED_WORD_RE = re.compile(r'=\?([^?\s]+)\?([bBqQ])\?([^?\s]*)\?=')
+HTTP_LINK_RE = re.compile(r'<(https?://[^>]+)>')
+BARE_HTTP_RE = re.compile(r'(https?://\S+)')
+MAILTO_RE = re.compile(r'<mailto:([^>]+)>')
+ANGLE_ADDR_RE = re.compile(r'<([^>]+)>')
+
+def parse_header_block(header_bytes, wanted=WANTED_HEADERS):
+    # 逐行处理: 续行 (以空白开头) 接回上一个字段, 同名字段只取第一个, 与 Message.get 一致
+    fields = {}
+    current = None
+    for line in header_bytes.split(b"\n"):
+        line = line.rstrip(b"\r")
+        if not line:
+            break
+        if line[:1] in (b" ", b"\t"):
+            if current is not None:
+                current.append(line)
+            continue
+        current = None
+        name, sep, value = line.partition(b":")
+        if not sep:
+            continue
+        name = name.strip().lower()
+        if name in wanted and name.decode() not in fields:
+            current = fields[name.decode()] = [value.lstrip()]
+    
+    result = {}
+    for name, parts in fields.items():
+        raw = b"".join(parts).strip()
+        try:
+            result[name] = raw.decode("ascii")
+        except UnicodeDecodeError:
+            # 未编码的 8-bit 头部, 实际中基本都是 UTF-8
+            result[name] = raw.decode("utf-8", errors="replace")
+    return result
+
+def decode_word(charset, kind, data):
+    if kind in "bB":
+        raw = binascii.a2b_base64(data + "=" * (-len(data) % 4))
+    else:
+        raw = binascii.a2b_qp(data.encode("ascii"), header=True)
+    # RFC 2231 允许 charset*language 的写法
+    return charset.split("*")[0].lower(), raw
+
+def decode_bytes(raw, charset):
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+def decode_words(text):
+    # RFC 2047: 解码所有 encoded-word, 相邻 encoded-word 之间的空白按规范丢弃;
+    # 同一字符集的相邻 encoded-word 先拼接字节再解码, 被拆开的多字节字符才能还原
+    if "=?" not in text:
+        return text
+    out = []
+    pending = []
+    pos = 0
+    for match in ENCODED_WORD_RE.finditer(text):
+        between = text[pos:match.start()]
+        pos = match.end()
+        try:
+            charset, raw = decode_word(*match.groups())
+        except ValueError:
+            charset, raw = None, None
+        if raw is None or (between and not (pending and between.isspace())):
+            out.extend(decode_bytes(b, cs) for cs, b in pending)
+            pending = []
+            out.append(between)
+        if raw is None:
+            out.append(match.group(0))
+        elif pending and pending[-1][0] == charset:
+            pending[-1] = (charset, pending[-1][1] + raw)
+        else:
+            pending.append((charset, raw))
+    out.extend(decode_bytes(b, cs) for cs, b in pending)
+    out.append(text[pos:])
+    return "".join(out)
+
+def parse_unsubscribe(header_text):
+    http_link = None
+    mailto = None
+    
+    http_match = HTTP_LINK_RE.search(header_text)
+    if not http_match:
+        http_match = BARE_HTTP_RE.search(header_text)
+    if http_match:
+        http_link = http_match.group(1)
+    
+    mailto_match = MAILTO_RE.search(header_text)
+    if mailto_match:
+        mailto = mailto_match.group(1)
+    
+    return http_link, mailto
+
+def is_one_click(link, post_header):
+    # RFC 8058: 链接必须是 https, 且 List-Unsubscribe-Post 的值为 List-Unsubscribe=One-Click
+    if not link or not post_header or not link.lower().startswith("https://"):
+        return False
+    return post_header.replace(" ", "").lower() == "list-unsubscribe=one-click"
+
+def extract_email_address(from_header):
+    match = ANGLE_ADDR_RE.search(from_header)
+    if match:
+        return match.group(1)
+    return from_header.strip()
+
+def get_imap_server(email_address):
+    if not email_address or "@" not in email_address:
+        return ""
+    
+    domain = email_address.split("@")[1].lower()
+    
+    imap_servers = {
+        "gmail.com": "imap.gmail.com",
+        "googlemail.com": "imap.gmail.com",
+        "outlook.com": "outlook.office365.com",
+        "hotmail.com": "outlook.office365.com",
+        "live.com": "outlook.office365.com",
+        "qq.com": "imap.qq.com",
+        "163.com": "imap.163.com",
+        "126.com": "imap.126.com",
+        "yahoo.com": "imap.mail.yahoo.com",
+        "icloud.com": "imap.mail.me.com",
+    }
+    
+    for key, server in imap_servers.items():
+        if key in domain:
+            return server
+    
+    return f"imap.{domain}"
+
+def get_smtp_server(email_address):
+    # 用于 mailto 退订, 返回 "主机:端口"; 465 为 SSL, 其他端口用 STARTTLS
+    if not email_address or "@" not in email_address:
+        return ""
+    
+    domain = email_address.split("@")[1].lower()
+    
+    smtp_servers = {
+        "gmail.com": "smtp.gmail.com:465",
+        "googlemail.com": "smtp.gmail.com:465",
+        "outlook.com": "smtp.office365.com:587",
+        "hotmail.com": "smtp.office365.com:587",
+        "live.com": "smtp.office365.com:587",
+        "qq.com": "smtp.qq.com:465",
+        "163.com": "smtp.163.com:465",
+        "126.com": "smtp.126.com:465",
+        "yahoo.com": "smtp.mail.yahoo.com:465",
+        "icloud.com": "smtp.mail.me.com:587",
+    }
+    
+    for key, server in smtp_servers.items():
+        if key in domain:
+            return server
+    
+    return f"smtp.{domain}:465"
+
+# ==========================================
+# 批量 UID FETCH
+# ==========================================
+
+# 收到时间用 INTERNALDATE (服务器记录, 格式固定), 不再解析各式各样的 Date 头部
+HEADER_FETCH_ITEMS = '(UID RFC822.SIZE INTERNALDATE BODY.PEEK[HEADER.FIELDS (FROM LIST-UNSUBSCRIBE LIST-UNSUBSCRIBE-POST)])'
+FETCH_BATCH_SIZE = 200
+MAX_FETCH_BATCH_SIZE = 1000
+
+UID_RE = re.compile(rb'UID (\d+)')
+SIZE_RE = re.compile(rb'RFC822\.SIZE (\d+)')
+INTERNALDATE_RE = re.compile(rb'INTERNALDATE "([^"]+)"')
+
+def compress_uids(uids):
+    # 把 UID 列表压缩成 IMAP 序列集, 例如 [1, 2, 3, 7] -> "1:3,7"
+    ranges = []
+    for uid in sorted(set(int(u) for u in uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def parse_fetch_meta(text):
+    # RFC822.SIZE / INTERNALDATE -> (字节数, 原始日期字符串), 日期留给 pandas 批量转换
+    size = SIZE_RE.search(text)
+    date = INTERNALDATE_RE.search(text)
+    return int(size.group(1)) if size else 0, date.group(1).decode().strip() if date else None
+
+def parse_fetch_response(msg_data, meta=None):
+    # UID 可能出现在字面量之前 (b'1 (UID 5 BODY[...] {n}') 或之后 (b' UID 5)')
+    # meta 不为 None 时同时收集每封邮件的 (大小, 收到时间)
+    results = {}
+    pending = None
+    for part in msg_data or []:
+        if isinstance(part, tuple):
+            match = UID_RE.search(part[0])
+            if match:
+                uid = int(match.group(1))
+                results[uid] = part[1]
+                if meta is not None:
+                    meta[uid] = parse_fetch_meta(part[0])
+                pending = None
+            else:
+                pending = part
+        elif part and pending is not None:
+            match = UID_RE.search(part)
+            if match:
+                uid = int(match.group(1))
+                results[uid] = pending[1]
+                if meta is not None:
+                    meta[uid] = parse_fetch_meta(pending[0] + part)
+            pending = None
+    return results
+
+def chunk_uids(uids, batch_size=FETCH_BATCH_SIZE, first_batch=None):
+    # first_batch: 第一批取小一点, 让第一批结果尽快出现在页面上
+    batch_size = max(1, min(int(batch_size), MAX_FETCH_BATCH_SIZE))
+    if first_batch and first_batch < batch_size:
+        if uids[:first_batch]:
+            yield uids[:first_batch]
+        uids = uids[first_batch:]
+    yield from chunked(uids, batch_size)
+
+def fetch_failed(chunk, msg_data, diagnostics=None):
+    # 整批 FETCH 被拒绝 (非限流的 NO / BAD): 跳过这一批会让扫描停在中途却没有提示, 或者让 last_uid 越过没取到的邮件;
+    # 作为错误返回, 已合并的批次保留, 下次扫描从这里重取
+    if diagnostics is not None:
+        diagnostics.failure("fetch_not_ok", len(chunk))
+    text = b' '.join(item for item in msg_data or [] if isinstance(item, bytes)).decode(errors='ignore').strip()
+    return IMAPError(f"Failed to fetch {len(chunk)} headers" + (f": {text}" if text else ""))
+
+def fetch_headers(mail, uids, batch_size=FETCH_BATCH_SIZE, items=HEADER_FETCH_ITEMS, first_batch=None,
+                  diagnostics=None):
+    # 每批一次 UID FETCH, 产出 (chunk, {uid: header_bytes}, {uid: (大小, 收到时间)})
+    for chunk in chunk_uids(uids, batch_size, first_batch):
+        status, msg_data = checked(mail.uid('FETCH', compress_uids(chunk), items))
+        if status != 'OK':
+            raise fetch_failed(chunk, msg_data, diagnostics)
+        meta = {}
+        headers = parse_fetch_response(msg_data, meta)
+        yield chunk, headers, meta
+
+def parse_sender(header_bytes, failures=None):
+    # failures: 可选的 {原因: 次数}, 记录没有得到结果行的原因
+    fields = parse_header_block(header_bytes)
+    unsub = fields.get("list-unsubscribe")
+    if not unsub:
+        if failures is not None:
+            failures["no_list_unsubscribe"] = failures.get("no_list_unsubscribe", 0) + 1
+        return None
+    
+    from_header = decode_words(fields.get("from") or "Unknown")
+    sender_name = from_header.split("<")[0].strip().replace('"', '')
+    sender_email = extract_email_address(from_header)
+    
+    link, mailto = parse_unsubscribe(unsub)
+    if not link and not mailto:
+        if failures is not None:
+            failures["no_unsubscribe_target"] = failures.get("no_unsubscribe_target", 0) + 1
+        return None
+    
+    return {
+        "Select": False,
+        "Sender": sender_name if sender_name else sender_email,
+        "Email": sender_email,
+        "Unsubscribe": link if link else f"mailto:{mailto}",
+        "One-Click": is_one_click(link, fields.get("list-unsubscribe-post")),
+        "Mailto": mailto
+    }
+
+# ==========================================
+# 增量扫描状态 (UIDVALIDITY + 最后处理的 UID)
+# ==========================================
+
+def new_scan_state(aggregate=False):
+    # messages: 每封订阅邮件一行的列式数据, 用来计算发件人统计
+    # aggregates: 整个邮箱扫描时改为只保存每个发件人的汇总 {email: [封数, 字节数, 最早, 最晚]}, 不逐封保存
+    # partial: 上次扫描被取消或中途出错, last_uid 没有前进, 已合并的邮件下次不再重复获取
+    # processed: partial 期间已经取过头部的全部 UID (包括不是订阅邮件的), 完整扫描结束后清空
+    # modseq: 上次完整扫描时的 HIGHESTMODSEQ (服务器支持 QRESYNC 时), 重扫时据此找出消失的邮件
+    # folders: 多文件夹扫描时每个文件夹一份同样结构的状态 {文件夹名: 状态}, 外层只保存合并后的统计
+    # accounts: 多账户时同样每个账户一份 {邮箱: 状态}
+    return {"uidvalidity": None, "last_uid": 0, "senders": {}, "stats": {}, "messages": new_message_columns(),
+            "aggregates": {} if aggregate else None, "partial": False, "processed": [], "modseq": None,
+            "folders": None, "accounts": None}
+
+def get_uidvalidity(mail):
+    _, data = mail.response('UIDVALIDITY')
+    if data and data[-1]:
+        return int(data[-1])
+    return None
+
+def merge_sender(senders, uid, row):
+    # 同一发件人以 UID 最大 (最新) 的那封为准
+    current = senders.get(row["Email"])
+    if current is None or uid > current["uid"]:
+        senders[row["Email"]] = {"uid": uid, "row": row}
+
+def scan_criteria(state, uidvalidity):
+    # UIDVALIDITY 变化时旧的 UID 全部失效, 只能全量扫描
+    if uidvalidity is not None and state["uidvalidity"] == uidvalidity and state["last_uid"] > 0:
+        return f'UID {state["last_uid"] + 1}:*'
+    return 'ALL'
+
+def plan_scan(state, uidvalidity, criteria, scope, limit, candidates=None, server_filter=None):
+    # scope 是范围内的全部 UID, candidates 是服务器端过滤后的 UID (未过滤时为 None)
+    # 返回 (按从新到旧排列的待获取 UID, 本次扫描后的最大 UID)
+    scope = [int(u) for u in scope]
+    uids = scope if candidates is None else [int(u) for u in candidates]
+    if criteria == 'ALL':
+        state.update(new_scan_state())
+    else:
+        # "n:*" 至少会返回最后一封, 即使它的 UID 小于 n
+        scope = [u for u in scope if u > state["last_uid"]]
+        uids = [u for u in uids if u > state["last_uid"]]
+        if state.get("partial"):
+            # 旧索引没有 processed, 至少跳过已经得到结果行的邮件
+            known = set(state["messages"]["uid"]).union(state.get("processed") or ())
+            uids = [u for u in uids if u not in known]
+    state["uidvalidity"] = uidvalidity
+    
+    last_uid = max(scope) if scope else state["last_uid"]
+    candidate_count = len(uids)
+    uids = uids[-limit:]
+    uids.reverse()
+    state["stats"] = {
+        "server_filter": server_filter,
+        "in_scope": len(scope),
+        "candidates": candidate_count,
+        "fetched": len(uids),
+    }
+    return uids, last_uid
+
+# ==========================================
+# QRESYNC 增量同步 (RFC 7162, 找出被其他客户端删除或移走的邮件)
+# ==========================================
+# 登录后 ENABLE QRESYNC, SELECT 会带回 HIGHESTMODSEQ, 完整扫描后记入 state["modseq"]。
+# 重扫时一条 UID FETCH ... (CHANGEDSINCE modseq VANISHED) 就能拿到之后消失的 UID 和改动过标记的邮件,
+# 直接从逐封数据中扣除, 不重新下载头部。整个邮箱模式只保存汇总, 没有逐封的 UID, 不做同步。
+
+QRESYNC_CAPABILITY = "QRESYNC"
+FLAGS_RE = re.compile(rb'FLAGS \(([^)]*)\)')
+
+def enable_qresync(mail, capabilities):
+    # 返回是否已开启; 必须在 SELECT 之前
+    if QRESYNC_CAPABILITY not in capabilities or "ENABLE" not in capabilities:
+        return False
+    try:
+        status, _ = mail._simple_command('ENABLE', QRESYNC_CAPABILITY)
+    except imaplib.IMAP4.error:
+        return False
+    _, enabled = mail.response('ENABLED')
+    return status == 'OK' and any(b'QRESYNC' in (item or b'').upper() for item in enabled)
+
+def get_highestmodseq(mail):
+    # 没有开启 QRESYNC 或邮箱不支持 MODSEQ (NOMODSEQ) 时返回 None
+    _, data = mail.response('HIGHESTMODSEQ')
+    if data and data[-1]:
+        return int(data[-1])
+    return None
+
+def parse_uid_ranges(text):
+    # b"3:5,9" -> [(3, 5), (9, 9)]
+    ranges = []
+    for part in text.split(b','):
+        lo, _, hi = part.partition(b':')
+        if lo.isdigit() and (not hi or hi.isdigit()):
+            lo, hi = int(lo), int(hi or lo)
+            ranges.append((min(lo, hi), max(lo, hi)))
+    return ranges
+
+def parse_changes(vanished, fetched):
+    # 返回 (消失的 UID 区间, 被标记为 \Deleted 的 UID); 两种引擎的响应格式相同
+    ranges = []
+    for item in vanished or []:
+        item = item[0] if isinstance(item, tuple) else item
+        if item:
+            # "(EARLIER) 3:5,9"
+            ranges.extend(parse_uid_ranges(item.split()[-1]))
+    deleted = set()
+    for item in fetched or []:
+        item = item[0] if isinstance(item, tuple) else item or b''
+        uid, flags = UID_RE.search(item), FLAGS_RE.search(item)
+        if uid and flags and b'\\DELETED' in flags.group(1).upper():
+            deleted.add(int(uid.group(1)))
+    return ranges, deleted
+
+def forget_messages(state, ranges, deleted):
+    # 从逐封数据中去掉已不存在的邮件, 返回 (去掉的封数, {UID: 发件人})
+    # 一封不剩的发件人移除; 结果行来自的那一封 (最新一封) 被删除的发件人, 返回剩下最新一封的 UID,
+    # 由调用方重新取头部来重建名称和退订链接
+    messages = state["messages"]
+    known = sorted(messages["uid"])
+    gone = set(deleted)
+    for lo, hi in ranges:
+        gone.update(known[bisect.bisect_left(known, lo):bisect.bisect_right(known, hi)])
+    keep = [i for i, uid in enumerate(messages["uid"]) if uid not in gone]
+    if len(keep) == len(messages["uid"]):
+        return 0, {}
+    affected = {sender_email for uid, sender_email in zip(messages["uid"], messages["email"]) if uid in gone}
+    state["messages"] = {name: [column[i] for i in keep] for name, column in messages.items()}
+    latest = {}
+    for uid, sender_email in zip(state["messages"]["uid"], state["messages"]["email"]):
+        if sender_email in affected and uid > latest.get(sender_email, 0):
+            latest[sender_email] = uid
+    stale = {}
+    for sender_email in affected:
+        if sender_email not in latest:
+            state["senders"].pop(sender_email, None)
+        elif state["senders"][sender_email]["uid"] in gone:
+            stale[latest[sender_email]] = sender_email
+    return len(messages["uid"]) - len(keep), stale
+
+def refresh_senders(state, stale, headers):
+    # 用重新取到的头部替换结果行; 没取到 (刚好也被删除) 的先只更新 UID, 下次同步再处理
+    for uid, sender_email in stale.items():
+        row = parse_sender(headers[uid]) if uid in headers else None
+        if row and row["Email"] == sender_email:
+            state["senders"][sender_email] = {"uid": uid, "row": row}
+        else:
+            state["senders"][sender_email]["uid"] = uid
+
+def changes_command(state):
+    # 无法同步时返回 None: 没有开启 QRESYNC 的连接由调用方判断
+    if not state.get("modseq") or state.get("aggregates") is not None or not state["last_uid"]:
+        return None
+    return f'1:{state["last_uid"]}', f'(FLAGS) (CHANGEDSINCE {state["modseq"]} VANISHED)'
+
+def sync_changes(mail, state):
+    # 返回从结果中扣除的邮件数, 无法同步时返回 None
+    command = changes_command(state)
+    if command is None or not getattr(mail, "qresync", False):
+        return None
+    # 这个连接上之前删除邮件时留下的 VANISHED 不属于这次同步
+    mail.response('VANISHED')
+    try:
+        status, fetched = mail.uid('FETCH', *command)
+    except imaplib.IMAP4.error:
+        return None
+    _, vanished = mail.response('VANISHED')
+    if status != 'OK':
+        return None
+    removed, stale = forget_messages(state, *parse_changes(vanished, fetched))
+    headers = {}
+    if stale:
+        status, msg_data = checked(mail.uid('FETCH', compress_uids(sorted(stale)), HEADER_FETCH_ITEMS))
+        headers = parse_fetch_response(msg_data) if status == 'OK' else {}
+    refresh_senders(state, stale, headers)
+    return removed
+
+async def sync_changes_async(mail, state):
+    command = changes_command(state)
+    if command is None or not mail.qresync:
+        return None
+    status, _, untagged = await mail.command('UID FETCH', *command)
+    if status != 'OK':
+        return None
+    removed, stale = forget_messages(state, *parse_changes(untagged.get('VANISHED'), untagged.get('FETCH')))
+    headers = {}
+    if stale:
+        status, msg_data = await mail.uid('FETCH', compress_uids(sorted(stale)), HEADER_FETCH_ITEMS)
+        headers = parse_fetch_response(msg_data) if status == 'OK' else {}
+    refresh_senders(state, stale, headers)
+    return removed
+
+# ==========================================
+# 服务器端过滤 (只下载带 List-Unsubscribe 的邮件)
+# ==========================================
+
+MAX_EXCLUDED_SENDERS = 50
+
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def imap_date(day):
+    # IMAP 日期格式固定为英文月份, 不能用受 locale 影响的 strftime('%b')
+    return f"{day.day:02d}-{MONTH_NAMES[day.month - 1]}-{day.year}"
+
+def filter_criteria(criteria, state, filters, provider=None):
+    # 没有开启服务器端过滤时返回 None
+    if not filters or not filters.get("server_side"):
+        return None
+    
+    parts = [] if criteria == 'ALL' else [criteria]
+    parts.append(provider_filter(provider))
+    if filters.get("since"):
+        parts.append(f'SINCE {imap_date(filters["since"])}')
+    if filters.get("exclude_known") and criteria != 'ALL':
+        known = [s for s in state["senders"] if s.isascii() and '"' not in s and '\\' not in s]
+        for sender_email in known[:MAX_EXCLUDED_SENDERS]:
+            parts.append(f'NOT FROM "{sender_email}"')
+    return ' '.join(parts)
+
+def search_candidates(mail, criteria):
+    # 服务器不支持该搜索时返回 None, 调用方回退到逐封检查; 被限流时照常抛出
+    try:
+        status, messages = checked(mail.uid('SEARCH', None, criteria))
+    except imaplib.IMAP4.error as e:
+        if is_throttled(e):
+            raise
+        return None
+    if status != 'OK':
+        return None
+    return (messages[0] or b'').split()
+
+async def search_candidates_async(mail, criteria):
+    try:
+        status, messages = await mail.uid('SEARCH', None, criteria)
+    except ThrottledError:
+        raise
+    except IMAPError:
+        return None
+    if status != 'OK':
+        return None
+    return (messages[0] or b'').split()
+
+def fetch_savings(stats):
+    # 服务器端过滤掉、无需下载头部的邮件比例
+    if not stats or not stats.get("server_filter") or not stats.get("in_scope"):
+        return None
+    return 1 - stats["candidates"] / stats["in_scope"]
+
+def merge_headers(state, chunk, headers, meta=None, diagnostics=None):
+    messages = state["messages"]
+    aggregates = state.get("aggregates")
+    started = time.perf_counter()
+    failures = {}
+    for uid in chunk:
+        if uid not in headers:
+            failures["missing_from_response"] = failures.get("missing_from_response", 0) + 1
+            continue
+        try:
+            row = parse_sender(headers[uid], failures)
+        except Exception as e:
+            # 单封邮件解析失败不影响整批, 按异常类型计数
+            reason = f"error: {type(e).__name__}"
+            failures[reason] = failures.get(reason, 0) + 1
+            continue
+        if row:
+            merge_sender(state["senders"], uid, row)
+            size, received = (meta or {}).get(uid, (0, None))
+            if aggregates is not None:
+                merge_aggregate(aggregates, row["Email"], size, received)
+                continue
+            messages["uid"].append(uid)
+            messages["email"].append(row["Email"])
+            messages["size"].append(size)
+            messages["received"].append(received)
+    if aggregates is None:
+        # 整个邮箱模式按区间推进 last_uid, 不需要逐封记录
+        state.setdefault("processed", []).extend(chunk)
+    if diagnostics is not None:
+        diagnostics.parsed(len(chunk) - failures.get("missing_from_response", 0), failures,
+                           time.perf_counter() - started)
+
+# ==========================================
+# 发件人统计 (数量 / 占用空间 / 时间范围 / 频率)
+# ==========================================
+
+INTERNALDATE_FORMAT = "%d-%b-%Y %H:%M:%S %z"
+STAT_COLUMNS = ["Emails", "Size (MB)", "First Received", "Last Received", "Per Week"]
+# 多文件夹 / 多账户时每个发件人的邮件分布, 例如 "INBOX (12), Spam (3)"
+BREAKDOWN_COLUMNS = ["Folders", "Accounts"]
+UNSUBSCRIBE_COLUMNS = ["Unsubscribe", "One-Click", "Mailto"]
+
+SORT_OPTIONS = {
+    "Most Recent": "Last Received",
+    "Mailbox Footprint": "Size (MB)",
+    "Email Count": "Emails",
+    "Frequency": "Per Week",
+}
+
+INTERNALDATE_PARTS_RE = re.compile(r'\s*(\d{1,2})-(\w{3})-(\d{4}) (\d{2}):(\d{2}):(\d{2}) ([+-])(\d{2})(\d{2})')
+MONTH_NUMBERS = {name: i for i, name in enumerate(MONTH_NAMES, 1)}
+
+def new_message_columns():
+    return {"uid": [], "email": [], "size": [], "received": []}
+
+def internaldate_timestamp(text):
+    # 逐封累加时用, 比 strptime 快; 格式不对时返回 None
+    match = INTERNALDATE_PARTS_RE.match(text or "")
+    if not match or match.group(2) not in MONTH_NUMBERS:
+        return None
+    day, month, year, hour, minute, second, sign, tz_hour, tz_minute = match.groups()
+    offset = (int(tz_hour) * 3600 + int(tz_minute) * 60) * (1 if sign == "+" else -1)
+    return calendar.timegm((int(year), MONTH_NUMBERS[month], int(day), int(hour), int(minute), int(second))) - offset
+
+def merge_aggregate(aggregates, sender_email, size, received):
+    timestamp = internaldate_timestamp(received)
+    entry = aggregates.get(sender_email)
+    if entry is None:
+        aggregates[sender_email] = [1, size, timestamp, timestamp]
+        return
+    entry[0] += 1
+    entry[1] += size
+    if timestamp is not None:
+        if entry[2] is None or timestamp < entry[2]:
+            entry[2] = timestamp
+        if entry[3] is None or timestamp > entry[3]:
+            entry[3] = timestamp
+
+def sender_stats(state):
+    # 向量化聚合: 每个发件人一行, 日期为 datetime 列
+    if state.get("aggregates") is not None:
+        frame = pd.DataFrame.from_dict(state["aggregates"], orient="index", columns=["count", "size", "first", "last"])
+        if frame.empty:
+            return pd.DataFrame(columns=STAT_COLUMNS)
+        stats = pd.DataFrame({
+            "Emails": frame["count"],
+            "Size (MB)": (frame["size"] / 2 ** 20).round(2),
+            "First Received": pd.to_datetime(frame["first"], unit="s", utc=True),
+            "Last Received": pd.to_datetime(frame["last"], unit="s", utc=True),
+        })
+    else:
+        frame = pd.DataFrame(state["messages"])
+        if frame.empty:
+            return pd.DataFrame(columns=STAT_COLUMNS)
+        frame["received"] = pd.to_datetime(frame["received"], format=INTERNALDATE_FORMAT, utc=True, errors="coerce")
+        grouped = frame.groupby("email")
+        stats = pd.DataFrame({
+            "Emails": grouped["uid"].count(),
+            "Size (MB)": (grouped["size"].sum() / 2 ** 20).round(2),
+            "First Received": grouped["received"].min(),
+            "Last Received": grouped["received"].max(),
+        })
+    # 平均间隔换算成每周封数; 只有一封或时间相同时无法计算
+    span_days = (stats["Last Received"] - stats["First Received"]).dt.total_seconds() / 86400
+    per_week = (stats["Emails"] - 1) / span_days * 7
+    stats["Per Week"] = per_week.where(span_days > 0).round(1)
+    return stats
+
+def drop_senders(state, senders):
+    # 删除后把这些发件人及其邮件统计一起移除
+    removed = set(senders)
+    for sender_email in removed:
+        state["senders"].pop(sender_email, None)
+        if state.get("aggregates") is not None:
+            state["aggregates"].pop(sender_email, None)
+    messages = state["messages"]
+    keep = [i for i, sender_email in enumerate(messages["email"]) if sender_email not in removed]
+    state["messages"] = {name: [column[i] for i in keep] for name, column in messages.items()}
+    for part in [*(state.get("folders") or {}).values(), *(state.get("accounts") or {}).values()]:
+        drop_senders(part, removed)
+
+def state_rows(state):
+    if state.get("accounts") is not None:
+        return merge_rows({user: state_rows(part) for user, part in state["accounts"].items()}, "Accounts")
+    if state.get("folders") is not None:
+        return merge_rows({decode_folder_name(name): state_rows(part) for name, part in state["folders"].items()},
+                          "Folders")
+    records = sorted(state["senders"].values(), key=lambda r: r["uid"], reverse=True)
+    stats = sender_stats(state)
+    stats = stats.astype(object).where(stats.notna(), None).to_dict("index")
+    rows = []
+    for record in records:
+        row = dict(record["row"])
+        # 退订相关的列放在统计列之后; 旧索引里的记录可能没有 One-Click / Mailto
+        unsubscribe = {name: row.pop(name) for name in UNSUBSCRIBE_COLUMNS if name in row}
+        row.update(stats.get(row["Email"], dict.fromkeys(STAT_COLUMNS)))
+        row.update(unsubscribe)
+        rows.append(row)
+    return rows
+
+def sort_results(df, sort_by):
+    column = SORT_OPTIONS.get(sort_by)
+    if column is None or column not in df.columns or df.empty:
+        return df
+    return df.sort_values(column, ascending=False, na_position="last", kind="stable").reset_index(drop=True)
+
+def results_frame(rows):
+    # 勾选状态单独保存为发件人集合, 结果表本身不带 Select 列
+    return pd.DataFrame(rows).drop(columns=["Select"], errors="ignore")
+
+def sender_domains(emails):
+    return emails.str.lower().str.rsplit("@", n=1).str[-1]
+
+def filter_results(df, search="", domain="", min_emails=0):
+    # 在本地筛选, 页面只需要拿到筛选后的一页
+    if df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    search = search.strip().lower()
+    if search:
+        mask &= (df["Sender"].str.lower().str.contains(search, regex=False)
+                 | df["Email"].str.lower().str.contains(search, regex=False))
+    domain = domain.strip().lower().lstrip("@")
+    if domain:
+        # example.com 同时匹配 news.example.com 这样的子域名
+        hosts = sender_domains(df["Email"])
+        mask &= (hosts == domain) | hosts.str.endswith("." + domain)
+    if min_emails > 1 and "Emails" in df.columns:
+        mask &= df["Emails"] >= min_emails
+    return df[mask]
+
+# ==========================================
+# COMPRESS=DEFLATE (RFC 4978, 服务器支持时压缩整个连接)
+# ==========================================
+# 头部重复度很高 (同样的发件人、退订链接模板和日期格式), 慢速或按流量计费的网络上能省下大部分流量。
+# LOGIN 之后协商, 服务器不支持或拒绝时保持不压缩, 其他代码不需要知道连接是否压缩。
+
+COMPRESS_CAPABILITY = "COMPRESS=DEFLATE"
+DEFLATE_READ_SIZE = 64 * 1024
+LOGIN_CAPABILITY_RE = re.compile(rb'\[CAPABILITY ([^\]]*)\]', re.I)
+
+# imaplib 不认识 COMPRESS 命令, 需要登记允许发送它的连接状态
+imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+
+class DeflateReader(io.RawIOBase):
+    # 从原来的 (压缩的) 读取流取数据, 解压后交给 imaplib 的 readline / read
+    def __init__(self, source):
+        self.source = source
+        self.inflater = zlib.decompressobj(wbits=-15)
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        while True:
+            data = self.inflater.unconsumed_tail
+            if not data:
+                data = self.source.read1(DEFLATE_READ_SIZE)
+                if not data:
+                    return 0
+            out = self.inflater.decompress(data, len(buffer))
+            if out:
+                buffer[:len(out)] = out
+                return len(out)
+    
+    def close(self):
+        # 原来的读取流持有 socket 的引用, 一起关闭, 否则 socket 不会真正关闭
+        self.source.close()
+        super().close()
+
+def login_capabilities(data):
+    # 有的服务器登录后才列出 COMPRESS, 放在 LOGIN 响应的 [CAPABILITY ...] 里
+    for item in data or []:
+        match = LOGIN_CAPABILITY_RE.search(item if isinstance(item, bytes) else b'')
+        if match:
+            return tuple(match.group(1).decode(errors='ignore').upper().split())
+    return ()
+
+def enable_compression(mail, capabilities):
+    # 返回是否已开启压缩
+    if COMPRESS_CAPABILITY not in capabilities:
+        return False
+    try:
+        status, _ = mail._simple_command('COMPRESS', 'DEFLATE')
+    except imaplib.IMAP4.error:
+        return False
+    if status != 'OK':
+        return False
+    
+    compressor = zlib.compressobj(wbits=-15)
+    sock = mail.sock
+    
+    def send(data):
+        # 每条命令都 SYNC_FLUSH, 服务器才能立即解出完整的一行
+        sock.sendall(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))
+    
+    mail.send = send
+    mail.wire_file = mail.file
+    mail.file = io.BufferedReader(DeflateReader(mail.file), DEFLATE_READ_SIZE)
+    return True
+
+# ==========================================
+# 服务商快速路径 (Gmail X-GM-EXT-1 / Outlook)
+# ==========================================
+# Gmail 的标签都是 "所有邮件" 的视图: 扫描和删除都在所有邮件上做一次, 不必逐个标签, 归档的邮件也包括在内。
+# 在 Gmail 上 EXPUNGE 只是去掉当前标签 (邮件被归档而不是删除), 所以删除一律移到废纸篓。
+# 服务器端过滤用 X-GM-RAW (网页版的搜索语法), 走 Gmail 自己的索引, 比 HEADER 搜索快得多。
+# Outlook 没有对应的 IMAP 扩展, 只按它的文件夹命名 (Deleted Items / Junk Email) 查找。
+
+GMAIL_CAPABILITY = "X-GM-EXT-1"
+# 网页版搜索没有按 List-Unsubscribe 头部搜索的语法, "unsubscribe" 全文匹配几乎所有订阅邮件;
+# 多取的邮件在本地解析时会被排除, 不影响结果
+GMAIL_SUBSCRIPTION_QUERY = "category:promotions OR unsubscribe"
+OUTLOOK_GREETING = b"Microsoft Exchange"
+OUTLOOK_HOSTS = ["outlook.office365.com", "outlook.office.com", "imap-mail.outlook.com"]
+ALL_MAIL_NAMES = ["all mail", "所有邮件"]
+
+def detect_provider(capabilities, greeting, server):
+    # 优先看能力和问候语 (本地假服务器也能模拟), 其次看服务器地址
+    if GMAIL_CAPABILITY in capabilities:
+        return "gmail"
+    if OUTLOOK_GREETING in (greeting or b'') or (server or "").lower() in OUTLOOK_HOSTS:
+        return "outlook"
+    return None
+
+def list_folders(mail):
+    # 同一个连接只 LIST 一次, 选择文件夹和删除时共用
+    if getattr(mail, "folders", None) is None:
+        status, data = mail.list()
+        mail.folders = parse_list_response(data) if status == 'OK' else []
+    return mail.folders
+
+async def list_folders_async(mail):
+    if mail.folders is None:
+        status, data = await mail.list()
+        mail.folders = parse_list_response(data) if status == 'OK' else []
+    return mail.folders
+
+def provider_mailbox(provider, folders):
+    # 没有指定文件夹时扫描的文件夹: Gmail 为所有邮件, 其他为收件箱
+    if provider == "gmail":
+        return find_folder(folders, "\\ALL", ALL_MAIL_NAMES) or "INBOX"
+    return "INBOX"
+
+def provider_filter(provider):
+    # 服务器端过滤的搜索条件
+    if provider == "gmail":
+        return f'X-GM-RAW {quote(GMAIL_SUBSCRIPTION_QUERY)}'
+    return 'HEADER List-Unsubscribe ""'
+
+def provider_trash(provider, use_trash):
+    return use_trash or provider == "gmail"
+
+# ==========================================
+# 服务商限流 (按观测到的耗时和限流回复, 自适应调整批次大小和并发)
+# ==========================================
+# 各家按每秒命令数和下载流量限流, 超出时回复 NO [THROTTLED] / [UNAVAILABLE], 或者直接 BYE 断开、不再响应。
+# Throttle 是一个 AIMD 控制器: 每批在目标耗时内完成就把批次加大一步, 连续几批顺利再多用一个连接;
+# 一批耗时远超目标 (服务器开始变慢) 时批次乘性减小, 收到限流信号时批次和并发都减半, 暂停后重取这一批。
+# 起点和上限来自服务商的默认配置, 按 get_imap_server 给出的服务器地址查找, 其他服务器用通用配置。
+
+THROTTLE_PROFILES = {
+    # Gmail: 每个账户最多 15 个连接, 主要按下载流量限流
+    "imap.gmail.com": {"batch": 200, "max_batch": 1000, "connections": 4, "in_flight": 8},
+    # Exchange Online: 按每个账户的命令频率限流, 被限流后要等更久
+    "outlook.office365.com": {"batch": 100, "max_batch": 500, "connections": 2, "in_flight": 4, "cooldown": 5.0},
+    # QQ / 网易: 同时连接多了直接断开
+    "imap.qq.com": {"batch": 50, "max_batch": 200, "connections": 1, "in_flight": 2, "accounts": 1, "cooldown": 5.0},
+    "imap.163.com": {"batch": 50, "max_batch": 200, "connections": 1, "in_flight": 2, "accounts": 1, "cooldown": 5.0},
+    "imap.126.com": {"batch": 50, "max_batch": 200, "connections": 1, "in_flight": 2, "accounts": 1, "cooldown": 5.0},
+    "imap.mail.yahoo.com": {"batch": 100, "max_batch": 500, "connections": 2, "in_flight": 4},
+    "imap.mail.me.com": {"batch": 100, "max_batch": 500, "connections": 2, "in_flight": 4},
+}
+DEFAULT_THROTTLE_PROFILE = {
+    "batch": FETCH_BATCH_SIZE,          # 起始批次
+    "max_batch": MAX_FETCH_BATCH_SIZE,
+    "connections": 4,                   # 多连接引擎最多同时使用的连接数
+    "in_flight": 8,                     # asyncio 引擎最多同时在途的 FETCH 数
+    "accounts": 2,                      # 多账户时同一服务器上最多同时扫描的账户数
+    "target": 1.0,                      # 每批的目标耗时 (秒)
+    "cooldown": 2.0,                    # 第一次被限流后暂停的秒数, 连续被限流时翻倍
+}
+MIN_THROTTLE_BATCH = 10
+MAX_THROTTLE_DELAY = 60.0
+# 连续这么多次被限流 (中间没有一批成功) 就放弃, 返回错误
+MAX_THROTTLE_STRIKES = 6
+# 一批耗时超过目标的这么多倍, 视为服务器在变慢
+SLOWDOWN_FACTOR = 3.0
+# 连续这么多批顺利完成才多用一个连接
+RAMP_UP_BATCHES = 3
+ADAPTIVE_HINT = ", or turn on adaptive speed"
+
+def throttle_profile(server):
+    return dict(DEFAULT_THROTTLE_PROFILE, **THROTTLE_PROFILES.get((server or "").lower(), {}))
+
+def is_throttled(error):
+    # 只有服务器明确说了 (NO / BYE 的说明文字符合 THROTTLE_RE) 才算限流;
+    # 连接超时、网络断开和其他 BYE 按普通的连接错误处理, 不暂停重试, 也不提示打开自适应
+    if isinstance(error, ThrottledError):
+        return True
+    return isinstance(error, imaplib.IMAP4.error) and bool(THROTTLE_RE.search(str(error).encode()))
+
+def checked(response):
+    # imaplib 对 NO 不抛异常; 限流的 NO 要抛出来, 否则这一批会被当作空结果跳过
+    status, data = response
+    if status == 'NO':
+        text = b' '.join(item for item in data if isinstance(item, bytes))
+        if THROTTLE_RE.search(text):
+            raise ThrottledError(text.decode(errors='ignore'))
+    return response
+
+def error_message(error, hint=""):
+    # 被限流时说明原因, 其他错误照旧
+    if is_throttled(error):
+        detail = str(error).rstrip(". ") or "no response"
+        return f"Error: The server is throttling this account ({detail}). Wait a few minutes and try again{hint}"
+    # asyncio 的超时没有说明文字
+    return f"Error: {str(error) or type(error).__name__}"
+
+class Throttle:
+    # 一次扫描共用一个 (多文件夹时各文件夹共用), 多个线程同时调用, 用锁保护
+    def __init__(self, profile, connections=None):
+        self.profile = profile
+        self.batch = profile["batch"]
+        self.step = max(MIN_THROTTLE_BATCH, profile["batch"] // 4)
+        self.max_connections = max(1, connections or profile["connections"])
+        self.limit = 1
+        self.ok = 0
+        self.strikes = 0
+        self.throttles = 0
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+    
+    def observe(self, count, seconds):
+        # 一批顺利完成: 在目标耗时内就加性增大, 远超目标就乘性减小
+        if not count:
+            return
+        with self.lock:
+            self.strikes = 0
+            target = self.profile["target"]
+            if seconds > target * SLOWDOWN_FACTOR:
+                self.batch = max(MIN_THROTTLE_BATCH, int(self.batch * 0.75))
+                self.limit = max(1, self.limit - 1)
+                self.ok = 0
+            elif seconds <= target:
+                self.batch = min(self.profile["max_batch"], self.batch + self.step)
+                self.ok += 1
+                if self.ok >= RAMP_UP_BATCHES and self.limit < self.max_connections:
+                    self.limit += 1
+                    self.ok = 0
+    
+    def throttled(self, error):
+        # 收到限流信号: 批次和并发减半, 暂停一段时间; 连续被限流太多次时返回 False
+        with self.lock:
+            self.throttles += 1
+            if time.monotonic() < self.resume_at:
+                # 暂停前已经发出的请求, 同一次限流只处理一次
+                return True
+            self.strikes += 1
+            self.batch = max(MIN_THROTTLE_BATCH, self.batch // 2)
+            self.limit = max(1, self.limit // 2)
+            self.ok = 0
+            delay = min(MAX_THROTTLE_DELAY, self.profile["cooldown"] * 2 ** (self.strikes - 1))
+            self.resume_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+            return self.strikes <= MAX_THROTTLE_STRIKES
+    
+    def delay(self):
+        return max(0.0, self.resume_at - time.monotonic())
+    
+    def pause(self, cancel=None):
+        delay = self.delay()
+        if delay and cancel is not None:
+            cancel.wait(delay)
+        elif delay:
+            time.sleep(delay)
+    
+    def report(self):
+        with self.lock:
+            return {"throttled": self.throttles, "batch_size": self.batch, "connections": self.limit}
+
+class UIDFeeder:
+    # 按当前的批次大小从 uids 中切出下一批, 被限流的批次放回来优先重取
+    def __init__(self, uids, batch_size=FETCH_BATCH_SIZE, first_batch=None, throttle=None):
+        self.uids = uids
+        self.batch_size = max(1, min(int(batch_size), MAX_FETCH_BATCH_SIZE))
+        self.first_batch = first_batch
+        self.throttle = throttle
+        self.position = 0
+        self.retry = []
+    
+    def next(self):
+        size = self.throttle.batch if self.throttle is not None else self.batch_size
+        if self.retry:
+            chunk = self.retry.pop()
+            if len(chunk) > size:
+                # 被限流的批次按缩小后的批次大小重取
+                self.retry.append(chunk[size:])
+                chunk = chunk[:size]
+            return chunk
+        if self.position >= len(self.uids):
+            return None
+        if self.position == 0 and self.first_batch:
+            size = min(size, self.first_batch)
+        chunk = self.uids[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+    
+    def put_back(self, chunk):
+        self.retry.append(chunk)
+
+def new_throttle(creds, connections=None):
+    # adaptive 打开时批次大小和并发由控制器决定, 手动设置的批次大小和连接数不再使用
+    if not creds.get('adaptive'):
+        return None
+    profile = throttle_profile(creds['s'])
+    if connections is None:
+        connections = profile["in_flight"] if creds.get('engine') == "asyncio" else profile["connections"]
+    return Throttle(profile, connections)
+
+# ==========================================
+# 多连接并行扫描 (有上限的 IMAP 连接池)
+# ==========================================
+
+SCAN_POOL_SIZE = 1
+MAX_POOL_SIZE = 8
+
+def connect_mailbox(user, password, server, mailbox=None, diagnostics=None, qresync=False):
+    # mailbox: 不指定时按服务商选择 (Gmail 为所有邮件), 实际选中的文件夹记在 mail.mailbox
+    # qresync: 扫描用的连接才需要开启 (多一次往返), 连接池里只取头部的连接和删除用的连接不开
+    started = time.perf_counter()
+    mail = imaplib.IMAP4_SSL(server, timeout=30)
+    if diagnostics is not None:
+        # TCP + TLS 握手 + 问候 + CAPABILITY
+        diagnostics.add_phase("connect", time.perf_counter() - started)
+        instrument(mail, diagnostics)
+    _, data = mail.login(user, password)
+    capabilities = mail.capabilities + login_capabilities(data)
+    compressed = enable_compression(mail, capabilities)
+    mail.qresync = qresync and enable_qresync(mail, capabilities)
+    if diagnostics is not None:
+        diagnostics.connected(compressed)
+    mail.provider = detect_provider(capabilities, mail.welcome, server)
+    mail.folders = None
+    mail.mailbox = mailbox or provider_mailbox(mail.provider, list_folders(mail) if mail.provider else [])
+    status, data = mail.select(quote(mail.mailbox))
+    if status != 'OK':
+        # 文件夹不存在或不能选中 (多文件夹扫描时可能被其他客户端删除或改名)
+        mail.logout()
+        raise IMAPError((data[0] or b'').decode(errors='ignore') or f"Cannot open {mail.mailbox}")
+    return mail
+
+class IMAPPool:
+    # 按需建立连接, 总数不超过 size; 每个连接同一时刻只给一个线程使用
+    def __init__(self, user, password, server, size=SCAN_POOL_SIZE, first=None, diagnostics=None):
+        self.user = user
+        self.password = password
+        self.server = server
+        self.diagnostics = diagnostics
+        # 新连接选中与第一个连接相同的文件夹, 不必每个连接都 LIST 一次
+        self.mailbox = first.mailbox if first is not None else None
+        self.size = max(1, min(int(size), MAX_POOL_SIZE))
+        self.idle = queue.LifoQueue()
+        self.connections = []
+        self.created = 0
+        self.lock = threading.Lock()
+        if first is not None:
+            self.connections.append(first)
+            self.created = 1
+            self.idle.put(first)
+    
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if not create:
+            return self.idle.get()
+        try:
+            mail = connect_mailbox(self.user, self.password, self.server, self.mailbox, self.diagnostics)
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+        with self.lock:
+            self.connections.append(mail)
+        return mail
+    
+    def release(self, mail):
+        self.idle.put(mail)
+    
+    def discard(self, mail):
+        # 断开的连接不再放回, 下次 acquire 时重新建立
+        with self.lock:
+            if mail in self.connections:
+                self.connections.remove(mail)
+            self.created -= 1
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+    
+    def close(self, keep=None):
+        # keep: 借来的会话连接, 由会话自己管理, 这里不退出
+        for mail in self.connections:
+            if mail is keep:
+                continue
+            try:
+                mail.logout()
+            except Exception:
+                pass
+        self.connections = []
+
+# ==========================================
+# 会话级持久连接 (跨多次操作复用, 空闲时 NOOP 保活)
+# ==========================================
+
+KEEPALIVE_INTERVAL = 120
+SESSION_IDLE_TIMEOUT = 15 * 60
+CONNECTION_ERRORS = (imaplib.IMAP4.error, OSError)
+
+class SessionConnection:
+    # 每个浏览器会话一个已登录的连接; 同一时刻只给一个调用方使用, 保活线程不会与之冲突
+    def __init__(self, user, password, server, mailbox=None):
+        self.user = user
+        self.password = password
+        self.server = server
+        self.mailbox = mailbox
+        self.mail = None
+        self.connects = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def matches(self, user, server):
+        return self.user == user and self.server == server
+    
+    def checkout(self, diagnostics=None):
+        # diagnostics: 本次操作的计数器, 归还连接时解除, 保活的 NOOP 不计入
+        self.lock.acquire()
+        try:
+            if self.mail is not None:
+                try:
+                    if diagnostics is not None:
+                        instrument(self.mail, diagnostics)
+                    # 重新 SELECT: 确认连接还活着, 同时拿到最新的 UIDVALIDITY 和邮件数
+                    status, _ = self.mail.select(quote(self.mail.mailbox))
+                    if status == 'OK':
+                        return self.mail
+                    # 文件夹被删除或改名时停在未选中状态, 之后的 UID 命令会报莫名其妙的错;
+                    # 重新连接, 仍然打不开时由 connect_mailbox 说明原因
+                    self.drop()
+                except CONNECTION_ERRORS:
+                    self.drop()
+            self.mail = connect_mailbox(self.user, self.password, self.server, self.mailbox, diagnostics, qresync=True)
+            self.connects += 1
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.keepalive, daemon=True)
+                self.thread.start()
+            return self.mail
+        except Exception:
+            self.lock.release()
+            raise
+    
+    def reconnect(self, diagnostics=None):
+        # 已经 checkout 的连接在使用中被断开 (例如说明限流的 BYE): 不交还锁, 直接换一个新连接
+        self.drop()
+        self.mail = connect_mailbox(self.user, self.password, self.server, self.mailbox, diagnostics, qresync=True)
+        self.connects += 1
+        return self.mail
+    
+    def release(self, mail, healthy=True):
+        # 出错后的连接可能停在半条响应上, 不再复用
+        self.last_used = time.monotonic()
+        if getattr(mail, "diagnostics", None) is not None:
+            mail.diagnostics = None
+        if not healthy and mail is self.mail:
+            self.drop()
+        self.lock.release()
+    
+    def drop(self):
+        if self.mail is not None:
+            try:
+                self.mail.shutdown()
+            except Exception:
+                pass
+        self.mail = None
+    
+    def keepalive(self):
+        while not self.stopped.wait(KEEPALIVE_INTERVAL):
+            # 正在使用中就跳过这一轮
+            if not self.lock.acquire(blocking=False):
+                continue
+            try:
+                if self.mail is None:
+                    return
+                if time.monotonic() - self.last_used > SESSION_IDLE_TIMEOUT:
+                    # 会话长时间没有操作 (多半已关闭页面), 主动退出
+                    self.mail.logout()
+                    self.mail = None
+                    return
+                self.mail.noop()
+            except CONNECTION_ERRORS:
+                self.drop()
+                return
+            finally:
+                self.lock.release()
+    
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            if self.mail is not None:
+                try:
+                    self.mail.logout()
+                except Exception:
+                    pass
+            self.mail = None
+
+def fetch_headers_parallel(pool, uids, batch_size=FETCH_BATCH_SIZE, first_batch=None):
+    # 各批次分发到连接池中的连接上, 按完成顺序返回; 合并时以 UID 判断新旧, 与顺序无关
+    def work(chunk):
+        mail = pool.acquire()
+        try:
+            # 被拒绝的批次抛出 IMAPError, 扫描报错且不推进 last_uid, 与顺序扫描一致
+            return next(fetch_headers(mail, chunk, len(chunk), diagnostics=pool.diagnostics))
+        finally:
+            pool.release(mail)
+    
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = [executor.submit(work, chunk) for chunk in chunk_uids(uids, batch_size, first_batch)]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+def fetch_headers_adaptive(pool, uids, throttle, first_batch=None, cancel=None):
+    # 与 fetch_headers_parallel 相同, 但批次大小和同时使用的连接数由 throttle 决定; 被限流的批次暂停后重取
+    feeder = UIDFeeder(uids, first_batch=first_batch, throttle=throttle)
+    
+    def work(chunk):
+        throttle.pause(cancel)
+        mail = pool.acquire()
+        started = time.perf_counter()
+        try:
+            status, msg_data = checked(mail.uid('FETCH', compress_uids(chunk), HEADER_FETCH_ITEMS))
+        except ThrottledError:
+            pool.release(mail)
+            raise
+        except Exception:
+            # BYE / 超时之后这个连接不能再用
+            pool.discard(mail)
+            raise
+        pool.release(mail)
+        seconds = time.perf_counter() - started
+        if status != 'OK':
+            raise fetch_failed(chunk, msg_data, pool.diagnostics)
+        meta = {}
+        return chunk, parse_fetch_response(msg_data, meta), meta, seconds
+    
+    running = {}
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        try:
+            while True:
+                while len(running) < throttle.limit and not cancelled(cancel):
+                    chunk = feeder.next()
+                    if chunk is None:
+                        break
+                    running[executor.submit(work, chunk)] = chunk
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk = running.pop(future)
+                    try:
+                        chunk, headers, meta, seconds = future.result()
+                    except Exception as e:
+                        if not is_throttled(e) or not throttle.throttled(e):
+                            raise
+                        if pool.diagnostics is not None:
+                            pool.diagnostics.failure(f"throttled: {type(e).__name__}")
+                        feeder.put_back(chunk)
+                        continue
+                    throttle.observe(len(chunk), seconds)
+                    yield chunk, headers, meta
+        finally:
+            for future in running:
+                future.cancel()
+
+# ==========================================
+# 流式扫描 (每处理完一批就回调一次进度)
+# ==========================================
+
+FIRST_BATCH_SIZE = 25
+
+def cancelled(cancel):
+    return cancel is not None and cancel.is_set()
+
+def finish_scan(state, last_uid, stopped, modseq=None):
+    # 取消时不推进 last_uid 和 modseq, 下次扫描补齐剩下的邮件
+    if not stopped:
+        state["last_uid"] = last_uid
+        state["partial"] = False
+        state["processed"] = []
+        state["modseq"] = modseq
+
+def iter_scan_inbox(user, password, server, limit, batch_size=FETCH_BATCH_SIZE, state=None,
+                    pool_size=SCAN_POOL_SIZE, filters=None, session=None, cancel=None, diagnostics=None,
+                    mailbox=None, throttle=None):
+    # 每处理完一批就产出 (已处理, 总数), 结果随时可以从 state 中读取
+    # session: 会话级持久连接, 有的话直接复用, 省去握手和登录
+    # cancel: threading.Event, 设置后在当前批次结束时停止, 已合并的结果保留
+    # throttle: 自适应限流控制器, 有的话忽略 batch_size 和 pool_size
+    if state is None:
+        state = new_scan_state()
+    
+    if session:
+        mail = session.checkout(diagnostics)
+    else:
+        mail = connect_mailbox(user, password, server, mailbox, diagnostics, qresync=True)
+    if throttle is not None:
+        pool_size = throttle.max_connections
+    pool = IMAPPool(user, password, server, pool_size, first=mail, diagnostics=diagnostics)
+    healthy = False
+    try:
+        uidvalidity = get_uidvalidity(mail)
+        modseq = get_highestmodseq(mail)
+        criteria = scan_criteria(state, uidvalidity)
+        vanished = sync_changes(mail, state) if criteria != 'ALL' else None
+        status, messages = checked(mail.uid('SEARCH', None, criteria))
+        if status != 'OK':
+            raise IMAPError("Failed to search emails")
+        
+        candidates = None
+        filtered = filter_criteria(criteria, state, filters, mail.provider)
+        if filtered:
+            candidates = search_candidates(mail, filtered)
+        uids, last_uid = plan_scan(
+            state, uidvalidity, criteria, messages[0].split(), limit,
+            candidates, None if not filtered else candidates is not None
+        )
+        state["stats"].update(vanished=vanished, mailbox=mail.mailbox, provider=mail.provider)
+        yield 0, len(uids)
+        
+        if throttle is not None:
+            batches = fetch_headers_adaptive(pool, uids, throttle, FIRST_BATCH_SIZE, cancel)
+        elif pool.size > 1 and len(uids) > batch_size:
+            batches = fetch_headers_parallel(pool, uids, batch_size, FIRST_BATCH_SIZE)
+        else:
+            batches = fetch_headers(mail, uids, batch_size, first_batch=FIRST_BATCH_SIZE, diagnostics=diagnostics)
+        
+        state["partial"] = True
+        done = 0
+        for chunk, headers, meta in batches:
+            merge_headers(state, chunk, headers, meta, diagnostics)
+            done += len(chunk)
+            yield done, len(uids)
+            if cancelled(cancel):
+                break
+        
+        if throttle is not None:
+            state["stats"].update(throttle.report())
+        finish_scan(state, last_uid, done < len(uids), modseq)
+        healthy = True
+    finally:
+        if session:
+            # 限流时被断开的会话连接已经从连接池中移除
+            healthy = healthy and mail in pool.connections
+            pool.close(keep=mail)
+            session.release(mail, healthy)
+        else:
+            pool.close()
+
+def scan_inbox(user, password, server, limit, batch_size=FETCH_BATCH_SIZE, state=None, pool_size=SCAN_POOL_SIZE,
+               filters=None, session=None, on_progress=None, cancel=None, diagnostics=None, mailbox=None,
+               throttle=None):
+    # on_progress(done, total): 每批合并后调用, 此时 state 中已经有最新的部分结果
+    try:
+        if state is None:
+            state = new_scan_state()
+        
+        for done, total in iter_scan_inbox(user, password, server, limit, batch_size, state, pool_size, filters,
+                                           session, cancel, diagnostics, mailbox, throttle):
+            if on_progress:
+                on_progress(done, total)
+        
+        return state_rows(state)
+    
+    except Exception as e:
+        return error_message(e, "" if throttle is not None else ADAPTIVE_HINT)
+
+# ==========================================
+# 整个邮箱扫描 (按 UID 区间从旧到新流式获取, 只保留发件人汇总)
+# ==========================================
+# 不做全量 UID SEARCH, 也不逐封保存; 内存只与发件人数量和单批大小有关, 与邮件总数无关。
+# 每个区间处理完就推进 last_uid, 取消或出错后下次从断点继续。
+
+MIN_WHOLE_BATCH = 100
+MAX_WHOLE_BATCH = 2000
+MAX_WINDOW_SPAN = 4 * MAX_WHOLE_BATCH
+TARGET_BATCH_SECONDS = 0.5
+
+def get_uidnext(mail):
+    _, data = mail.response('UIDNEXT')
+    if data and data[-1]:
+        return int(data[-1])
+    # 服务器没有返回 UIDNEXT 时, 取最后一封邮件的 UID
+    _, data = mail.response('EXISTS')
+    if not data or not data[-1] or int(data[-1]) == 0:
+        return 1
+    status, msg_data = mail.uid('FETCH', '*', '(UID)')
+    for part in msg_data or []:
+        match = UID_RE.search(part[0] if isinstance(part, tuple) else part or b'')
+        if status == 'OK' and match:
+            return int(match.group(1)) + 1
+    return 1
+
+class BatchSizer:
+    # 按每批实际耗时调整批次: 往返延迟占大头时加大, 服务器变慢时缩小; 每次最多翻倍或减半
+    # UID 可能不连续 (删过邮件), 区间跨度按观测到的密度换算, 并且不超过 MAX_WINDOW_SPAN
+    def __init__(self, size=FIRST_BATCH_SIZE, target=TARGET_BATCH_SECONDS):
+        self.size = size
+        self.target = target
+        self.density = 1.0
+    
+    def span(self):
+        return max(1, min(MAX_WINDOW_SPAN, int(self.size / self.density)))
+    
+    def observe(self, span, count, seconds):
+        observed = max(count / span, 1 / MAX_WINDOW_SPAN)
+        self.density = (self.density + observed) / 2
+        if count and seconds > 0:
+            wanted = count * self.target / seconds
+            wanted = min(max(wanted, self.size / 2), self.size * 2)
+            self.size = int(min(MAX_WHOLE_BATCH, max(MIN_WHOLE_BATCH, wanted)))
+    
+    def throttled(self):
+        self.size = max(MIN_WHOLE_BATCH, self.size // 2)
+
+def reconnect_mailbox(mail, user, password, server, session=None, diagnostics=None):
+    # 连接被断开后换一个连接, 打开同一个文件夹; 会话连接由会话重新建立, 仍由调用方持有
+    if session:
+        return session.reconnect(diagnostics)
+    try:
+        mail.shutdown()
+    except Exception:
+        pass
+    return connect_mailbox(user, password, server, mail.mailbox, diagnostics)
+
+def iter_scan_mailbox(user, password, server, state=None, filters=None, session=None, cancel=None,
+                      diagnostics=None, mailbox=None, throttle=None):
+    # 每个区间处理完产出 (已处理的 UID 范围, 总 UID 范围)
+    # throttle: 只用来处理限流 (暂停后缩小区间重取), 批次大小仍由 BatchSizer 按耗时调整
+    if state is None:
+        state = new_scan_state(aggregate=True)
+    
+    if session:
+        mail = session.checkout(diagnostics)
+    else:
+        mail = connect_mailbox(user, password, server, mailbox, diagnostics)
+    healthy = False
+    try:
+        uidvalidity = get_uidvalidity(mail)
+        if scan_criteria(state, uidvalidity) == 'ALL':
+            state.update(new_scan_state(aggregate=True))
+        state["uidvalidity"] = uidvalidity
+        
+        # 首次扫描不能排除已知发件人, 否则他们之后的邮件不会计入汇总
+        window_filters = dict(filters or {}, exclude_known=bool((filters or {}).get("exclude_known"))
+                              and state["last_uid"] > 0)
+        server_filter = True if window_filters.get("server_side") else None
+        stats = state["stats"] = {"server_filter": server_filter, "in_scope": 0, "candidates": 0, "fetched": 0,
+                                  "mailbox": mail.mailbox, "provider": mail.provider}
+        
+        start, end = state["last_uid"] + 1, get_uidnext(mail) - 1
+        total = max(0, end - start + 1)
+        sizer = BatchSizer()
+        yield 0, total
+        
+        lo = start
+        while lo <= end and not cancelled(cancel):
+            hi = min(end, lo + sizer.span() - 1)
+            started = time.perf_counter()
+            uid_set = f"{lo}:{hi}"
+            headers, meta = {}, {}
+            try:
+                if server_filter:
+                    candidates = search_candidates(mail, filter_criteria(f"UID {uid_set}", state, window_filters,
+                                                                         mail.provider))
+                    if candidates is None:
+                        server_filter = stats["server_filter"] = False
+                    else:
+                        uid_set = compress_uids(candidates)
+                
+                if uid_set:
+                    status, msg_data = checked(mail.uid('FETCH', uid_set, HEADER_FETCH_ITEMS))
+                    if status != 'OK':
+                        # 不能推进 last_uid 越过没取到的区间; 之前的区间已经保存, 下次从 lo 继续
+                        raise fetch_failed(candidates if server_filter else range(lo, hi + 1), msg_data,
+                                           diagnostics)
+                    headers = parse_fetch_response(msg_data, meta)
+            except (ThrottledError, imaplib.IMAP4.abort) as e:
+                # 被限流时暂停后用小一半的区间从 lo 重取; 说明限流的 BYE 会断开连接, 要先重新连接同一个文件夹
+                # 其他断开 (超时 / 普通 BYE) 照常报错, 进度已经保存, 下次从这里继续
+                if throttle is None or not is_throttled(e) or not throttle.throttled(e):
+                    raise
+                if diagnostics is not None:
+                    diagnostics.failure(f"throttled: {type(e).__name__}")
+                sizer.throttled()
+                throttle.pause(cancel)
+                if isinstance(e, imaplib.IMAP4.abort):
+                    mail = reconnect_mailbox(mail, user, password, server, session, diagnostics)
+                    if get_uidvalidity(mail) != uidvalidity:
+                        raise IMAPError("The mailbox changed during the scan, scan again")
+                continue
+            merge_headers(state, sorted(headers), headers, meta, diagnostics)
+            sizer.observe(hi - lo + 1, len(headers), time.perf_counter() - started)
+            
+            stats["fetched"] += len(headers)
+            stats["candidates"] += len(headers)
+            if not server_filter:
+                stats["in_scope"] += len(headers)
+            state["last_uid"] = hi
+            lo = hi + 1
+            yield hi - start + 1, total
+        
+        if server_filter:
+            # 过滤时不知道区间里一共有多少封, 只有首次全量扫描能用邮箱总数
+            _, data = mail.response('EXISTS')
+            stats["in_scope"] = int(data[-1]) if start == 1 and data and data[-1] else 0
+        if throttle is not None:
+            stats.update(throttle.report(), batch_size=sizer.size, connections=1)
+        state["partial"] = False
+        healthy = True
+    finally:
+        if session:
+            session.release(mail, healthy)
+        else:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+def scan_whole_inbox(user, password, server, state=None, filters=None, session=None, on_progress=None,
+                     cancel=None, diagnostics=None, mailbox=None, throttle=None):
+    try:
+        if state is None:
+            state = new_scan_state(aggregate=True)
+        
+        for done, total in iter_scan_mailbox(user, password, server, state, filters, session, cancel,
+                                             diagnostics, mailbox, throttle):
+            if on_progress:
+                on_progress(done, total)
+        
+        return state_rows(state)
+    
+    except Exception as e:
+        return error_message(e, "" if throttle is not None else ADAPTIVE_HINT)
+
+# ==========================================
+# 批量删除 (合并 SEARCH, 序列集 STORE, UID EXPUNGE / MOVE)
+# ==========================================
+
+DELETE_SEARCH_GROUP = 20
+MAX_UID_SET_LENGTH = 4000
+
+FROM_FETCH_ITEMS = '(UID BODY.PEEK[HEADER.FIELDS (FROM)])'
+
+TRASH_NAMES = ["trash", "deleted items", "deleted messages", "deleted", "已删除", "已删除邮件"]
+
+LIST_RE = re.compile(rb'\((?P<flags>[^)]*)\) (?P<delim>"[^"]*"|NIL) (?P<name>.*)$')
+MUTF7_RE = re.compile(r'&([A-Za-z0-9+,]*)-')
+
+def decode_folder_name(name):
+    # LIST 返回的文件夹名是修改过的 UTF-7 (RFC 3501 5.1.3): "&XfJT0ZAB-" -> "已删除", "&-" -> "&"
+    # 只用于比较和显示, SELECT / MOVE 仍然用原始名称
+    def decode(match):
+        text = match.group(1)
+        if not text:
+            return "&"
+        try:
+            return base64.b64decode(text.replace(",", "/") + "=" * (-len(text) % 4)).decode("utf-16-be")
+        except (ValueError, UnicodeDecodeError):
+            return match.group(0)
+    return MUTF7_RE.sub(decode, name)
+
+def uid_sets(uids):
+    # 把 UID 压缩成若干个序列集, 每个都不超过命令行长度限制
+    current = []
+    length = 0
+    for part in compress_uids(uids).split(","):
+        if not part:
+            continue
+        if current and length + len(part) + 1 > MAX_UID_SET_LENGTH:
+            yield ",".join(current)
+            current = []
+            length = 0
+        current.append(part)
+        length += len(part) + 1
+    if current:
+        yield ",".join(current)
+
+def sender_criteria(senders):
+    # ["a", "b", "c"] -> OR OR FROM "a" FROM "b" FROM "c"
+    terms = [f'FROM "{s}"' for s in senders]
+    return "OR " * (len(terms) - 1) + " ".join(terms)
+
+def match_sender(from_header, senders):
+    # 与服务器的 FROM 搜索一致: 不区分大小写的子串匹配, 地址完全相同的优先
+    text = from_header.lower()
+    address = extract_email_address(text)
+    for sender_email in senders:
+        if sender_email.lower() == address:
+            return sender_email
+    for sender_email in senders:
+        if sender_email.lower() in text:
+            return sender_email
+    return None
+
+def count_by_sender(header_blocks, senders):
+    counts = dict.fromkeys(senders, 0)
+    for raw in header_blocks:
+        from_header = parse_header_block(raw, (b"from",)).get("from", "")
+        sender_email = match_sender(decode_words(from_header), senders)
+        if sender_email:
+            counts[sender_email] += 1
+    return counts
+
+def parse_list_response(data):
+    # LIST 响应 -> [(属性集合, 文件夹名)]
+    folders = []
+    for item in data or []:
+        if isinstance(item, tuple):
+            # 文件夹名以字面量形式返回: (b'(\\HasNoChildren) "/" {12}', b'name')
+            match = LIST_RE.match(item[0])
+            name = item[1]
+        else:
+            match = LIST_RE.match(item or b'')
+            name = match.group('name') if match else None
+        if not match or name is None:
+            continue
+        name = name.strip()
+        if name.startswith(b'"') and name.endswith(b'"'):
+            name = name[1:-1].replace(b'\\"', b'"').replace(b'\\\\', b'\\')
+        flags = set(match.group('flags').decode(errors='ignore').upper().split())
+        folders.append((flags, name.decode(errors='ignore')))
+    return folders
+
+def find_folder(folders, flag, names):
+    # 优先用 SPECIAL-USE 标记, 没有时按常见的文件夹名 (163 / QQ 等没有 SPECIAL-USE, 名称要先解码)
+    for flags, name in folders:
+        if flag in flags:
+            return name
+    for flags, name in folders:
+        if folder_leaf(name) in names:
+            return name
+    return None
+
+def find_trash_folder(folders):
+    return find_folder(folders, "\\TRASH", TRASH_NAMES)
+
+def removal_method(capabilities, trash, use_trash=True):
+    if use_trash and trash and "MOVE" in capabilities:
+        return "move"
+    if "UIDPLUS" in capabilities:
+        return "uid_expunge"
+    return "expunge"
+
+def search_senders(mail, senders):
+    status, messages = checked(mail.uid('SEARCH', None, sender_criteria(senders)))
+    if status != 'OK' or not messages[0]:
+        return []
+    return [int(u) for u in messages[0].split()]
+
+def prepare_removal(mail, use_trash=True):
+    use_trash = provider_trash(getattr(mail, "provider", None), use_trash)
+    trash = None
+    if use_trash and "MOVE" in mail.capabilities:
+        trash = find_trash_folder(list_folders(mail))
+    return removal_method(mail.capabilities, trash, use_trash), trash
+
+def remove_uids(mail, uids, method, trash=None):
+    if method == "move":
+        for uid_set in uid_sets(uids):
+            checked(mail.uid('MOVE', uid_set, quote(trash)))
+        return
+    
+    for uid_set in uid_sets(uids):
+        checked(mail.uid('STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)'))
+    if method == "uid_expunge":
+        # 只清除本次标记的邮件, 不影响其他客户端标记为删除的邮件
+        for uid_set in uid_sets(uids):
+            checked(mail.uid('EXPUNGE', uid_set))
+    else:
+        mail.expunge()
+
+def delete_summary(counts, total, method):
+    senders = sum(1 for n in counts.values() if n)
+    if method == "move":
+        return f"Moved {total} emails from {senders} senders to Trash"
+    return f"Deleted {total} emails from {senders} senders"
+
+# ==========================================
+# 可恢复的分块删除 (检查点 + 断线重连 + 指数退避)
+# ==========================================
+
+DELETE_CHUNK_SIZE = 500
+MAX_DELETE_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+# 被限流 (NO [THROTTLED] 等) 也按断线处理: 等待后从检查点继续, 等待时间从服务商的暂停时间开始
+RETRYABLE_ERRORS = (imaplib.IMAP4.abort, OSError, ThrottledError)
+
+def new_delete_job(targets, folders=None):
+    # 删除任务的检查点, 保存在 session_state 中, 失败后可以从这里继续
+    # folders: 多文件夹删除时每个文件夹一个独立的检查点, 外层的计数和进度是各文件夹之和
+    return {
+        "targets": list(targets),
+        "uidvalidity": None,
+        "searched": 0,
+        "found": set(),
+        "counts": {},
+        "uids": None,
+        "done": 0,
+        "method": None,
+        # 被限流后缩小的批次 (补取 FROM 和每块删除的封数), None 为默认值
+        "batch": None,
+        # 当前这一组已补取的 FROM 头部 {UID: 头部}; 断线重连后从这里接着取, 不必整组重来
+        "headers": {},
+        "folders": {name: new_delete_job(targets) for name in folders} if folders else None,
+        "accounts": None,
+    }
+
+def delete_remaining(job):
+    if job["uids"] is None:
+        return None
+    return len(job["uids"]) - job["done"]
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY):
+    delay = min(MAX_RETRY_DELAY, base * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def slow_down(job, throttle, error, cancel=None):
+    # 被限流但连接还在: 缩小批次, 暂停后在原处重试; 连续被限流太多次时交给外层按断线处理
+    if throttle is None or not throttle.throttled(error):
+        raise error
+    job["batch"] = max(MIN_THROTTLE_BATCH, (job.get("batch") or DELETE_CHUNK_SIZE) // 2)
+    throttle.pause(cancel)
+
+def fetch_from_headers(mail, uids, job, throttle=None, cancel=None):
+    # 合并查询不知道每封邮件属于谁, 补取 FROM 头部来统计; 已取到的存在 job["headers"],
+    # 限流时只重取当前这一批, 断线重连后跳过已取到的
+    headers = job["headers"]
+    while True:
+        missing = [uid for uid in uids if uid not in headers]
+        if not missing:
+            return headers
+        chunk = missing[:job.get("batch") or MAX_FETCH_BATCH_SIZE]
+        try:
+            for _, batch, _ in fetch_headers(mail, chunk, len(chunk), FROM_FETCH_ITEMS):
+                headers.update(batch)
+        except ThrottledError as e:
+            slow_down(job, throttle, e, cancel)
+            continue
+        # 服务器不返回的 UID (已被其他客户端删除) 记为空头部, 不再重取
+        headers.update((uid, b"") for uid in chunk if uid not in headers)
+
+def run_delete_job(mail, job, use_trash=True, on_progress=None, cancel=None, throttle=None):
+    uidvalidity = get_uidvalidity(mail)
+    if job["uidvalidity"] != uidvalidity:
+        # 第一次运行, 或重连后 UID 已经失效: 重新搜索, 已删除的邮件不会再被搜到
+        job.update(new_delete_job(job["targets"]), batch=job.get("batch"), headers={})
+        job["uidvalidity"] = uidvalidity
+    
+    groups = list(chunked(job["targets"], DELETE_SEARCH_GROUP))
+    while job["searched"] < len(groups):
+        if cancelled(cancel):
+            return
+        group = groups[job["searched"]]
+        try:
+            found = search_senders(mail, group)
+        except ThrottledError as e:
+            slow_down(job, throttle, e, cancel)
+            continue
+        if len(group) == 1:
+            job["counts"][group[0]] = len(found)
+        else:
+            headers = fetch_from_headers(mail, found, job, throttle, cancel)
+            job["counts"].update(count_by_sender(headers.values(), group))
+        job["found"].update(found)
+        job["headers"] = {}
+        job["searched"] += 1
+        if on_progress:
+            on_progress(job)
+    
+    if job["uids"] is None:
+        job["uids"] = sorted(job["found"])
+    
+    method, trash = prepare_removal(mail, use_trash)
+    job["method"] = method
+    # 每块单独 MOVE / EXPUNGE, 完成后才推进检查点; 中断或被限流的那一块重发也是幂等的
+    while job["done"] < len(job["uids"]):
+        if cancelled(cancel):
+            return
+        chunk = job["uids"][job["done"]:job["done"] + (job.get("batch") or DELETE_CHUNK_SIZE)]
+        try:
+            remove_uids(mail, chunk, method, trash)
+        except ThrottledError as e:
+            slow_down(job, throttle, e, cancel)
+            continue
+        job["done"] += len(chunk)
+        if on_progress:
+            on_progress(job)
+
+def delete_emails(user, password, server, targets, use_trash=True, job=None, session=None,
+                  on_progress=None, on_retry=None, cancel=None, diagnostics=None, mailbox=None):
+    # on_progress(job): 每组搜索 / 每块删除后调用; on_retry(error, delay): 断线后等待重连前调用
+    # cancel: 设置后在当前这一块结束时停止, 检查点保留, 之后可以继续
+    if job is None:
+        job = new_delete_job(targets)
+    # 删除总是按服务商配置处理限流, 不需要打开自适应
+    throttle = Throttle(throttle_profile(server))
+    
+    try:
+        attempt = 0
+        while not cancelled(cancel):
+            mail = None
+            checkpoint = (job["searched"], len(job.get("headers") or ()), job["done"])
+            try:
+                if session:
+                    mail = session.checkout(diagnostics)
+                    try:
+                        run_delete_job(mail, job, use_trash, on_progress, cancel, throttle)
+                    except Exception:
+                        session.release(mail, healthy=False)
+                        mail = None
+                        raise
+                    session.release(mail)
+                else:
+                    mail = connect_mailbox(user, password, server, mailbox, diagnostics)
+                    run_delete_job(mail, job, use_trash, on_progress, cancel, throttle)
+                    mail.logout()
+                break
+            except RETRYABLE_ERRORS as e:
+                if mail is not None and not session:
+                    try:
+                        mail.shutdown()
+                    except Exception:
+                        pass
+                if diagnostics is not None:
+                    diagnostics.failure(f"reconnect: {type(e).__name__}")
+                # 只要这次连接推进了检查点, 就重新开始计算重试次数
+                attempt = 1 if (job["searched"], len(job.get("headers") or ()), job["done"]) != checkpoint \
+                    else attempt + 1
+                if is_throttled(e):
+                    job["batch"] = max(MIN_THROTTLE_BATCH, (job.get("batch") or DELETE_CHUNK_SIZE) // 2)
+                if attempt > MAX_DELETE_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, throttle_profile(server)["cooldown"] if is_throttled(e)
+                                      else RETRY_BASE_DELAY)
+                if on_retry:
+                    on_retry(e, delay)
+                if cancel is not None:
+                    cancel.wait(delay)
+                else:
+                    time.sleep(delay)
+        
+        remaining = delete_remaining(job)
+        if cancelled(cancel) and remaining != 0:
+            left = f", {remaining} remaining" if remaining is not None else ""
+            return False, f"Cancelled ({job['done']} emails deleted{left}; progress saved)", job["counts"]
+        return True, delete_summary(job["counts"], job["done"], job["method"]), job["counts"]
+    
+    except Exception as e:
+        remaining = delete_remaining(job)
+        if remaining:
+            return False, f"{error_message(e)} ({job['done']} emails deleted, {remaining} remaining; progress saved)", job["counts"]
+        return False, error_message(e), job["counts"]
+
+# ==========================================
+# asyncio 引擎 (单连接上流水线发送多条 FETCH)
+# ==========================================
+
+SCAN_ENGINES = {
+    "threaded": "Threaded (imaplib)",
+    "asyncio": "Asyncio (pipelined)",
+}
+MAX_IN_FLIGHT = 8
+
+async def connect_mailbox_async(user, password, server, mailbox=None, diagnostics=None, qresync=False):
+    started = time.perf_counter()
+    mail = await AsyncIMAP.open(server, timeout=30)
+    if diagnostics is not None:
+        diagnostics.add_phase("connect", time.perf_counter() - started)
+        mail.diagnostics, mail.reported = diagnostics, mail.received
+    try:
+        await mail.login(user, password)
+        compressed = await mail.compress()
+        if diagnostics is not None:
+            diagnostics.connected(compressed)
+        if qresync:
+            await mail.enable_qresync()
+        mail.provider = detect_provider(mail.capabilities, mail.welcome, server)
+        folders = await list_folders_async(mail) if mail.provider else []
+        mail.mailbox = mailbox or provider_mailbox(mail.provider, folders)
+        await mail.select(mail.mailbox)
+    except Exception:
+        await mail.close()
+        raise
+    return mail
+
+async def scan_mailbox_async(user, password, server, limit, batch_size=FETCH_BATCH_SIZE, state=None,
+                             max_in_flight=MAX_IN_FLIGHT, mailbox=None, on_progress=None, filters=None,
+                             cancel=None, diagnostics=None, throttle=None):
+    # throttle: 自适应限流控制器, 有的话批次大小和在途 FETCH 数由它决定
+    if state is None:
+        state = new_scan_state()
+    
+    mail = await connect_mailbox_async(user, password, server, mailbox, diagnostics, qresync=True)
+    try:
+        uidvalidity = get_uidvalidity(mail)
+        modseq = get_highestmodseq(mail)
+        criteria = scan_criteria(state, uidvalidity)
+        vanished = await sync_changes_async(mail, state) if criteria != 'ALL' else None
+        status, messages = await mail.uid('SEARCH', None, criteria)
+        if status != 'OK':
+            raise IMAPError("Failed to search emails")
+        
+        candidates = None
+        filtered = filter_criteria(criteria, state, filters, mail.provider)
+        if filtered:
+            candidates = await search_candidates_async(mail, filtered)
+        uids, last_uid = plan_scan(
+            state, uidvalidity, criteria, (messages[0] or b'').split(), limit,
+            candidates, None if not filtered else candidates is not None
+        )
+        state["stats"].update(vanished=vanished, mailbox=mail.mailbox, provider=mail.provider)
+        
+        # 最多 max_in_flight 条 FETCH 同时在途, 不必等上一条返回; 一条完成再发下一条, 批次大小可以随时调整
+        feeder = UIDFeeder(uids, batch_size, FIRST_BATCH_SIZE, throttle)
+        
+        async def fetch(chunk):
+            started = time.perf_counter()
+            status, msg_data = await mail.uid('FETCH', compress_uids(chunk), HEADER_FETCH_ITEMS)
+            seconds = time.perf_counter() - started
+            if status != 'OK':
+                raise fetch_failed(chunk, msg_data, diagnostics)
+            meta = {}
+            return chunk, parse_fetch_response(msg_data, meta), meta, seconds
+        
+        if on_progress:
+            on_progress(0, len(uids))
+        state["partial"] = True
+        done = 0
+        running = {}
+        try:
+            while not cancelled(cancel):
+                if throttle is not None and throttle.delay():
+                    await asyncio.sleep(throttle.delay())
+                limit_in_flight = throttle.limit if throttle is not None else max(1, int(max_in_flight))
+                while len(running) < limit_in_flight:
+                    chunk = feeder.next()
+                    if chunk is None:
+                        break
+                    running[asyncio.ensure_future(fetch(chunk))] = chunk
+                if not running:
+                    break
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                broken = False
+                for task in finished:
+                    chunk = running.pop(task)
+                    try:
+                        chunk, headers, meta, seconds = task.result()
+                    except Exception as e:
+                        if throttle is None or not is_throttled(e) or not throttle.throttled(e):
+                            raise
+                        if diagnostics is not None:
+                            diagnostics.failure(f"throttled: {type(e).__name__}")
+                        feeder.put_back(chunk)
+                        # 被 BYE 断开时要换一个连接
+                        broken = broken or mail.closed
+                        continue
+                    if throttle is not None:
+                        throttle.observe(len(chunk), seconds)
+                    merge_headers(state, chunk, headers, meta, diagnostics)
+                    done += len(chunk)
+                    if on_progress:
+                        on_progress(done, len(uids))
+                if broken:
+                    # 在途的 FETCH 都放回去, 暂停后重新连接同一个文件夹
+                    for task, chunk in running.items():
+                        task.cancel()
+                        feeder.put_back(chunk)
+                    running = {}
+                    await mail.close()
+                    await asyncio.sleep(throttle.delay())
+                    mail = await connect_mailbox_async(user, password, server, mail.mailbox, diagnostics)
+        finally:
+            # 取消时丢弃还没返回的 FETCH, 迟到的响应由读取循环忽略
+            for task in running:
+                task.cancel()
+        
+        if throttle is not None:
+            state["stats"].update(throttle.report())
+        finish_scan(state, last_uid, done < len(uids), modseq)
+        return state_rows(state)
+    finally:
+        await mail.logout()
+
+async def scan_mailboxes_async(jobs):
+    # 在同一个事件循环里并发扫描多个邮箱/文件夹, 每个 job 是 scan_mailbox_async 的参数
+    return await asyncio.gather(*(scan_mailbox_async(**job) for job in jobs), return_exceptions=True)
+
+async def remove_messages_async(mail, uids, use_trash=True, max_in_flight=MAX_IN_FLIGHT):
+    if not uids:
+        return None
+    use_trash = provider_trash(mail.provider, use_trash)
+    trash = None
+    if use_trash and "MOVE" in mail.capabilities:
+        trash = find_trash_folder(await list_folders_async(mail))
+    method = removal_method(mail.capabilities, trash, use_trash)
+    semaphore = asyncio.Semaphore(max(1, int(max_in_flight)))
+    
+    async def send(*args):
+        async with semaphore:
+            return await mail.uid(*args)
+    
+    sets = list(uid_sets(uids))
+    if method == "move":
+        await asyncio.gather(*(send('MOVE', uid_set, quote(trash)) for uid_set in sets))
+        return method
+    
+    await asyncio.gather(*(send('STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)') for uid_set in sets))
+    if method == "uid_expunge":
+        await asyncio.gather(*(send('EXPUNGE', uid_set) for uid_set in sets))
+    else:
+        await mail.expunge()
+    return method
+
+async def delete_senders_async(user, password, server, targets, max_in_flight=MAX_IN_FLIGHT, mailbox=None,
+                               use_trash=True, cancel=None, diagnostics=None):
+    # 每个发件人单独 SEARCH, 但全部流水线发送, 顺便得到准确的逐个计数
+    mail = await connect_mailbox_async(user, password, server, mailbox, diagnostics)
+    try:
+        semaphore = asyncio.Semaphore(max(1, int(max_in_flight)))
+        
+        async def search(sender_email):
+            async with semaphore:
+                status, messages = await mail.uid('SEARCH', None, f'(FROM "{sender_email}")')
+            if status != 'OK' or not messages[0]:
+                return sender_email, []
+            return sender_email, [int(u) for u in messages[0].split()]
+        
+        found = dict(await asyncio.gather(*(search(s) for s in targets)))
+        if cancelled(cancel):
+            return None, [], None
+        uids = sorted({uid for sender_uids in found.values() for uid in sender_uids})
+        method = await remove_messages_async(mail, uids, use_trash, max_in_flight)
+        counts = {sender: len(sender_uids) for sender, sender_uids in found.items()}
+        return counts, uids, method
+    finally:
+        await mail.logout()
+
+def scan_inbox_asyncio(user, password, server, limit, batch_size=FETCH_BATCH_SIZE, state=None,
+                       max_in_flight=MAX_IN_FLIGHT, filters=None, on_progress=None, cancel=None, diagnostics=None,
+                       mailbox=None, throttle=None):
+    try:
+        if state is None:
+            state = new_scan_state()
+        
+        return asyncio.run(scan_mailbox_async(
+            user, password, server, limit, batch_size, state, max_in_flight, mailbox,
+            on_progress=on_progress, filters=filters, cancel=cancel, diagnostics=diagnostics, throttle=throttle
+        ))
+    
+    except Exception as e:
+        return error_message(e, "" if throttle is not None else ADAPTIVE_HINT)
+
+def delete_emails_asyncio(user, password, server, targets, max_in_flight=MAX_IN_FLIGHT, use_trash=True,
+                          cancel=None, diagnostics=None, job=None, mailbox=None):
+    # 所有删除命令一起流水线发送, 只能在搜索结束、删除开始前取消
+    # job: 可选的删除检查点, 结束后写入计数 (多文件夹删除时汇总用), 不能用来继续
+    try:
+        counts, uids, method = asyncio.run(delete_senders_async(
+            user, password, server, targets, max_in_flight, mailbox, use_trash, cancel, diagnostics
+        ))
+        if counts is None:
+            return False, "Cancelled (no emails deleted)", {}
+        if job is not None:
+            job.update(counts=counts, uids=uids, done=len(uids), method=method)
+        return True, delete_summary(counts, len(uids), method), counts
+    
+    except Exception as e:
+        return False, error_message(e), {}
+
+# ==========================================
+# 多文件夹扫描 (每个文件夹一个连接并发扫描, 按发件人合并结果)
+# ==========================================
+# 服务器规则常把订阅邮件放进 Promotions / Newsletters / Spam 等文件夹, 只扫描收件箱会漏掉它们。
+# 每个文件夹的 UIDVALIDITY 和 UID 各自独立, 所以扫描状态、增量扫描和删除检查点都按文件夹分开保存,
+# 结果表再从各文件夹的统计合并: 封数和大小相加, 发件人信息取最近收到的那封, Folders 列记录分布。
+
+FOLDER_WORKERS = 4
+# 不能选中、或者不该当作订阅邮件来源的文件夹
+SKIP_FOLDER_FLAGS = {"\\NOSELECT", "\\NONEXISTENT", "\\TRASH", "\\SENT", "\\DRAFTS"}
+JUNK_NAMES = ["spam", "junk", "junk email", "junk e-mail", "bulk mail", "垃圾邮件"]
+NEWSLETTER_NAMES = ["promotions", "newsletters", "newsletter", "updates", "social", "marketing", "订阅邮件", "广告邮件"]
+SKIP_FOLDER_NAMES = TRASH_NAMES + ["sent", "sent items", "sent messages", "sent mail", "drafts", "已发送", "草稿箱"]
+
+def folder_leaf(name):
+    # "INBOX.Newsletters" / "[Gmail]/Spam" / "&V4NXPpCuTvY-" -> 最后一级解码后的小写名称
+    return decode_folder_name(name).replace("/", ".").split(".")[-1].strip().lower()
+
+def scan_folder_choices(folders, provider=None):
+    # 返回 (可选的文件夹, 默认选中的文件夹)
+    # 默认: 收件箱 (Gmail 为所有邮件) + 垃圾邮件 + 常见的订阅邮件文件夹;
+    # Gmail 的标签都包含在所有邮件里, 再选会重复计数, 所以只加垃圾邮件 (它不在所有邮件中)
+    choices = [name for flags, name in folders
+               if not flags & SKIP_FOLDER_FLAGS and folder_leaf(name) not in SKIP_FOLDER_NAMES]
+    inbox = provider_mailbox(provider, folders)
+    if inbox.upper() == "INBOX":
+        # INBOX 不区分大小写 (RFC 3501), 服务器可能列为 "Inbox"; 用 LIST 返回的写法
+        inbox = next((name for name in choices if name.upper() == "INBOX"), inbox)
+    defaults = [inbox, find_folder(folders, "\\JUNK", JUNK_NAMES)]
+    if provider != "gmail":
+        defaults += [name for name in choices if folder_leaf(name) in NEWSLETTER_NAMES]
+    defaults = [name for name in dict.fromkeys(defaults) if name in choices]
+    return choices, defaults
+
+def list_scan_folders(user, password, server):
+    # 登录页上选择文件夹用: 返回 (可选的文件夹, 默认选中的文件夹) 或 "Error: ..."
+    try:
+        mail = connect_mailbox(user, password, server)
+        try:
+            return scan_folder_choices(list_folders(mail), mail.provider)
+        finally:
+            mail.logout()
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+def labelled_error(label, message):
+    # "Error: ..." -> "Error: 文件夹或账户: ..."
+    return f"Error: {label}: {message[len('Error: '):] if message.startswith('Error: ') else message}"
+
+def parse_breakdown(text):
+    # "INBOX (12), Spam (3)" -> {"INBOX": 12, "Spam": 3}
+    parts = (part.rsplit(" (", 1) for part in text.split(", ")) if text else []
+    return {name: int(count.rstrip(")")) for name, count in parts}
+
+def merge_rows(parts, column):
+    # parts: {文件夹名或账户: 这一部分的结果行}, 按发件人合并; column 列记录每一部分的封数
+    # 行里已有的分布列 (例如各账户的 Folders) 按名称相加
+    merged = {}
+    for label, part_rows in parts.items():
+        for row in part_rows:
+            for name in BREAKDOWN_COLUMNS:
+                if name in row:
+                    row[name] = parse_breakdown(row[name])
+            row[column] = {label: row["Emails"] or 0}
+            current = merged.get(row["Email"])
+            if current is None:
+                merged[row["Email"]] = row
+                continue
+            newer = row["Last Received"] is not None and (
+                current["Last Received"] is None or row["Last Received"] > current["Last Received"])
+            if newer:
+                current.update((key, value) for key, value in row.items()
+                               if key not in STAT_COLUMNS and key not in BREAKDOWN_COLUMNS)
+            for name in BREAKDOWN_COLUMNS:
+                for part, count in row.get(name, {}).items():
+                    breakdown = current.setdefault(name, {})
+                    breakdown[part] = breakdown.get(part, 0) + count
+            current["Emails"] = (current["Emails"] or 0) + (row["Emails"] or 0)
+            current["Size (MB)"] = round((current["Size (MB)"] or 0) + (row["Size (MB)"] or 0), 2)
+            firsts = [t for t in (current["First Received"], row["First Received"]) if t is not None]
+            lasts = [t for t in (current["Last Received"], row["Last Received"]) if t is not None]
+            current["First Received"] = min(firsts) if firsts else None
+            current["Last Received"] = max(lasts) if lasts else None
+            # 与 sender_stats 相同: 平均间隔换算成每周封数
+            span_days = 0
+            if firsts and lasts:
+                span_days = (current["Last Received"] - current["First Received"]).total_seconds() / 86400
+            current["Per Week"] = round((current["Emails"] - 1) / span_days * 7, 1) if span_days > 0 else None
+    
+    rows = []
+    for row in sorted(merged.values(), key=lambda r: (r["Last Received"] is not None, r["Last Received"] or 0),
+                      reverse=True):
+        # 分布列放在统计列之后、退订列之前, 按封数从多到少
+        breakdowns = {name: row.pop(name) for name in BREAKDOWN_COLUMNS if name in row}
+        unsubscribe = {name: row.pop(name) for name in UNSUBSCRIBE_COLUMNS if name in row}
+        for name, breakdown in breakdowns.items():
+            counts = sorted(breakdown.items(), key=lambda item: item[1], reverse=True)
+            row[name] = ", ".join(f"{part} ({count})" for part, count in counts)
+        row.update(unsubscribe)
+        rows.append(row)
+    return rows
+
+def combine_stats(parts, errors, key):
+    # 各文件夹 / 账户的扫描统计相加, 界面按单次扫描的格式显示; 每一部分的明细保留在 key 下
+    scanned = {label: stats for label, stats in parts.items() if label not in errors and stats}
+    server_filters = [stats.get("server_filter") for stats in scanned.values()]
+    vanished = [stats["vanished"] for stats in scanned.values() if stats.get("vanished") is not None]
+    providers = {stats.get("provider") for stats in scanned.values()}
+    return {
+        "server_filter": None if all(f is None for f in server_filters) else False not in server_filters,
+        "in_scope": sum(stats.get("in_scope", 0) for stats in scanned.values()),
+        "candidates": sum(stats.get("candidates", 0) for stats in scanned.values()),
+        "fetched": sum(stats.get("fetched", 0) for stats in scanned.values()),
+        "vanished": sum(vanished) if vanished else None,
+        "throttled": sum(stats.get("throttled") or 0 for stats in scanned.values()),
+        "mailbox": ", ".join(dict.fromkeys(stats["mailbox"] for stats in scanned.values() if stats.get("mailbox"))),
+        # 服务商不同时不显示某一家的说明
+        "provider": providers.pop() if len(providers) == 1 else None,
+        key: scanned,
+        "errors": errors,
+    }
+
+def merge_delete_progress(job, parts):
+    # 外层检查点的计数和进度 = 各文件夹 / 账户之和 (界面和 delete_remaining 只看外层)
+    counts = {}
+    for part in parts:
+        for sender_email, count in part["counts"].items():
+            counts[sender_email] = counts.get(sender_email, 0) + count
+    job.update(
+        searched=sum(part["searched"] for part in parts),
+        done=sum(part["done"] for part in parts),
+        uids=None if any(part["uids"] is None for part in parts) else [
+            uid for part in parts for uid in part["uids"]],
+        counts=counts,
+        method=next((part["method"] for part in parts if part["method"]), None),
+    )
+
+def delete_search_groups(job):
+    # 删除任务一共要做几组 SEARCH: 每个文件夹 / 账户都要搜索一遍
+    if job.get("accounts"):
+        return sum(delete_search_groups(part) for part in job["accounts"].values())
+    return max(1, -(-len(job["targets"]) // DELETE_SEARCH_GROUP)) * len(job.get("folders") or [None])
+
+def scan_folders(creds, state, on_progress=None, cancel=None, diagnostics=None):
+    # creds["folders"]: 要扫描的文件夹; 每个文件夹用自己的连接, 最多同时扫描 FOLDER_WORKERS 个
+    # (或者 pool_size 个, 取较大的); 扫描上限按文件夹计算
+    # on_progress(已处理, 总数, {文件夹: (已处理, 总数)}): 任何一个文件夹推进时调用
+    # 部分文件夹失败时照常返回其余文件夹的结果, 失败原因记在 state["stats"]["errors"]
+    folders = list(creds['folders'])
+    limit = creds.get('limit', 200)
+    current = state.get("folders") or {}
+    # 仍然选中的文件夹保留上次的状态, 只做增量扫描
+    state["folders"] = {name: current.get(name) or new_scan_state(aggregate=limit is None) for name in folders}
+    progress = {name: (0, 0) for name in folders}
+    lock = threading.Lock()
+    # 各文件夹属于同一个账户, 共用一个限流控制器; 每个文件夹只用一个连接
+    throttle = new_throttle(creds, connections=1)
+    
+    def reporter(name):
+        def report(done, total):
+            with lock:
+                progress[name] = (done, total)
+                snapshot = dict(progress)
+            if on_progress:
+                on_progress(sum(d for d, _ in snapshot.values()), sum(t for _, t in snapshot.values()), snapshot)
+        return report
+    
+    def scan_one(name):
+        args = (creds['u'], creds['p'], creds['s'])
+        folder_state = state["folders"][name]
+        filters = creds.get('filters')
+        if limit is None:
+            return scan_whole_inbox(*args, folder_state, filters, None, reporter(name), cancel, diagnostics, name,
+                                    throttle)
+        batch_size = creds.get('batch_size', FETCH_BATCH_SIZE)
+        if creds.get('engine') == "asyncio":
+            return scan_inbox_asyncio(*args, limit, batch_size, folder_state,
+                                      creds.get('max_in_flight', MAX_IN_FLIGHT), filters, reporter(name), cancel,
+                                      diagnostics, name, throttle)
+        return scan_inbox(*args, limit, batch_size, folder_state, 1, filters, None, reporter(name), cancel,
+                          diagnostics, name, throttle)
+    
+    workers = min(len(folders), max(FOLDER_WORKERS, creds.get('pool_size', SCAN_POOL_SIZE)))
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="scan-folder") as executor:
+        results = dict(zip(folders, executor.map(scan_one, folders)))
+    
+    errors = {name: res for name, res in results.items() if isinstance(res, str)}
+    if folders and len(errors) == len(folders):
+        return labelled_error(decode_folder_name(folders[0]), errors[folders[0]])
+    state["stats"] = combine_stats({name: part["stats"] for name, part in state["folders"].items()}, errors,
+                                   "folders")
+    if throttle is not None:
+        state["stats"].update(throttle.report())
+    return state_rows(state)
+
+def delete_folders(creds, job, on_progress=None, on_retry=None, cancel=None, diagnostics=None):
+    # 在扫描过的每个文件夹里删除同一批发件人的邮件, 各文件夹并发进行, 中断后按各自的检查点继续
+    folders = job["folders"]
+    use_trash = creds.get('use_trash', True)
+    lock = threading.Lock()
+    
+    def publish(_=None):
+        with lock:
+            merge_delete_progress(job, list(folders.values()))
+        if on_progress:
+            on_progress(job)
+    
+    def delete_one(name):
+        args = (creds['u'], creds['p'], creds['s'], job["targets"])
+        if creds.get('engine') == "asyncio":
+            res = delete_emails_asyncio(*args, use_trash=use_trash, cancel=cancel, diagnostics=diagnostics,
+                                        job=folders[name], mailbox=name)
+            publish()
+            return res
+        return delete_emails(*args, use_trash, folders[name], None, publish, on_retry, cancel, diagnostics, name)
+    
+    workers = min(len(folders), FOLDER_WORKERS)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="delete-folder") as executor:
+        results = dict(zip(folders, executor.map(delete_one, folders)))
+    publish()
+    
+    failed = {name: res[1] for name, res in results.items() if not res[0]}
+    in_folders = f"in {len(folders)} folders"
+    if not failed:
+        return True, f"{delete_summary(job['counts'], job['done'], job['method'])} {in_folders}", job["counts"]
+    if cancelled(cancel):
+        return False, f"Cancelled ({job['done']} emails deleted {in_folders}; progress saved)", job["counts"]
+    name = next(iter(failed))
+    return False, labelled_error(decode_folder_name(name), failed[name]), job["counts"]
+
+# ==========================================
+# 多账户 (同时管理几个邮箱: 并发扫描, 删除和退订分发到各自的账户)
+# ==========================================
+# 每个账户有自己完整的设置 (creds) 和扫描状态 (state["accounts"][邮箱]), 文件夹、引擎、本地索引照常按账户使用。
+# 同一服务器上同时运行的账户数有上限: 服务商按来源 IP 限制并发连接, 几个账户一起连上去容易被限流。
+
+ACCOUNT_WORKERS = 6
+ACCOUNTS_PER_HOST = 2
+
+class HostLimiter:
+    # 每个服务器地址一个信号量, 同一服务器上最多 per_host 个账户同时运行
+    def __init__(self, per_host=ACCOUNTS_PER_HOST):
+        self.per_host = per_host
+        self.lock = threading.Lock()
+        self.slots = {}
+    
+    def slot(self, server):
+        with self.lock:
+            key = server.lower()
+            if key not in self.slots:
+                # 服务商配置里的上限更低时 (例如 QQ 邮箱) 以它为准
+                per_host = min(self.per_host, throttle_profile(key)["accounts"])
+                self.slots[key] = threading.BoundedSemaphore(per_host)
+            return self.slots[key]
+
+def state_senders(state):
+    # 状态里出现过的全部发件人, 包括各文件夹 / 各账户的
+    senders = set(state["senders"])
+    for part in [*(state.get("folders") or {}).values(), *(state.get("accounts") or {}).values()]:
+        senders |= state_senders(part)
+    return senders
+
+def account_targets(state, emails):
+    # 选中的发件人在各账户里的结果行 (各自的退订链接), 带 Account 列, 退订时按账户分发
+    emails = set(emails)
+    return [dict(row, Account=user) for user, part in state["accounts"].items()
+            for row in state_rows(part) if row["Email"] in emails]
+
+def account_summary(state):
+    # 每个账户一行: 发件人数 / 邮件数 / 占用空间 / 扫描的文件夹 / 错误
+    errors = (state.get("stats") or {}).get("errors") or {}
+    summary = []
+    for user, part in state["accounts"].items():
+        rows = state_rows(part)
+        summary.append({
+            "Account": user,
+            "Senders": len(rows),
+            "Emails": sum(row["Emails"] or 0 for row in rows),
+            "Size (MB)": round(sum(row["Size (MB)"] or 0 for row in rows), 2),
+            "Mailbox": (part.get("stats") or {}).get("mailbox"),
+            "Error": errors.get(user),
+        })
+    return summary
+
+def delete_job_for(creds, state, targets):
+    # 多账户时只在出现过这些发件人的账户里删除, 每个账户按自己扫描过的文件夹建立检查点
+    if not creds.get('accounts'):
+        return new_delete_job(targets, creds.get('folders'))
+    job = new_delete_job(targets)
+    job["accounts"] = {}
+    scanned = (state or {}).get("accounts") or {}
+    for account in creds['accounts']:
+        known = state_senders(scanned[account['u']]) if account['u'] in scanned else set(targets)
+        found = [target for target in targets if target in known]
+        if found:
+            job["accounts"][account['u']] = new_delete_job(found, account.get('folders'))
+    return job
+
+def scan_accounts(creds, state, on_progress=None, cancel=None, diagnostics=None):
+    # creds["accounts"]: 每个账户的设置; 最多同时扫描 ACCOUNT_WORKERS 个账户, 同一服务器最多 ACCOUNTS_PER_HOST 个
+    # on_progress(已处理, 总数, {账户: (已处理, 总数)}); 部分账户失败时返回其余账户的结果, 错误记在 stats["errors"]
+    accounts = {account['u']: account for account in creds['accounts']}
+    current = state.get("accounts") or {}
+    if state.get("accounts") is None:
+        state.update(new_scan_state())
+    state["accounts"] = {user: current.get(user) or new_scan_state(aggregate=account.get('limit', 200) is None)
+                         for user, account in accounts.items()}
+    progress = {user: (0, 0) for user in accounts}
+    lock = threading.Lock()
+    limiter = HostLimiter(creds.get('per_host', ACCOUNTS_PER_HOST))
+    
+    def reporter(user):
+        def report(done, total, folders=None):
+            with lock:
+                progress[user] = (done, total)
+                snapshot = dict(progress)
+            if on_progress:
+                on_progress(sum(d for d, _ in snapshot.values()), sum(t for _, t in snapshot.values()), snapshot)
+        return report
+    
+    def scan_one(user):
+        with limiter.slot(accounts[user]['s']):
+            if cancelled(cancel):
+                # 还没开始的账户保留上次的结果
+                return state_rows(state["accounts"][user])
+            return scan_account(accounts[user], state["accounts"][user], None, reporter(user), cancel, diagnostics)
+    
+    users = list(accounts)
+    workers = min(len(users), creds.get('workers', ACCOUNT_WORKERS))
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="scan-account") as executor:
+        results = dict(zip(users, executor.map(scan_one, users)))
+    
+    errors = {user: res for user, res in results.items() if isinstance(res, str)}
+    if users and len(errors) == len(users):
+        return labelled_error(users[0], errors[users[0]])
+    state["stats"] = combine_stats({user: part["stats"] for user, part in state["accounts"].items()}, errors,
+                                   "accounts")
+    return state_rows(state)
+
+def delete_accounts(creds, job, on_progress=None, on_retry=None, cancel=None, diagnostics=None):
+    # 各账户并发删除 (同一服务器上的并发同样有上限), 中断后按各账户的检查点继续
+    accounts = {account['u']: account for account in creds['accounts']}
+    parts = job["accounts"]
+    lock = threading.Lock()
+    limiter = HostLimiter(creds.get('per_host', ACCOUNTS_PER_HOST))
+    
+    def publish(_=None):
+        with lock:
+            merge_delete_progress(job, list(parts.values()))
+        if on_progress:
+            on_progress(job)
+    
+    def delete_one(user):
+        with limiter.slot(accounts[user]['s']):
+            res = delete_account(accounts[user], parts[user], None, publish, on_retry, cancel, diagnostics)
+        publish()
+        return res
+    
+    users = list(parts)
+    workers = min(len(users), creds.get('workers', ACCOUNT_WORKERS))
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="delete-account") as executor:
+        results = dict(zip(users, executor.map(delete_one, users)))
+    publish()
+    
+    failed = {user: res[1] for user, res in results.items() if not res[0]}
+    in_accounts = f"in {len(users)} accounts"
+    if not failed:
+        return True, f"{delete_summary(job['counts'], job['done'], job['method'])} {in_accounts}", job["counts"]
+    if cancelled(cancel):
+        return False, f"Cancelled ({job['done']} emails deleted {in_accounts}; progress saved)", job["counts"]
+    user = next(iter(failed))
+    return False, labelled_error(user, failed[user]), job["counts"]
+
+# ==========================================
+# 可选的本地加密索引 (默认关闭, 不开启时仍然只在内存中运行)
+# ==========================================
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".email_manager", "index.db")
+INDEX_MAX_AGE_DAYS = 30
+INDEX_MAX_BYTES = 200 * 1024 * 1024
+SCRYPT_PARAMS = {"n": 2 ** 14, "r": 8, "p": 1}
+
+def index_available():
+    return Fernet is not None
+
+def account_key(user, server, passphrase, salt):
+    # 索引中不保存明文邮箱地址; 用口令派生的密钥做 HMAC, 拿到索引文件但没有口令时不能靠猜测地址反查记录属于谁
+    # 代价是口令不对时找不到记录, 与没有索引时一样从头扫描, 旧记录之后按时间和大小被清理
+    key = hashlib.scrypt(passphrase.encode(), salt=salt, dklen=32, **SCRYPT_PARAMS)
+    return hmac.new(key, f"{user.lower()}|{server.lower()}".encode(), hashlib.sha256).hexdigest()
+
+def index_salt(conn):
+    # 整个索引共用的随机 salt, 只用来派生 account_key; 每条记录加密用的 salt 单独保存
+    row = conn.execute("SELECT value FROM index_meta WHERE name = 'salt'").fetchone()
+    if row:
+        return row[0]
+    salt = os.urandom(16)
+    conn.execute("INSERT INTO index_meta VALUES ('salt', ?)", (salt,))
+    return salt
+
+def derive_key(passphrase, salt):
+    key = hashlib.scrypt(passphrase.encode(), salt=salt, dklen=32, **SCRYPT_PARAMS)
+    return base64.urlsafe_b64encode(key)
+
+def open_index(path=INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS scan_index ("
+        "account TEXT PRIMARY KEY, uidvalidity INTEGER NOT NULL, updated REAL NOT NULL, "
+        "salt BLOB NOT NULL, payload BLOB NOT NULL)"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS index_meta (name TEXT PRIMARY KEY, value BLOB NOT NULL)")
+    return conn
+
+def evict_index(conn, max_age_days=INDEX_MAX_AGE_DAYS, max_bytes=INDEX_MAX_BYTES):
+    # 先删过期的, 再从最久未更新的开始删, 直到总大小不超过上限
+    conn.execute("DELETE FROM scan_index WHERE updated < ?", (time.time() - max_age_days * 86400,))
+    total = 0
+    for account, size in conn.execute(
+            "SELECT account, length(payload) FROM scan_index ORDER BY updated DESC").fetchall():
+        total += size
+        if total > max_bytes:
+            conn.execute("DELETE FROM scan_index WHERE account = ?", (account,))
+
+def save_index(user, server, passphrase, state, path=INDEX_PATH):
+    # 每个账户只保留一条记录; UIDVALIDITY 变化后旧记录直接被覆盖
+    # 多文件夹扫描的 UIDVALIDITY 在各文件夹的状态里, 外层记为 0
+    if state.get("uidvalidity") is None and not state.get("folders"):
+        return
+    salt = os.urandom(16)
+    data = zlib.compress(json.dumps(state).encode())
+    payload = Fernet(derive_key(passphrase, salt)).encrypt(data)
+    with closing(open_index(path)) as conn:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_index VALUES (?, ?, ?, ?, ?)",
+                (account_key(user, server, passphrase, index_salt(conn)), state["uidvalidity"] or 0, time.time(),
+                 salt, payload)
+            )
+            evict_index(conn)
+
+def load_index(user, server, passphrase, path=INDEX_PATH):
+    # 返回 (state, error); 没有索引记录时 state 为 None
+    if not os.path.exists(path):
+        return None, None
+    with closing(open_index(path)) as conn:
+        with conn:
+            evict_index(conn)
+            key = account_key(user, server, passphrase, index_salt(conn))
+        row = conn.execute("SELECT salt, payload FROM scan_index WHERE account = ?", (key,)).fetchone()
+    if row is None:
+        return None, None
+    try:
+        data = Fernet(derive_key(passphrase, row[0])).decrypt(row[1])
+    except InvalidToken:
+        # 记录是用同一个口令找到的, 解不开说明记录被改动或损坏
+        return None, "Error: The local index is damaged, delete it and scan again"
+    state = new_scan_state()
+    state.update(json.loads(zlib.decompress(data)))
+    return state, None
+
+def clear_index(path=INDEX_PATH):
+    if os.path.exists(path):
+        os.remove(path)
+
+# ==========================================
+# 按配置选择引擎 (界面和命令行共用)
+# ==========================================
+
+def scan_engine(creds):
+    # 诊断报告里显示的引擎; 多账户时各账户的设置相同, 取第一个
+    if creds.get('accounts'):
+        creds = creds['accounts'][0]
+    return "whole" if creds.get('limit', 200) is None else creds.get('engine', "threaded")
+
+def scan_account(creds, state, session=None, on_progress=None, cancel=None, diagnostics=None):
+    # 单个账户: 按设置选择引擎, 扫描后写入本地索引
+    limit = creds.get('limit', 200)
+    folders = creds.get('folders')
+    if state is not None and ((limit is None) != (state.get("aggregates") is not None)
+                              or bool(folders) != (state.get("folders") is not None)
+                              or state.get("accounts") is not None):
+        # 几种模式的状态不通用, 切换模式时从头扫描
+        state.update(new_scan_state(aggregate=limit is None))
+    args = (creds['u'], creds['p'], creds['s'], limit, creds.get('batch_size', FETCH_BATCH_SIZE), state)
+    filters = creds.get('filters')
+    if folders:
+        res = scan_folders(creds, state if state is not None else new_scan_state(aggregate=limit is None),
+                           on_progress, cancel, diagnostics)
+    elif limit is None:
+        res = scan_whole_inbox(creds['u'], creds['p'], creds['s'], state, filters, session, on_progress, cancel,
+                               diagnostics, throttle=new_throttle(creds, connections=1))
+    elif creds.get('engine') == "asyncio":
+        res = scan_inbox_asyncio(*args, creds.get('max_in_flight', MAX_IN_FLIGHT), filters, on_progress, cancel,
+                                 diagnostics, throttle=new_throttle(creds))
+    else:
+        res = scan_inbox(*args, creds.get('pool_size', SCAN_POOL_SIZE), filters, session, on_progress, cancel,
+                         diagnostics, throttle=new_throttle(creds))
+    
+    index = creds.get('index')
+    if index and state is not None and not isinstance(res, str):
+        try:
+            save_index(creds['u'], creds['s'], index["passphrase"], state)
+        except (OSError, sqlite3.Error):
+            # 索引只是缓存, 写入失败不影响本次结果
+            pass
+    return res
+
+def delete_account(creds, job, session=None, on_progress=None, on_retry=None, cancel=None, diagnostics=None):
+    use_trash = creds.get('use_trash', True)
+    if job.get("folders"):
+        return delete_folders(creds, job, on_progress, on_retry, cancel, diagnostics)
+    if creds.get('engine') == "asyncio":
+        # asyncio 引擎每次都重新搜索, 已删除的邮件不会被再次处理
+        return delete_emails_asyncio(creds['u'], creds['p'], creds['s'], job["targets"], use_trash=use_trash,
+                                     cancel=cancel, diagnostics=diagnostics, job=job)
+    return delete_emails(creds['u'], creds['p'], creds['s'], job["targets"], use_trash, job, session,
+                         on_progress, on_retry, cancel, diagnostics)
+
+def run_scan(creds, state, session=None, on_progress=None, cancel=None, diagnostics=None):
+    # creds: {"u", "p", "s", "limit", "batch_size", "pool_size", "max_in_flight", "engine", "filters", "index",
+    #         "folders", "adaptive"}, 多账户时为 {"accounts": [每个账户的 creds]}
+    # adaptive 为 True 时批次大小和并发按服务商配置起步, 由限流控制器调整
+    # limit 为 None 时扫描整个邮箱 (单连接, 批次自适应), 与所选引擎无关
+    # folders 不为空时扫描这些文件夹 (各用一个连接并发), 不指定时只扫描收件箱 (Gmail 为所有邮件)
+    if diagnostics is not None:
+        diagnostics.engine = scan_engine(creds)
+    if creds.get('accounts'):
+        res = scan_accounts(creds, state if state is not None else new_scan_state(), on_progress, cancel,
+                            diagnostics)
+    else:
+        res = scan_account(creds, state, session, on_progress, cancel, diagnostics)
+    if diagnostics is not None:
+        diagnostics.finish()
+    return res
+
+def run_delete(creds, job, session=None, on_progress=None, on_retry=None, cancel=None, diagnostics=None):
+    if diagnostics is not None:
+        diagnostics.engine = (creds['accounts'][0] if creds.get('accounts') else creds).get('engine', "threaded")
+    if job.get("accounts"):
+        res = delete_accounts(creds, job, on_progress, on_retry, cancel, diagnostics)
+    else:
+        res = delete_account(creds, job, session, on_progress, on_retry, cancel, diagnostics)
+    if diagnostics is not None:
+        diagnostics.finish()
+    return res
@@ -0,0 +1,142 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import pandas as pd
+
+from mail_core import (
+    FETCH_BATCH_SIZE, MAX_IN_FLIGHT, SCAN_ENGINES, SCAN_POOL_SIZE, Diagnostics, get_imap_server, new_scan_state,
+    run_scan
+)
+
+# ==========================================
+# 命令行批量扫描: 多个账户, 多进程并行, 输出 JSON / CSV / Parquet
+# ==========================================
+# 账户文件: CSV (表头 user,password,server) 或 JSON 对象列表。
+# 不想把密码写进文件时, 用 password_env 指定保存密码的环境变量名; server 为空时按邮箱域名推断。
+
+OUTPUT_FORMATS = ("json", "csv", "parquet")
+
+def load_accounts(path):
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            records = json.load(f)
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            records = list(csv.DictReader(f))
+
+    accounts = []
+    for record in records:
+        user = (record.get("user") or "").strip()
+        if not user:
+            continue
+        password = record.get("password") or ""
+        if record.get("password_env"):
+            password = os.environ.get(record["password_env"], "")
+        server = (record.get("server") or "").strip() or get_imap_server(user)
+        accounts.append({"user": user, "password": password, "server": server})
+    return accounts
+
+def scan_one_account(account, options):
+    # 在工作进程中运行; 返回 (账户, 结果行或错误信息, 耗时, 诊断报告)
+    creds = dict(options, u=account["user"], p=account["password"], s=account["server"])
+    started = time.perf_counter()
+    if not creds["p"]:
+        return account["user"], "Error: no password", 0.0, None
+    diagnostics = Diagnostics("scan")
+    res = run_scan(creds, new_scan_state(), diagnostics=diagnostics)
+    return account["user"], res, time.perf_counter() - started, diagnostics.report()
+
+def write_results(rows, path, fmt):
+    df = pd.DataFrame(rows)
+    if fmt == "json":
+        df.to_json(path, orient="records", date_format="iso", force_ascii=False, indent=2)
+    elif fmt == "csv":
+        df.to_csv(path, index=False)
+    else:
+        try:
+            df.to_parquet(path, index=False)
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow or fastparquet: pip install pyarrow")
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan many mailboxes for subscriptions without the web UI")
+    parser.add_argument("accounts", help="CSV or JSON file with user, password / password_env, server")
+    parser.add_argument("-o", "--output", required=True, help="Result file (.json, .csv or .parquet)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="Defaults to the output file extension")
+    parser.add_argument("--workers", type=int, default=4, help="Accounts scanned in parallel (one process each)")
+    parser.add_argument("--limit", type=int, default=1000, help="Newest messages to scan per account")
+    parser.add_argument("--all", action="store_true",
+                        help="Scan every message with bounded memory (ignores --limit and --engine)")
+    parser.add_argument("--batch-size", type=int, default=FETCH_BATCH_SIZE)
+    parser.add_argument("--engine", choices=list(SCAN_ENGINES), default="threaded")
+    parser.add_argument("--pool-size", type=int, default=SCAN_POOL_SIZE, help="Connections per account (threaded)")
+    parser.add_argument("--in-flight", type=int, default=MAX_IN_FLIGHT, help="Pipelined FETCHes per account (asyncio)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Use the provider's throttle profile and adapt batch size and connections while scanning")
+    parser.add_argument("--server-side", action="store_true", help="Let the server filter for List-Unsubscribe")
+    parser.add_argument("--since", type=date.fromisoformat, help="Only messages since YYYY-MM-DD")
+    parser.add_argument("--folder", action="append", dest="folders",
+                        help="Scan this folder instead of the inbox; repeat to scan several folders concurrently")
+    parser.add_argument("--diagnostics", help="Write per-account timings and IMAP counters to this JSON file")
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in OUTPUT_FORMATS:
+        parser.error(f"cannot infer the output format from {args.output!r}, use --format")
+
+    accounts = load_accounts(args.accounts)
+    if not accounts:
+        raise SystemExit("No accounts found")
+
+    options = {
+        "limit": None if args.all else args.limit,
+        "batch_size": args.batch_size,
+        "pool_size": args.pool_size,
+        "max_in_flight": args.in_flight,
+        "engine": args.engine,
+        "adaptive": args.adaptive,
+        "filters": {"server_side": args.server_side, "since": args.since, "exclude_known": False},
+        "folders": args.folders,
+    }
+
+    rows = []
+    reports = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(scan_one_account, account, options): account["user"] for account in accounts}
+        for future in as_completed(futures):
+            try:
+                user, res, seconds, report = future.result()
+            except Exception as e:
+                # 工作进程崩溃 (BrokenProcessPool)、异常不能 pickle 等: 只算这个账户失败, 已完成的结果照常写出
+                failed += 1
+                print(f"FAILED {futures[future]}: {str(e) or type(e).__name__}", file=sys.stderr)
+                continue
+            if report is not None:
+                reports.append({"account": user, "error": res if isinstance(res, str) else None, **report})
+            if isinstance(res, str):
+                failed += 1
+                print(f"FAILED {user}: {res}", file=sys.stderr)
+                continue
+            print(f"ok     {user}: {len(res)} senders in {seconds:.1f}s", file=sys.stderr)
+            for row in res:
+                row.pop("Select", None)
+                rows.append({"Account": user, **row})
+
+    write_results(rows, args.output, fmt)
+    if args.diagnostics:
+        with open(args.diagnostics, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+    print(f"{len(rows)} rows from {len(accounts) - failed} / {len(accounts)} accounts written to {args.output}",
+          file=sys.stderr)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import imaplib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from async_imap import AsyncIMAP
+from fake_imap import FakeIMAPServer
+
+OPEN_ASYNC = AsyncIMAP.open.__func__
+
+@pytest.fixture
+def serve(monkeypatch):
+    # serve(邮箱, **FakeIMAPServer 参数) -> 已启动的假服务器; 之后 imaplib 和 AsyncIMAP 的连接都转到它
+    servers = []
+    
+    def start(mailboxes, **options):
+        server = FakeIMAPServer(mailboxes, **options).start()
+        servers.append(server)
+        host, port = server.address
+        monkeypatch.setattr(imaplib, "IMAP4_SSL", lambda *args, **kwargs: imaplib.IMAP4(host, port))
+        monkeypatch.setattr(AsyncIMAP, "open",
+                            classmethod(lambda cls, *args, **kwargs: OPEN_ASYNC(cls, host, port, ssl=False)))
+        return server
+    
+    yield start
+    for server in servers:
+        server.stop()
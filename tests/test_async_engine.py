@@ -0,0 +1,119 @@
+import asyncio
+
+import mail_core as core
+from async_imap import AsyncIMAP, uid_ranges
+from fake_imap import generate_mailbox
+
+# ==========================================
+# asyncio 引擎: 与 imaplib 引擎结果一致, FETCH 流水线, 交错响应的归属
+# ==========================================
+
+USER = "test@example.com"
+
+def subscribed(box):
+    return {core.parse_sender(m.header)["Email"] for m in box.messages if core.parse_sender(m.header)}
+
+def test_asyncio_scan_matches_threaded(serve):
+    box = generate_mailbox(1500, senders=40)
+    serve(box)
+    threaded = core.scan_inbox(USER, "x", "localhost", 1500, 100)
+    pipelined = core.scan_inbox_asyncio(USER, "x", "localhost", 1500, 100, max_in_flight=8)
+    assert not isinstance(pipelined, str), pipelined
+    assert pipelined == threaded
+    assert {row["Email"] for row in pipelined} == subscribed(box)
+    assert {"Select", "Sender", "Email", "Last Received", "Unsubscribe"} <= set(pipelined[0])
+
+def test_fetches_are_pipelined(serve):
+    serve(generate_mailbox(2000, senders=40), latency=0.005)
+    diagnostics = core.Diagnostics("scan", "asyncio")
+    rows = core.scan_inbox_asyncio(USER, "x", "localhost", 2000, 100, max_in_flight=8, diagnostics=diagnostics)
+    assert not isinstance(rows, str), rows
+    report = diagnostics.report()
+    fetches = report["commands"]["UID FETCH"]["count"]
+    # 每个 FETCH 单独等一次往返时两者相等
+    assert fetches >= 20
+    assert report["round_trips"] < report["imap_commands"] - fetches // 2
+
+def test_asyncio_delete_removes_every_message(serve):
+    box = generate_mailbox(1000, senders=20)
+    serve(box)
+    targets = sorted(subscribed(box))[:3]
+    success, message, counts = core.delete_emails_asyncio(USER, "x", "localhost", targets, use_trash=False)
+    assert success, message
+    left = [m for m in box.messages if (core.parse_sender(m.header) or {}).get("Email") in targets]
+    assert not left
+    assert sum(counts.values()) > 0
+
+def test_uid_ranges():
+    assert uid_ranges("1:5,9,12:*") == [(1, 5), (9, 9), (12, None)]
+    assert uid_ranges(b"10:3") == [(3, 10)]
+
+def fetch_line(seq, uid, header):
+    return f"* {seq} FETCH (UID {uid} BODY[HEADER.FIELDS (FROM)] {{{len(header)}}}\r\n".encode() + header + b")\r\n"
+
+def run_scripted(script, client_work):
+    # script(请求的标签列表, writer): 收到每个 UID 命令后调用, 按需要写出响应
+    async def handle(reader, writer):
+        writer.write(b"* OK ready\r\n")
+        tags = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            tag, name = line.strip().split(b" ", 2)[:2]
+            if name == b"CAPABILITY":
+                writer.write(b"* CAPABILITY IMAP4rev1\r\n" + tag + b" OK done\r\n")
+            elif name == b"UID":
+                tags.append(tag)
+                script(tags, writer)
+            await writer.drain()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = await AsyncIMAP.open("127.0.0.1", port, ssl=False, timeout=0.5)
+        try:
+            return await client_work(client)
+        finally:
+            client.writer.close()
+            server.close()
+
+    return asyncio.run(main())
+
+def literal_uids(data):
+    return [int(item[0].split(b"UID ")[1].split()[0]) for item in data if isinstance(item, tuple)]
+
+def test_interleaved_fetch_responses_go_to_their_own_command():
+    def script(tags, writer):
+        if len(tags) == 2:
+            # 两个批次的响应交错, 后发的命令先完成
+            writer.write(fetch_line(1, 1, b"From: a\r\n\r\n") + fetch_line(3, 11, b"From: c\r\n\r\n") +
+                         fetch_line(2, 2, b"From: b\r\n\r\n") + fetch_line(4, 12, b"From: d\r\n\r\n") +
+                         tags[1] + b" OK done\r\n" + tags[0] + b" OK done\r\n")
+
+    async def work(client):
+        return await asyncio.gather(client.uid("FETCH", "1:2", "(UID)"), client.uid("FETCH", "11:12", "(UID)"))
+
+    first, second = run_scripted(script, work)
+    assert literal_uids(first[1]) == [1, 2]
+    assert literal_uids(second[1]) == [11, 12]
+
+def test_timed_out_command_is_dropped():
+    def script(tags, writer):
+        # 第一条命令不回答; 第二条正常返回
+        if len(tags) == 2:
+            writer.write(fetch_line(1, 21, b"From: e\r\n\r\n") + tags[1] + b" OK done\r\n")
+
+    async def work(client):
+        try:
+            await client.uid("FETCH", "5", "(UID)")
+        except asyncio.TimeoutError:
+            pass
+        else:
+            raise AssertionError("expected a timeout")
+        assert not client.pending
+        return await client.uid("FETCH", "21", "(UID)")
+
+    status, data = run_scripted(script, work)
+    assert status == "OK"
+    assert literal_uids(data) == [21]
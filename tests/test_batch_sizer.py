@@ -0,0 +1,64 @@
+import mail_core as core
+from fake_imap import generate_mailbox
+
+# ==========================================
+# 整个邮箱模式: BatchSizer 按耗时调整批次, 扫描结果与逐封模式一致且不逐封保存
+# ==========================================
+
+USER = "test@example.com"
+
+def test_grows_at_most_double_when_fast():
+    sizer = core.BatchSizer(size=200)
+    sizer.observe(200, 200, 0.01)
+    assert sizer.size == 400
+
+def test_shrinks_at_most_half_when_slow():
+    sizer = core.BatchSizer(size=800)
+    sizer.observe(800, 800, 10.0)
+    assert sizer.size == 400
+
+def test_settles_near_the_target_time():
+    sizer = core.BatchSizer(size=400)
+    # 每封 1 ms: 目标耗时内能处理 target / 0.001 封
+    for _ in range(10):
+        sizer.observe(sizer.size, sizer.size, sizer.size * 0.001)
+    assert sizer.size == int(core.TARGET_BATCH_SECONDS / 0.001)
+
+def test_size_stays_within_bounds():
+    sizer = core.BatchSizer(size=core.MIN_WHOLE_BATCH)
+    for _ in range(20):
+        sizer.observe(sizer.size, sizer.size, 100.0)
+    assert sizer.size == core.MIN_WHOLE_BATCH
+    for _ in range(20):
+        sizer.observe(sizer.size, sizer.size, 0.0001)
+    assert sizer.size == core.MAX_WHOLE_BATCH
+
+def test_sparse_uids_widen_the_window_up_to_the_cap():
+    sizer = core.BatchSizer(size=500)
+    assert sizer.span() == 500
+    # 区间里只有十分之一的 UID 还存在
+    for _ in range(10):
+        sizer.observe(1000, 100, 0.01)
+    assert sizer.span() > sizer.size
+    assert sizer.span() <= core.MAX_WINDOW_SPAN
+
+def test_throttled_halves_the_batch():
+    sizer = core.BatchSizer(size=1000)
+    sizer.throttled()
+    assert sizer.size == 500
+    sizer.size = core.MIN_WHOLE_BATCH
+    sizer.throttled()
+    assert sizer.size == core.MIN_WHOLE_BATCH
+
+def test_whole_mailbox_scan_matches_full_scan(serve):
+    box = generate_mailbox(5000, senders=80)
+    serve(box)
+    full = core.scan_inbox(USER, "x", "localhost", 5000, 200)
+    state = core.new_scan_state(aggregate=True)
+    whole = core.scan_whole_inbox(USER, "x", "localhost", state)
+    assert not isinstance(whole, str), whole
+    key = lambda rows: sorted((row["Email"], row["Emails"], row["Size (MB)"], row["Last Received"]) for row in rows)
+    assert key(whole) == key(full)
+    # 只保存每个发件人的汇总, 不逐封保存
+    assert not state["messages"]["uid"]
+    assert len(state["aggregates"]) == len(whole)
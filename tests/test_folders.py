@@ -0,0 +1,18 @@
+import mail_core as core
+
+# ==========================================
+# 多文件夹扫描: 可选的文件夹和默认选中的文件夹
+# ==========================================
+
+def test_defaults_skip_sent_and_trash():
+    folders = [(set(), "INBOX"), ({"\\JUNK"}, "Spam"), (set(), "Newsletters"), ({"\\SENT"}, "Sent"),
+               ({"\\TRASH"}, "Trash"), (set(), "Archive")]
+    choices, defaults = core.scan_folder_choices(folders)
+    assert choices == ["INBOX", "Spam", "Newsletters", "Archive"]
+    assert defaults == ["INBOX", "Spam", "Newsletters"]
+
+def test_inbox_is_matched_case_insensitively():
+    # 服务器把收件箱列为 "Inbox" 时仍然默认选中, 并使用服务器的写法
+    folders = [(set(), "Inbox"), ({"\\JUNK"}, "Junk")]
+    choices, defaults = core.scan_folder_choices(folders)
+    assert defaults == ["Inbox", "Junk"]
@@ -0,0 +1,42 @@
+import pytest
+
+import mail_core as core
+from reference_headers import EDGE_CASES, stdlib_field, stdlib_parse_sender
+from fake_imap import generate_mailbox
+
+# ==========================================
+# 头部解析器: 逐字段、逐封与标准库 (email.message_from_bytes + decode_header) 的结果一致
+# ==========================================
+
+FIELDS = ["FROM", "LIST-UNSUBSCRIBE", "LIST-UNSUBSCRIBE-POST"]
+
+@pytest.mark.parametrize("block", EDGE_CASES)
+def test_edge_cases_match_stdlib(block):
+    assert core.parse_sender(block) == stdlib_parse_sender(core, block)
+
+def test_generated_mailbox_matches_stdlib():
+    box = generate_mailbox(3000, senders=100, encoded_ratio=0.5)
+    mismatches = [m.uid for m in box.messages
+                  if core.parse_sender(m.header_fields(FIELDS)) != stdlib_parse_sender(core, m.header_fields(FIELDS))]
+    assert not mismatches
+
+@pytest.mark.parametrize("raw", [
+    "=?utf-8?b?5Y+R5Lu25Lq6?= =?utf-8?b?IDE=?=",
+    "=?utf-8?q?=E5=8F=91?= =?utf-8?q?=E4=BB=B6?=",
+    "Prefix =?utf-8?b?5ZCN?= Suffix",
+    "=?ISO-8859-1?Q?Andr=E9_Pirard?=",
+    "=?gb2312?b?0MLOxQ==?=",
+    "plain text",
+])
+def test_decode_words_matches_stdlib(raw):
+    assert core.decode_words(raw) == stdlib_field(raw)
+
+def test_folded_fields_are_unfolded():
+    fields = core.parse_header_block(b"From: Folded\r\n Name <f@example.com>\r\n"
+                                     b"List-Unsubscribe:\r\n\t<https://example.com/u>\r\n\r\n")
+    assert core.decode_words(fields["from"]) == "Folded Name <f@example.com>"
+    assert core.parse_unsubscribe(fields["list-unsubscribe"])[0] == "https://example.com/u"
+
+def test_first_field_wins_like_message_get():
+    fields = core.parse_header_block(b"From: First <first@example.com>\r\nFrom: Second <second@example.com>\r\n\r\n")
+    assert core.extract_email_address(fields["from"]) == "first@example.com"
@@ -0,0 +1,59 @@
+import pytest
+
+import mail_core as core
+from fake_imap import PROVIDER_PROFILES, generate_mailbox, provider_mailboxes
+
+# ==========================================
+# 服务商快速路径: 识别 Gmail / Outlook, 扫描的文件夹, 服务器端过滤, 删除后邮件的去向
+# ==========================================
+
+USER = "test@example.com"
+FILTERS = {"server_side": True}
+
+def start(serve, profile, box):
+    mailboxes, options = provider_mailboxes(profile, box)
+    return serve(mailboxes, **options)
+
+def subscribed(box):
+    return {core.parse_sender(m.header)["Email"] for m in box.messages if core.parse_sender(m.header)}
+
+@pytest.mark.parametrize("profile", PROVIDER_PROFILES)
+def test_scan_uses_the_provider_fast_path(serve, profile):
+    box = generate_mailbox(1500, senders=50)
+    server = start(serve, profile, box)
+    provider, mailbox, _, _ = PROVIDER_PROFILES[profile]
+    results = {}
+    for engine, scan in (("threaded", core.scan_inbox), ("asyncio", core.scan_inbox_asyncio)):
+        state = core.new_scan_state()
+        server.reset_stats()
+        rows = scan(USER, "x", "localhost", 1500, 200, state, filters=FILTERS)
+        assert not isinstance(rows, str), rows
+        assert state["stats"]["provider"] == provider
+        assert state["stats"]["mailbox"] == mailbox
+        assert state["stats"]["server_filter"]
+        assert server.stats["by_command"].get("UID SEARCH", 0)
+        # Gmail 扫描 All Mail, 已归档的邮件也要算进去
+        assert {row["Email"] for row in rows} == subscribed(box)
+        results[engine] = rows
+    assert results["threaded"] == results["asyncio"]
+
+@pytest.mark.parametrize("profile", PROVIDER_PROFILES)
+def test_filter_uses_the_provider_search_key(profile):
+    provider, _, search_key, _ = PROVIDER_PROFILES[profile]
+    assert search_key in core.filter_criteria("ALL", core.new_scan_state(), FILTERS, provider)
+
+@pytest.mark.parametrize("profile", PROVIDER_PROFILES)
+def test_delete_ends_up_in_the_provider_trash(serve, profile):
+    box = generate_mailbox(1000, senders=30)
+    server = start(serve, profile, box)
+    _, mailbox, _, trash = PROVIDER_PROFILES[profile]
+    targets = sorted(subscribed(box))[:4]
+    scanned = server.find_mailbox(mailbox)
+    before = len(scanned.messages)
+    # 不要求移到废纸篓: Gmail 仍然必须移到 Trash, 否则只是归档
+    success, message, counts = core.delete_emails(USER, "x", "localhost", targets, profile == "outlook")
+    assert success, message
+    removed = before - len(scanned.messages)
+    assert removed and removed == sum(counts.values())
+    if trash:
+        assert len(server.find_mailbox(trash).messages) == removed
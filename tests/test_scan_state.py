@@ -0,0 +1,65 @@
+import pytest
+
+import mail_core as core
+from async_imap import uid_ranges
+
+# ==========================================
+# 增量扫描状态: 被拒绝的 FETCH 批次报错而不是跳过, 中断后重扫不再获取已经取过的邮件
+# ==========================================
+
+class RefusingMail:
+    # 第 fail_on 次 UID FETCH 回复 NO, 其余的每个 UID 返回一个空头部
+    def __init__(self, fail_on):
+        self.fail_on = fail_on
+        self.fetches = 0
+    
+    def uid(self, command, uid_set, items):
+        self.fetches += 1
+        if self.fetches == self.fail_on:
+            return 'NO', [b'Internal server error']
+        uids = [uid for low, high in uid_ranges(uid_set) for uid in range(low, high + 1)]
+        return 'OK', [(f"{n} (UID {uid} RFC822.SIZE 10 BODY[HEADER] {{2}}".encode(), b"\r\n") for n, uid in
+                      enumerate(uids, 1)] + [b')']
+
+def test_refused_batch_is_an_error():
+    mail = RefusingMail(fail_on=2)
+    batches = core.fetch_headers(mail, list(range(1, 11)), batch_size=4)
+    chunk, headers, _ = next(batches)
+    assert chunk == [1, 2, 3, 4] and sorted(headers) == chunk
+    with pytest.raises(core.IMAPError, match="Internal server error"):
+        next(batches)
+
+class RefusingPool:
+    size = 2
+    diagnostics = None
+    
+    def __init__(self, mail):
+        self.mail = mail
+    
+    def acquire(self):
+        return self.mail
+    
+    def release(self, mail):
+        pass
+
+def test_parallel_refused_batch_is_an_error():
+    batches = core.fetch_headers_parallel(RefusingPool(RefusingMail(fail_on=1)), list(range(1, 11)), batch_size=4)
+    with pytest.raises(core.IMAPError):
+        list(batches)
+
+def test_partial_rescan_skips_every_fetched_message():
+    state = core.new_scan_state()
+    state.update(uidvalidity=7, last_uid=10)
+    scope = [str(uid).encode() for uid in range(11, 21)]
+    uids, _ = core.plan_scan(state, 7, core.scan_criteria(state, 7), scope, 100)
+    assert uids == list(range(20, 10, -1))
+    state["partial"] = True
+    # 取过 20..17, 只有 19 是订阅邮件; 扫描在这里被取消
+    newsletter = b"From: a@example.com\r\nList-Unsubscribe: <https://example.com/u>\r\n\r\n"
+    core.merge_headers(state, uids[:4], {20: b"\r\n", 19: newsletter, 18: b"\r\n", 17: b"\r\n"})
+    core.finish_scan(state, 20, stopped=True)
+    assert state["messages"]["uid"] == [19]
+    uids, last_uid = core.plan_scan(state, 7, core.scan_criteria(state, 7), scope, 100)
+    assert (uids, last_uid) == (list(range(16, 10, -1)), 20)
+    core.finish_scan(state, last_uid, stopped=False)
+    assert state["processed"] == [] and not state["partial"]
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+import unsubscribe
+from fake_unsubscribe import (FakeSMTPServer, FakeUnsubscribeServer, account_rows, client_context, expected_status,
+                              make_certificate, make_rows, reset_stand_ins)
+
+# ==========================================
+# 批量退订: 本地 HTTPS / SMTP 替身上的 RFC 8058 一键退订和 mailto 退订
+# ==========================================
+
+FAILING = 2
+USER = "me@example.com"
+
+@pytest.fixture(scope="module")
+def stand_ins():
+    certfile, keyfile = make_certificate()
+    servers = [FakeUnsubscribeServer(certfile, keyfile, 0.01).start() for _ in range(3)]
+    smtp = FakeSMTPServer(0.01).start()
+    yield servers, smtp, client_context(certfile)
+    for server in servers:
+        server.stop()
+    smtp.stop()
+
+def statuses(results):
+    return {(result.get("Account"), result["Email"]): result["Status"] for result in results}
+
+def expected(rows):
+    return {(row.get("Account"), row["Email"]): expected_status(row) for row in rows}
+
+@pytest.mark.parametrize("workers, per_host", [(1, 1), (12, 2)])
+def test_statuses_limits_and_reuse(stand_ins, workers, per_host):
+    servers, smtp, context = stand_ins
+    reset_stand_ins(servers, smtp)
+    rows = make_rows(servers, one_click=30, mailto=8, manual=3, failing=FAILING)
+    results = unsubscribe.unsubscribe_senders(rows, USER, "x", smtp.address, workers=workers, per_host=per_host,
+                                              context=context)
+    assert len(results) == len(rows)
+    assert statuses(results) == expected(rows)
+    for server in servers:
+        # 每个主机的并发不超过上限, keep-alive 连接被复用
+        assert server.stats["max_active"] <= per_host
+        assert server.stats["connections"] <= per_host
+        assert {(body, content_type) for _, body, content_type in server.requests} == {
+            (b"List-Unsubscribe=One-Click", "application/x-www-form-urlencoded")}
+    # 所有 mailto 退订走同一个 SMTP 会话
+    assert smtp.stats["sessions"] == 1
+    assert len(smtp.messages) == 8 - FAILING
+
+def test_accounts_share_the_per_host_limit(stand_ins):
+    # 三个账户收到同一批发件人, 同一个主机同时仍然最多 2 个请求; 每个账户一个 SMTP 会话
+    servers, smtp, context = stand_ins
+    reset_stand_ins(servers, smtp)
+    rows = account_rows(make_rows(servers, one_click=30, mailto=4, manual=1, failing=FAILING), 3)
+    accounts = [{"u": f"user{i}@example.com", "p": "x", "smtp": smtp.address} for i in range(3)]
+    results = unsubscribe.unsubscribe_accounts(rows, accounts, workers=12, per_host=2, context=context)
+    assert len(results) == len(rows)
+    assert statuses(results) == expected(rows)
+    assert max(server.stats["max_active"] for server in servers) == 2
+    assert all(server.stats["connections"] <= 2 for server in servers)
+    assert smtp.stats["sessions"] == 3
+    assert len(smtp.messages) == 3 * (4 - FAILING)
+
+def test_concurrent_is_faster_than_serial(stand_ins):
+    servers, smtp, context = stand_ins
+    rows = make_rows(servers, one_click=30, mailto=0, manual=0, failing=0)
+    elapsed = {}
+    for workers, per_host in ((1, 1), (12, 2)):
+        started = time.perf_counter()
+        unsubscribe.unsubscribe_senders(rows, USER, "x", smtp.address, workers=workers, per_host=per_host,
+                                        context=context)
+        elapsed[workers] = time.perf_counter() - started
+    assert elapsed[12] < elapsed[1]
+
+def test_plan_picks_one_method_per_sender():
+    rows = [
+        {"Email": "a@example.com", "Unsubscribe": "https://example.com/u", "One-Click": True, "Mailto": None},
+        {"Email": "b@example.com", "Unsubscribe": "https://example.com/manual", "One-Click": False, "Mailto": None},
+        # 旧索引没有 Mailto 列时从 Unsubscribe 列还原
+        {"Email": "c@example.com", "Unsubscribe": "mailto:leave@example.com", "One-Click": False, "Mailto": None},
+    ]
+    one_click, mailto, manual = unsubscribe.unsubscribe_plan(rows)
+    assert [row["Email"] for row in one_click] == ["a@example.com"]
+    assert [row["Email"] for row in mailto] == ["c@example.com"]
+    assert [row["Email"] for row in manual] == ["b@example.com"]
+
+def test_manual_rows_need_no_network():
+    rows = [{"Email": "b@example.com", "Unsubscribe": "https://example.com/manual", "One-Click": False, "Mailto": None}]
+    results = unsubscribe.unsubscribe_senders(rows, USER, "x", "localhost:1")
+    assert [result["Status"] for result in results] == ["Open Link"]
+    assert unsubscribe.unsubscribe_summary(results) == "Unsubscribed from 0 senders, 1 need the link opened manually"
+
+def test_crlf_in_mailto_fails_only_that_row(stand_ins):
+    # 换行来自不可信的 List-Unsubscribe 头部, 不能让整个任务报错, 前后的发件人照常发送
+    _, smtp, context = stand_ins
+    smtp.messages.clear()
+    rows = [{"Email": f"{name}@example.com", "Unsubscribe": f"mailto:{mailto}", "One-Click": False, "Mailto": mailto}
+            for name, mailto in [("ok", "leave@example.com"), ("subject", "bad@x.com?subject=a%0Ab"),
+                                 ("address", "bad@x.com%0D%0ABcc:%20victim@example.com"), ("ok2", "leave2@example.com")]]
+    results = unsubscribe.unsubscribe_senders(rows, USER, "x", smtp.address, context=context)
+    got = {result["Email"]: result["Status"] for result in results}
+    assert got == {"ok@example.com": "Sent", "subject@example.com": "Failed",
+                   "address@example.com": "Failed", "ok2@example.com": "Sent"}
+    assert sorted(recipients for _, recipients, _ in smtp.messages) == [["leave2@example.com"], ["leave@example.com"]]
+
+def test_redirect_is_not_reported_as_unsubscribed(stand_ins):
+    # HTTPConnection 不跟随重定向, 3xx 说明 POST 没有到达真正的退订地址
+    servers, _, context = stand_ins
+    rows = [{"Email": f"{name}@example.com", "Unsubscribe": f"https://{servers[0].netloc}/{name}/1",
+             "One-Click": True, "Mailto": None} for name in ("u", "redirect")]
+    results = unsubscribe.unsubscribe_senders(rows, USER, "x", "localhost:1", context=context)
+    got = {result["Email"]: (result["Status"], result["Detail"]) for result in results}
+    assert got == {"u@example.com": ("Unsubscribed", "HTTP 200"),
+                   "redirect@example.com": ("Open Link", "HTTP 303 redirect")}
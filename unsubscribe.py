@@ -0,0 +1,306 @@
+import http.client
+import itertools
+import smtplib
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from mail_core import cancelled, get_smtp_server
+
+# ==========================================
+# 批量退订: RFC 8058 一键退订 (HTTPS POST) + mailto 退订邮件
+# ==========================================
+# 一键退订的 POST 走按主机复用的 keep-alive 连接池, 总并发和每个主机的并发都有上限, 避免被对方限流。
+# mailto 退订全部通过同一个 SMTP 会话发送, 只登录一次。
+# 只有普通链接 (没有 List-Unsubscribe-Post) 的发件人不能自动退订, 需要用户在浏览器中打开链接确认。
+
+UNSUBSCRIBE_WORKERS = 16
+PER_HOST_LIMIT = 2
+HTTP_TIMEOUT = 15
+SMTP_TIMEOUT = 30
+ONE_CLICK_BODY = b"List-Unsubscribe=One-Click"
+ONE_CLICK_HEADERS = {
+    "Content-Type": "application/x-www-form-urlencoded",
+    "User-Agent": "email-manager",
+}
+RESULT_COLUMNS = ["Email", "Method", "Status", "Detail", "Unsubscribe"]
+
+class HTTPPool:
+    # 按主机 (host:port) 复用 HTTPS 连接; 每个主机同时最多 per_host 个请求
+    def __init__(self, per_host=PER_HOST_LIMIT, timeout=HTTP_TIMEOUT, context=None):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.context = context or ssl.create_default_context()
+        self.lock = threading.Lock()
+        self.limits = {}
+        self.idle = {}
+        self.opened = {}
+
+    def slot(self, host):
+        with self.lock:
+            if host not in self.limits:
+                self.limits[host] = threading.BoundedSemaphore(self.per_host)
+                self.idle[host] = []
+                self.opened[host] = 0
+            return self.limits[host]
+
+    def checkout(self, host):
+        with self.lock:
+            if self.idle[host]:
+                return self.idle[host].pop(), True
+            self.opened[host] += 1
+        return http.client.HTTPSConnection(host, timeout=self.timeout, context=self.context), False
+
+    def checkin(self, host, conn):
+        with self.lock:
+            self.idle[host].append(conn)
+
+    def post(self, url, body, headers):
+        parts = urlsplit(url)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        with self.slot(parts.netloc):
+            for attempt in range(2):
+                conn, reused = self.checkout(parts.netloc)
+                try:
+                    conn.request("POST", path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    # 空闲的 keep-alive 连接可能已被服务器关掉, 换新连接重试一次 (退订请求是幂等的)
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                if response.will_close:
+                    conn.close()
+                else:
+                    self.checkin(parts.netloc, conn)
+                return response.status
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+                conns.clear()
+
+def row_mailto(row):
+    # 旧索引里的记录没有 Mailto 列 (表格里是空值), 从 Unsubscribe 列还原
+    if isinstance(row.get("Mailto"), str) and row["Mailto"]:
+        return row["Mailto"]
+    link = row.get("Unsubscribe") or ""
+    return link[len("mailto:"):] if link.startswith("mailto:") else None
+
+def unsubscribe_plan(rows):
+    # 每个发件人只用一种方式: 优先一键退订, 其次 mailto, 剩下的需要手动打开链接
+    one_click, mailto, manual = [], [], []
+    for row in rows:
+        if row.get("One-Click") == True:
+            one_click.append(row)
+        elif row_mailto(row):
+            mailto.append(row)
+        else:
+            manual.append(row)
+    return one_click, mailto, manual
+
+def interleave_by_host(rows):
+    # 轮流排列不同主机的请求, 工作线程不会全部堵在同一个主机的并发上限上
+    groups = {}
+    for row in rows:
+        groups.setdefault(urlsplit(row["Unsubscribe"]).netloc, []).append(row)
+    return [row for batch in itertools.zip_longest(*groups.values()) for row in batch if row is not None]
+
+def split_server(server):
+    # "主机:端口" -> (主机, 端口), 没有端口时默认 465 (SSL)
+    host, _, port = server.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return server, 465
+
+def open_smtp(user, password, server, timeout=SMTP_TIMEOUT):
+    host, port = split_server(server)
+    context = ssl.create_default_context()
+    if port == 465:
+        smtp = smtplib.SMTP_SSL(host, port, timeout=timeout, context=context)
+        smtp.ehlo()
+    else:
+        smtp = smtplib.SMTP(host, port, timeout=timeout)
+        smtp.ehlo()
+        if smtp.has_extn("starttls"):
+            smtp.starttls(context=context)
+            smtp.ehlo()
+        elif smtp.has_extn("auth"):
+            smtp.close()
+            raise smtplib.SMTPException("Server does not offer STARTTLS, refusing to send the password unencrypted")
+    if smtp.has_extn("auth"):
+        smtp.login(user, password)
+    return smtp
+
+def mailto_message(user, mailto):
+    # mailto:地址?subject=...&body=... (RFC 6068); 没有给出时用 "unsubscribe"
+    # 地址来自 List-Unsubscribe 头部, 不可信: 含换行 (%0A / %0D) 等无效内容时抛出 ValueError
+    address, _, query = mailto.partition("?")
+    address = unquote(address)
+    if "\r" in address or "\n" in address:
+        raise ValueError("address contains a line break")
+    params = parse_qs(query)
+    msg = EmailMessage()
+    msg["From"] = user
+    msg["To"] = address
+    msg["Subject"] = params.get("subject", ["unsubscribe"])[0]
+    msg.set_content(params.get("body", ["unsubscribe"])[0])
+    return msg
+
+def send_mailto(rows, user, password, server, report, cancel=None):
+    smtp = None
+    try:
+        for position, row in enumerate(rows):
+            if cancelled(cancel):
+                report(row, "Email", "Cancelled")
+                continue
+            try:
+                msg = mailto_message(user, row_mailto(row))
+            except ValueError as e:
+                # 只有这一行失败, 其他发件人照常发送
+                report(row, "Email", "Failed", f"Invalid mailto: {e}")
+                continue
+            for attempt in range(2):
+                try:
+                    if smtp is None:
+                        smtp = open_smtp(user, password, server)
+                    smtp.send_message(msg)
+                    report(row, "Email", "Sent", f"to {msg['To']}")
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    # 会话被服务器断开时重连一次
+                    smtp = None
+                    if attempt == 1:
+                        report(row, "Email", "Failed", str(e))
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError,
+                        smtplib.SMTPNotSupportedError, ValueError) as e:
+                    # 单封被拒, 或者地址不能编码 (例如服务器不支持 SMTPUTF8 时的非 ASCII 地址)
+                    report(row, "Email", "Failed", str(e))
+                    break
+                except (smtplib.SMTPException, OSError) as e:
+                    # 连接或登录失败, 后面的也发不出去
+                    smtp = None
+                    for rest in rows[position:]:
+                        report(rest, "Email", "Failed", f"SMTP: {e}")
+                    return
+    finally:
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+def post_one_click(pool, row, report, cancel=None):
+    if cancelled(cancel):
+        report(row, "One-Click", "Cancelled")
+        return
+    try:
+        status = pool.post(row["Unsubscribe"], ONE_CLICK_BODY, ONE_CLICK_HEADERS)
+    except (http.client.HTTPException, OSError) as e:
+        report(row, "One-Click", "Failed", str(e) or type(e).__name__)
+        return
+    if 200 <= status < 300:
+        report(row, "One-Click", "Unsubscribed", f"HTTP {status}")
+    elif 300 <= status < 400:
+        # 不跟随重定向: POST 没有到达真正的退订地址, 需要用户自己打开链接
+        report(row, "One-Click", "Open Link", f"HTTP {status} redirect")
+    else:
+        report(row, "One-Click", "Failed", f"HTTP {status}")
+
+def unsubscribe_senders(rows, user, password, smtp_server=None, workers=UNSUBSCRIBE_WORKERS,
+                        per_host=PER_HOST_LIMIT, on_progress=None, cancel=None, context=None, pool=None,
+                        executor=None):
+    # 返回每个发件人一条结果: Email / Method / Status / Detail / Unsubscribe
+    # pool / executor: 多个账户共用时由调用方创建和关闭, 并发上限对所有账户一起生效; 这时忽略 workers 和 per_host
+    results = []
+    lock = threading.Lock()
+
+    def report(row, method, status, detail=""):
+        result = {"Email": row["Email"], "Method": method, "Status": status,
+                  "Detail": detail, "Unsubscribe": row.get("Unsubscribe")}
+        with lock:
+            results.append(result)
+        if on_progress:
+            on_progress(result)
+
+    one_click, mailto, manual = unsubscribe_plan(rows)
+    for row in manual:
+        report(row, "Manual", "Open Link", "No one-click or mailto option")
+
+    def submit_all(executor, pool):
+        futures = []
+        # mailto 先提交: 单个 SMTP 会话顺序发送, 和 HTTP 请求同时进行
+        if mailto:
+            futures.append(executor.submit(send_mailto, mailto, user, password,
+                                           smtp_server or get_smtp_server(user), report, cancel))
+        for row in interleave_by_host(one_click):
+            futures.append(executor.submit(post_one_click, pool, row, report, cancel))
+        for future in futures:
+            future.result()
+
+    if pool is not None and executor is not None:
+        submit_all(executor, pool)
+        return results
+    pool = HTTPPool(per_host, context=context)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="unsubscribe") as executor:
+            submit_all(executor, pool)
+    finally:
+        pool.close()
+    return results
+
+def unsubscribe_accounts(rows, accounts, workers=UNSUBSCRIBE_WORKERS, per_host=PER_HOST_LIMIT, on_progress=None,
+                         cancel=None, context=None):
+    # rows 带 Account 列, 按账户分组后各账户同时退订: 一键退订用该账户收到的链接, mailto 从该账户的 SMTP 发出
+    # 所有账户共用一个 HTTPPool 和一个工作线程池: 同一个 ESP 的链接不管来自几个账户, 同时最多 per_host 个请求,
+    # 总共最多 workers 个线程; 每个账户仍然只有一个 SMTP 会话
+    # 每条结果多一个 Account 列
+    accounts = {account['u']: account for account in accounts}
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["Account"], []).append(row)
+    
+    pool = HTTPPool(per_host, context=context)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="unsubscribe") as executor:
+            def run(user):
+                account = accounts[user]
+                
+                def tag(result):
+                    result["Account"] = user
+                    if on_progress:
+                        on_progress(result)
+                
+                return unsubscribe_senders(groups[user], user, account['p'], account.get('smtp'), on_progress=tag,
+                                           cancel=cancel, pool=pool, executor=executor)
+            
+            # 这些线程只负责提交和等待, 实际的请求都在共用的 executor 里执行
+            with ThreadPoolExecutor(max_workers=max(1, len(groups)),
+                                    thread_name_prefix="unsubscribe-account") as accounts_executor:
+                return [result for results in accounts_executor.map(run, list(groups)) for result in results]
+    finally:
+        pool.close()
+
+def unsubscribe_summary(results):
+    counts = {}
+    for result in results:
+        counts[result["Status"]] = counts.get(result["Status"], 0) + 1
+    done = counts.get("Unsubscribed", 0) + counts.get("Sent", 0)
+    parts = [f"Unsubscribed from {done} senders"]
+    # 多账户时同一发件人在每个账户各算一次
+    accounts = {result["Account"] for result in results if "Account" in result}
+    if len(accounts) > 1:
+        parts[0] += f" in {len(accounts)} accounts"
+    if counts.get("Failed"):
+        parts.append(f"{counts['Failed']} failed")
+    if counts.get("Open Link"):
+        parts.append(f"{counts['Open Link']} need the link opened manually")
+    if counts.get("Cancelled"):
+        parts.append(f"{counts['Cancelled']} cancelled")
+    return ", ".join(parts)